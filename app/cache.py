@@ -0,0 +1,128 @@
+""" cache.py
+
+In-memory caches for results which only change when the data changes.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+# Caches given a name, by name, so that their sizes and hit ratios can be exported (see routes.py)
+CACHES = {}
+
+
+class LRUCache:
+    """ A thread-safe least recently used cache bounded by the total size of its values. Counts hits and misses so
+    that the effectiveness of the cache can be monitored.
+    """
+
+    def __init__(self, max_bytes, sizeof=sys.getsizeof, name=None):
+        """Initialises an empty cache.
+
+        :param max_bytes: integer
+            Maximum total size of the values in the cache. The least recently used values are dropped when it is
+            exceeded.
+        :param sizeof: callable returning the size of a value in bytes, default sys.getsizeof
+        :param name: string, default None
+            If given, the cache is registered in CACHES under this name
+        """
+
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if name is not None:
+            CACHES[name] = self
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def hit_ratio(self):
+        """The share of lookups which found a value, or None if there have not been any lookups.
+
+        :return: float
+        """
+
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else None
+
+    def get(self, key, default=None):
+        """Returns the value for a key and marks it as most recently used.
+
+        :param key: hashable key
+        :param default: value returned if the key is not in the cache
+        :return: the cached value or default
+        """
+
+        with self._lock:
+            try:
+                value, size = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        """Stores a value, dropping the least recently used values if the cache becomes too big. Values bigger than the
+        cache are not stored.
+
+        :param key: hashable key
+        :param value: value to be stored
+        """
+
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                self.bytes -= self._entries.popitem(last=False)[1][1]
+
+    def get_or_create(self, key, create):
+        """Returns the value for a key, creating and storing it first if it is not in the cache.
+
+        :param key: hashable key
+        :param create: callable without arguments returning the value
+        :return: the cached or newly created value
+        """
+
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.put(key, value)
+
+        return value
+
+    def evict(self, predicate):
+        """Drops all values whose keys match a condition.
+
+        :param predicate: callable taking a key and returning True if its value should be dropped
+        """
+
+        with self._lock:
+            for key in [k for k in self._entries if predicate(k)]:
+                self.bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """Drops all values. The hit and miss counters are kept."""
+
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
@@ -0,0 +1,75 @@
+""" compression.py
+
+Compresses responses with brotli (if the brotli package is installed) or gzip, as accepted by the client.
+
+Responses with an ETag are only compressed once: the compressed bytes are cached by endpoint, ETag and encoding, and
+as the ETags of the pages and the API depend on the versions of the data, they are compressed again only after the data
+has changed. Like nginx, the ETag of a compressed response is made weak, since the compressed bytes differ from the
+uncompressed ones.
+"""
+
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import request
+
+from app import cache
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', 1024))
+COMPRESSION_CACHE_BYTES = int(os.environ.get('COMPRESSION_CACHE_BYTES', 32 * 1024 * 1024))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/plain', 'text/css', 'application/json', 'application/javascript')
+
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+# Compressed response bodies keyed by (endpoint, ETag, encoding)
+COMPRESSED_CACHE = cache.LRUCache(COMPRESSION_CACHE_BYTES, sizeof=len, name='compressed')
+
+
+def compress(data, encoding):
+    """Compresses bytes.
+
+    :param data: bytes
+    :param encoding: 'br' or 'gzip'
+    :return: bytes
+    """
+
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compress_response(response):
+    """Compresses a response with the best encoding accepted by the client, if it is worth it.
+
+    :param response: flask.Response
+    :return: flask.Response
+    """
+
+    if response.mimetype not in COMPRESSIBLE_TYPES or response.direct_passthrough or response.is_streamed:
+        return response
+    response.vary.add('Accept-Encoding')
+
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if response.status_code != 200 or not encoding or 'Content-Encoding' in response.headers or \
+            response.content_length is not None and response.content_length < COMPRESSION_MIN_BYTES:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag:
+        key = (request.endpoint, etag, encoding)
+        response.set_data(COMPRESSED_CACHE.get_or_create(key, lambda: compress(response.get_data(), encoding)))
+        response.set_etag(etag, weak=True)
+    else:
+        response.set_data(compress(response.get_data(), encoding))
+    response.headers['Content-Encoding'] = encoding
+
+    return response
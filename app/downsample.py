@@ -0,0 +1,47 @@
+""" downsample.py
+
+Reduces long daily series to the number of points a chart can show, so that the full history can be graphed without
+sending thousands of points per line.
+"""
+
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """Selects the points of a series with the Largest-Triangle-Three-Buckets algorithm, which keeps the visual shape
+    of the line: the points are split into n_out - 2 buckets between the first and the last point, and from each bucket
+    the point forming the largest triangle with the point selected from the previous bucket and the average of the
+    next bucket is selected.
+
+    The averages of all buckets are computed at once, only the selection runs bucket by bucket as it depends on the
+    previous bucket.
+
+    :param x: numpy.ndarray of numbers (e.g. dates as integers), in increasing order
+    :param y: numpy.ndarray of numbers of the same length without NaN
+    :param n_out: maximum number of points to be selected
+    :return: numpy.ndarray of the positions of the selected points, in increasing order
+    """
+
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+
+    # Buckets between the first and the last point, each followed by the next bucket (or finally the last point)
+    bounds = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts = np.append(bounds[:-1], n - 1)
+    counts = np.diff(np.append(starts, n))
+    next_x = (np.add.reduceat(x, starts) / counts)[1:]
+    next_y = (np.add.reduceat(y, starts) / counts)[1:]
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[i] - y[a]))
+        a = selected[i + 1] = lo + np.argmax(area)
+
+    return selected
@@ -0,0 +1,167 @@
+""" export.py
+
+Renders the dashboard of the start page and of every location to static HTML, so that the pages can be served by a CDN
+or a web server without running the app (see export.py next to run.py for the command line).
+
+Each page is written with a content hash in its name next to gzip (and, if the brotli package is installed, brotli)
+compressed copies, e.g. 'country/Denmark.3f2a9c1b04de.html', '.html.gz' and '.html.br'. The stable names
+('index.html', 'country/Denmark.html' etc.) are symlinks to the current version, so that nginx can serve them with
+gzip_static and brotli_static. The manifest 'manifest.json' records the version of the data each page was rendered
+from, and pages whose data has not changed are not rendered again.
+"""
+
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from app import app
+from app import routes
+
+EXPORT_DIR = os.environ.get(
+    'EXPORT_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'export'))
+
+logger = logging.getLogger(__name__)
+
+
+def page_path(countries):
+    """Returns the path of the page for a country selection, relative to the export directory and without extension.
+
+    :param countries: tuple of country names
+    :return: string, 'index' for the start page, otherwise 'country/<name>'
+    """
+
+    if tuple(countries) == routes.DASHBOARD_COUNTRIES:
+        return 'index'
+
+    return 'country/' + countries[0]
+
+
+def render_page(countries):
+    """Renders the dashboard for a country selection as it is served by the app.
+
+    :param countries: tuple of country names
+    :return: string, the HTML page
+    """
+
+    data = routes.get_owid_data()
+    with app.app_context():
+        return routes._render_dashboard(*routes.dashboard_fragments(data, countries))
+
+
+def _write(path, content):
+    with open(path + '.tmp', 'wb') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+
+
+def _link(target, path):
+    os.symlink(target, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def export_page(countries, directory):
+    """Renders a page and writes it to the export directory with its compressed copies, then points the stable name to
+    it.
+
+    :param countries: tuple of country names
+    :param directory: export directory
+    :return: string, name of the written file relative to the export directory
+    """
+
+    html = render_page(countries).encode('utf_8')
+    path = page_path(countries)
+    name = f'{os.path.basename(path)}.{hashlib.sha1(html).hexdigest()[:12]}.html'
+    folder = os.path.join(directory, os.path.dirname(path))
+    os.makedirs(folder, exist_ok=True)
+
+    files = {name: html, name + '.gz': gzip.compress(html, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        files[name + '.br'] = brotli.compress(html)
+    for file_name, content in files.items():
+        _write(os.path.join(folder, file_name), content)
+    for file_name in files:
+        _link(file_name, os.path.join(folder, os.path.basename(path) + file_name[len(name) - len('.html'):]))
+
+    return os.path.join(os.path.dirname(path), name)
+
+
+def export_all(directory=None, countries=None, workers=None, force=False):
+    """Exports the start page and the page of each location on a process pool, skipping the pages whose data has not
+    changed since the last export. A page which fails to render is logged and left out, and the manifest records the
+    pages exported so far.
+
+    :param directory: export directory, default EXPORT_DIR
+    :param countries: names (case-insensitive) or ISO codes of the locations to be exported, default all locations in
+        the data. Unknown locations raise ValueError before anything is exported.
+    :param workers: number of processes, default the number of CPUs
+    :param force: boolean, default False
+        If True, all pages are rendered again, e.g. after the template has changed
+    :return: dictionary with the lists of 'exported', 'skipped' and 'failed' page paths (see page_path)
+    """
+
+    directory = directory or EXPORT_DIR
+    manifest_path = os.path.join(directory, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding='utf_8') as f:
+            manifest = json.load(f)
+
+    # Loaded before the pool is started, so that forked workers share the data instead of loading it again
+    data = routes.get_owid_data()
+    selections = [routes.DASHBOARD_COUNTRIES]
+    if countries:
+        names = {c: data.resolve(c) for c in countries}
+        unknown = [c for c, name in names.items() if name is None]
+        if unknown:
+            raise ValueError(f"Unknown locations: {', '.join(unknown)}")
+        countries = list(dict.fromkeys(names.values()))
+    selections += [(c,) for c in (countries or sorted(data.locations.values()))]
+
+    versions, pending = {}, []
+    for selection in selections:
+        path = page_path(selection)
+        versions[path] = '-'.join(data.location_versions[c.lower()] for c in selection)
+        entry = manifest.get(path)
+        if not force and entry and entry['version'] == versions[path] and \
+                os.path.exists(os.path.join(directory, entry['file'])):
+            continue
+        pending.append(selection)
+
+    os.makedirs(directory, exist_ok=True)
+    failed = []
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(export_page, selection, directory): page_path(selection)
+                       for selection in pending}
+            for future in concurrent.futures.as_completed(futures):
+                path = futures[future]
+                try:
+                    file = future.result()
+                except Exception:
+                    # e.g. a location without any counts or population, which Bokeh cannot serialise
+                    logger.exception("Export of %s failed", path)
+                    failed.append(path)
+                    continue
+                replaced = manifest.get(path, {}).get('file')
+                manifest[path] = {'file': file, 'version': versions[path]}
+                if replaced and replaced != file:
+                    for suffix in ('', '.gz', '.br'):
+                        if os.path.exists(os.path.join(directory, replaced + suffix)):
+                            os.remove(os.path.join(directory, replaced + suffix))
+                logger.info("Exported %s", path)
+    finally:
+        # Also if the export is interrupted, so that the files of the pages written so far are in the manifest
+        _write(manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode('utf_8'))
+
+    exported = [page_path(s) for s in pending if page_path(s) not in failed]
+
+    return {'exported': exported, 'skipped': [p for p in versions if p not in exported and p not in failed],
+            'failed': failed}
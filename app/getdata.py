@@ -3,21 +3,745 @@
 Includes functions to get data from external sources as input for graphs and analysis.
 """
 
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
 import pandas as pd
 
-OWID_DATA_URL = 'https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/owid-covid-data.csv'
+from app import locations
+from app import metrics
+from app import regions
+from app import timing
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OWID_DATA_URL = os.environ.get(
+    'OWID_DATA_URL', 'https://raw.githubusercontent.com/owid/covid-19-data/master/public/data/owid-covid-data.csv')
+OWID_SNAPSHOT_DIR = os.environ.get('OWID_SNAPSHOT_DIR', os.path.join(_ROOT_DIR, 'data'))
+OWID_SHARED_DIR = os.environ.get('OWID_SHARED_DIR')  # see shared.py
+OWID_CACHE_TTL = float(os.environ.get('OWID_CACHE_TTL', 60 * 60))  # seconds
+# Parse the whole CSV in chunks (see stream_owid_data). This only saves memory when the rows are filtered, so by default
+# it is only used with OWID_LOCATIONS.
+OWID_STREAMING = os.environ.get('OWID_STREAMING', '0') != '0'
+OWID_CHUNK_ROWS = int(os.environ.get('OWID_CHUNK_ROWS', 50000))
+# Comma separated locations to be loaded, default all
+OWID_LOCATIONS = [c.strip() for c in os.environ.get('OWID_LOCATIONS', '').split(',') if c.strip()] or None
+
+# Columns used by graph.Country, the ISO codes of the locations (see locations.LocationIndex) and their continents (see
+# regions.py), in the order of the published file
+OWID_COLUMNS = ['iso_code', 'continent', 'location', 'date', 'new_cases', 'new_deaths', 'total_vaccinations',
+                'people_vaccinated', 'people_fully_vaccinated', 'population']
+
+# Types of the columns in OWID_COLUMNS when the data is read in compact form. Dates are read as categories because
+# each date appears once per location, so only the unique values need to be parsed.
+OWID_COMPACT_DTYPES = {'iso_code': 'category', 'continent': 'category', 'location': 'category', 'date': 'category',
+                       'new_cases': 'float32', 'new_deaths': 'float32', 'total_vaccinations': 'float32',
+                       'people_vaccinated': 'float32', 'people_fully_vaccinated': 'float32', 'population': 'float32'}
+
+# Columns in OWID_COLUMNS holding counts, and those holding a label of the location
+OWID_NUMERIC_COLUMNS = [c for c in OWID_COLUMNS if OWID_COMPACT_DTYPES[c] == 'float32']
+OWID_LABEL_COLUMNS = [c for c in OWID_COLUMNS if c not in OWID_NUMERIC_COLUMNS and c not in ('location', 'date')]
 
+logger = logging.getLogger(__name__)
 
-def import_owid_data():
+
+def import_owid_data(source=None, columns=None, compact=False):
     """Reads coronavirus data for Our World In Data
 
     Loads the data and formats the dates
 
+    :param source: URL, file path or file object of the CSV file, default OWID_DATA_URL
+    :param columns: list of columns to be read, default all columns (or OWID_COLUMNS if compact)
+    :param compact: boolean, default False
+        If True, only reads the columns used by the graphs with the memory saving types in OWID_COMPACT_DTYPES
+        (location as a category and counts as float32)
     :return: pandas.DataFrame
         Containing the data from Our World In Data
     """
 
-    owid_data = pd.read_csv(OWID_DATA_URL, encoding='utf_8')
-    owid_data['date'] = pd.to_datetime(owid_data['date'], format='%Y-%m-%d')
+    with timing.stage('owid_parse'):
+        if compact:
+            columns = columns or OWID_COLUMNS
+            dtypes = {c: t for c, t in OWID_COMPACT_DTYPES.items() if c in columns}
+            owid_data = pd.read_csv(source or OWID_DATA_URL, encoding='utf_8', usecols=columns, dtype=dtypes)
+            dates = owid_data['date'].cat.categories
+            owid_data['date'] = owid_data['date'].cat.rename_categories(pd.to_datetime(dates, format='%Y-%m-%d')) \
+                .astype('datetime64[ns]')
+        else:
+            owid_data = pd.read_csv(source or OWID_DATA_URL, encoding='utf_8', usecols=columns)
+            owid_data['date'] = pd.to_datetime(owid_data['date'], format='%Y-%m-%d')
 
     return owid_data
+
+
+def iter_owid_locations(source=None, locations=None, chunksize=None):
+    """Reads coronavirus data for Our World In Data in chunks while it is being downloaded, yielding the data of each
+    location as soon as all its rows have been read.
+
+    Only the columns in OWID_COLUMNS and the rows of the wanted locations are kept from each chunk, so that neither the
+    raw CSV nor the full table are held in memory at once. The rows of a location are expected to be consecutive, as in
+    the published file; otherwise a location is yielded once for each run of its rows.
+
+    :param source: URL, file path or file object of the CSV file, default OWID_DATA_URL
+    :param locations: names of the locations to be kept (case-insensitive), default all locations
+    :param chunksize: number of rows parsed at a time, default OWID_CHUNK_ROWS
+    :return: iterator of (location, dictionary of numpy arrays) where the arrays hold the 'date' (datetime64[ns]), the
+        columns in OWID_NUMERIC_COLUMNS (float32) and those in OWID_LABEL_COLUMNS (object)
+    """
+
+    source = source or OWID_DATA_URL
+    if not hasattr(source, 'read'):
+        with _open_if_changed(source, {}) as (body, _):
+            yield from iter_owid_locations(body, locations, chunksize)
+        return
+
+    wanted = None if locations is None else {c.lower() for c in locations}
+    reader = pd.read_csv(source, encoding='utf_8', usecols=OWID_COLUMNS, dtype=OWID_COMPACT_DTYPES,
+                         chunksize=chunksize or OWID_CHUNK_ROWS)
+
+    current, parts = None, []
+    with reader:
+        for chunk in reader:
+            # Locations and dates are read as categories, so only their unique values in the chunk are compared and
+            # parsed
+            names = chunk['location'].cat.categories
+            codes = chunk['location'].cat.codes.to_numpy()
+            if wanted is not None:
+                keep = np.flatnonzero(names.str.lower().isin(wanted))
+                chunk = chunk[np.isin(codes, keep)]
+                codes = codes[np.isin(codes, keep)]
+            columns = {c: chunk[c].to_numpy() for c in OWID_NUMERIC_COLUMNS + OWID_LABEL_COLUMNS}
+            dates = pd.to_datetime(chunk['date'].cat.categories, format='%Y-%m-%d').to_numpy(dtype='datetime64[ns]')
+            columns['date'] = dates[chunk['date'].cat.codes.to_numpy()]
+
+            # Split the chunk into the runs of rows of each location
+            bounds = [0, *(np.flatnonzero(codes[1:] != codes[:-1]) + 1), len(codes)]
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                if start == stop:
+                    continue
+                if names[codes[start]] != current:
+                    if parts:
+                        yield current, _concatenate(parts)
+                    current, parts = names[codes[start]], []
+                parts.append({c: a[start:stop] for c, a in columns.items()})
+
+    if parts:
+        yield current, _concatenate(parts)
+
+
+def _concatenate(parts):
+    return {c: np.concatenate([p[c] for p in parts]) for c in parts[0]}
+
+
+def stream_owid_data(source=None, locations=None, chunksize=None):
+    """Reads coronavirus data for Our World In Data in chunks while it is being downloaded (see iter_owid_locations),
+    which overlaps the download with the parse. When only some locations are kept, the peak memory use stays close to
+    the size of the result; for the whole file import_owid_data(compact=True) is faster and uses less memory.
+
+    :param source: URL, file path or file object of the CSV file, default OWID_DATA_URL
+    :param locations: names of the locations to be kept (case-insensitive), default all locations
+    :param chunksize: number of rows parsed at a time, default OWID_CHUNK_ROWS
+    :return: pandas.DataFrame
+        Containing the columns in OWID_COLUMNS in the same form as import_owid_data(compact=True)
+    """
+
+    with timing.stage('owid_parse'):
+        parts = {}
+        for location, arrays in iter_owid_locations(source, locations, chunksize):
+            parts.setdefault(location, []).append(arrays)
+
+        names = sorted(parts)
+        lengths = [sum(len(a['date']) for a in parts[n]) for n in names]
+        # One column at a time, dropping the parts as they are copied, so that the data is not held twice
+        columns = {}
+        for c, t in [('date', 'datetime64[ns]'), *[(c, OWID_COMPACT_DTYPES[c]) for c in OWID_NUMERIC_COLUMNS]]:
+            columns[c] = np.concatenate([a.pop(c) for n in names for a in parts[n]]) if names else np.array([], t)
+        for c in OWID_LABEL_COLUMNS:
+            columns[c] = pd.Categorical(np.concatenate([a.pop(c) for n in names for a in parts[n]]) if names else [])
+        columns['location'] = pd.Categorical.from_codes(np.repeat(np.arange(len(names)), lengths), categories=names)
+
+        return pd.DataFrame(columns)[OWID_COLUMNS]
+
+
+def profile_import(source=None):
+    """Measures the parse time and memory use of import_owid_data with and without the compact mode, and of
+    stream_owid_data.
+
+    The source is read once before measuring so that all modes parse from the same local file contents. Each mode is
+    measured in a new process, whose peak resident set size includes the buffers of the CSV parser, which are not traced
+    by tracemalloc (Linux only).
+
+    :param source: URL or file path of the CSV file, default OWID_DATA_URL
+    :return: dictionary
+        For each mode ('full', 'compact', 'stream') a dictionary with 'seconds' (parse time), 'peak_bytes' (growth of
+        the peak resident set size of the process during the parse) and 'frame_bytes' (memory used by the resulting
+        DataFrame), plus the savings of the compact mode as 'seconds_saved', 'peak_bytes_saved' and 'frame_bytes_saved'.
+    """
+
+    with _open_if_changed(source or OWID_DATA_URL, {}) as (body, _):
+        raw = body.read()
+
+    # Resets the peak resident set size of the process to the current one after reading the file (Linux only)
+    script = ("import io, json, sys, time\n"
+              "from app import getdata\n"
+              "read = {'full': getdata.import_owid_data, 'stream': getdata.stream_owid_data,\n"
+              "        'compact': lambda f: getdata.import_owid_data(f, compact=True)}[sys.argv[1]]\n"
+              "with open(sys.argv[2], 'rb') as f:\n"
+              "    raw = f.read()\n"
+              "def status(field):\n"
+              "    with open('/proc/self/status') as f:\n"
+              "        return next(int(line.split()[1]) * 1024 for line in f if line.startswith(field))\n"
+              "with open('/proc/self/clear_refs', 'w') as f:\n"
+              "    f.write('5')\n"
+              "before = status('VmRSS:')\n"
+              "start = time.perf_counter()\n"
+              "owid_data = read(io.BytesIO(raw))\n"
+              "seconds = time.perf_counter() - start\n"
+              "print(json.dumps({'seconds': seconds, 'peak_bytes': status('VmHWM:') - before,\n"
+              "                  'frame_bytes': int(owid_data.memory_usage(deep=True).sum())}))\n")
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='covid-webapp-profile-') as directory:
+        path = os.path.join(directory, 'owid-covid-data.csv')
+        with open(path, 'wb') as f:
+            f.write(raw)
+        for mode in ['full', 'compact', 'stream']:
+            output = subprocess.run([sys.executable, '-c', script, mode, path], cwd=_ROOT_DIR, capture_output=True,
+                                    text=True, check=True).stdout
+            results[mode] = json.loads(output)
+
+    for key in ['seconds', 'peak_bytes', 'frame_bytes']:
+        results[key + '_saved'] = results['full'][key] - results['compact'][key]
+
+    return results
+
+
+def load_owid_snapshot(source=None, snapshot_dir=None):
+    """Loads the coronavirus data for Our World In Data from a local columnar (Feather) snapshot, downloading it again
+    only if the source has changed since the snapshot was taken.
+
+    For URLs the source is revalidated with the ETag and Last-Modified headers, for local files with the modification
+    time and size of the file. Only the columns in OWID_COLUMNS are kept in the snapshot, and if OWID_LOCATIONS is set
+    only the rows of those locations; a snapshot taken with other columns or locations is not used. If OWID_LOCATIONS
+    or OWID_STREAMING is set, the CSV is parsed while it is downloaded (see stream_owid_data).
+
+    :param source: URL or file path of the CSV file, default OWID_DATA_URL
+    :param snapshot_dir: directory in which the snapshot is stored, default OWID_SNAPSHOT_DIR
+    :return: pandas.DataFrame
+        Containing the data from Our World In Data
+    """
+
+    source = source or OWID_DATA_URL
+    snapshot_dir = snapshot_dir or OWID_SNAPSHOT_DIR
+    data_path = os.path.join(snapshot_dir, 'owid-covid-data.feather')
+    meta_path = os.path.join(snapshot_dir, 'owid-covid-data.json')
+
+    validators = {}
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        with open(meta_path, encoding='utf_8') as f:
+            meta = json.load(f)
+        # Snapshots taken with other columns (e.g. before the ISO codes were kept) are downloaded again
+        if meta.get('source') == source and meta.get('locations') == OWID_LOCATIONS and \
+                meta.get('columns') == OWID_COLUMNS:
+            validators = meta['validators']
+
+    with _open_if_changed(source, validators) as (body, new_validators):
+        if body is None:
+            logger.info("OWID data unchanged, using snapshot %s", data_path)
+            with timing.stage('snapshot_read'):
+                return pd.read_feather(data_path)
+
+        if OWID_STREAMING or OWID_LOCATIONS:
+            owid_data = stream_owid_data(body, OWID_LOCATIONS)
+        else:
+            owid_data = import_owid_data(body, compact=True)
+
+    # Write to temporary files first so that a failed write never leaves a half written snapshot behind
+    os.makedirs(snapshot_dir, exist_ok=True)
+    owid_data.to_feather(data_path + '.tmp')
+    os.replace(data_path + '.tmp', data_path)
+    with open(meta_path + '.tmp', 'w', encoding='utf_8') as f:
+        meta = {'source': source, 'locations': OWID_LOCATIONS, 'columns': OWID_COLUMNS, 'validators': new_validators}
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+
+    return owid_data
+
+
+@contextlib.contextmanager
+def _open_if_changed(source, validators):
+    """Opens a URL or file path unless it is unchanged according to the validators of a previous download.
+
+    :param source: URL or file path
+    :param validators: dictionary of validators returned for the previous download
+    :return: tuple of (file object, or None if the source is unchanged, validators of the current version)
+    """
+
+    scheme = urllib.parse.urlparse(source).scheme
+
+    if scheme in ('http', 'https'):
+        request = urllib.request.Request(source)
+        if 'etag' in validators:
+            request.add_header('If-None-Match', validators['etag'])
+        if 'last_modified' in validators:
+            request.add_header('If-Modified-Since', validators['last_modified'])
+        try:
+            with timing.stage('owid_fetch'):
+                response = urllib.request.urlopen(request)
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            yield None, validators
+            return
+
+        new_validators = {}
+        if response.headers.get('ETag'):
+            new_validators['etag'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            new_validators['last_modified'] = response.headers['Last-Modified']
+        with response:
+            yield response, new_validators
+        return
+
+    path = urllib.request.url2pathname(urllib.parse.urlparse(source).path) if scheme == 'file' else source
+    stat = os.stat(path)
+    new_validators = {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+    if new_validators == validators:
+        yield None, validators
+        return
+
+    with open(path, 'rb') as f:
+        yield f, new_validators
+
+
+class OwidDataset:
+    """ The coronavirus data sorted by location and date, together with an index of the rows belonging to each location
+    so that the data for a single location can be looked up without scanning the whole table.
+
+    The statistics shown in the graphs are computed for all locations when the dataset is created (see
+    metrics.compute_metrics). The versions are hashes of the contents (of the whole dataset and of each location), so
+    they are the same in every process which loaded the same data and can be used as part of cache keys.
+    """
+
+    def __init__(self, data, previous=None):
+        """Sorts the data, builds the location index and computes the statistics.
+
+        :param data: pandas.DataFrame containing the columns in OWID_COLUMNS
+        :param previous: OwidDataset, default None
+            Dataset for an earlier version of the data. If given, the rows which were added, revised or removed since
+            are stored in changes and the statistics are only computed again for the locations concerned.
+        """
+
+        data = data.rename_axis(None).sort_values(['location', 'date'], kind='mergesort', ignore_index=True)
+        data.index = pd.DatetimeIndex(data['date'])
+        self.data = data
+
+        # Rows of each location are contiguous after sorting, so the index only needs the boundaries of each block
+        codes, names = pd.factorize(data['location'], sort=False)
+        boundaries = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        self.starts = np.concatenate([[0], boundaries]).astype('int64')
+        self.stops = np.concatenate([boundaries, [len(data)]]).astype('int64')
+
+        self.locations = {}
+        self._positions = {}
+        for i, start in enumerate(self.starts):
+            name = names[codes[start]]
+            self.locations[name.lower()] = name
+            self._positions[name.lower()] = i
+
+        # Labels of each location, e.g. {'iso_code': {'Germany': 'DEU', ...}, 'continent': {'Germany': 'Europe', ...}}
+        self.labels = {}
+        for c in OWID_LABEL_COLUMNS:
+            if c in data:
+                values = data[c].to_numpy()
+                self.labels[c] = {names[codes[start]]: values[start] for start in self.starts
+                                  if isinstance(values[start], str)}
+        self.index = locations.LocationIndex(self.locations.values(), self.labels.get('iso_code'))
+
+        self._row_hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+        self.version = hashlib.sha1(self._row_hashes.tobytes()).hexdigest()[:16]
+        self.location_versions = {
+            location: hashlib.sha1(self._row_hashes[self.starts[i]:self.stops[i]].tobytes()).hexdigest()[:16]
+            for location, i in self._positions.items()}
+
+        if previous is None:
+            self.changes = None
+            self.metrics, self.latest = metrics.compute_metrics(data, self.starts, self.stops)
+        else:
+            self.changes = self._find_changes(previous)
+            self.metrics, self.latest = self._update_metrics(previous)
+        self.latest.index = pd.Index([names[codes[start]] for start in self.starts], name='location')
+
+    def _find_changes(self, previous):
+        """Compares the rows of each location with those of an earlier dataset. Locations with the same version are
+        skipped, and for the others the hashes of the rows are compared position by position, so that the first row
+        which was added, revised or removed is found without comparing the tables as a whole.
+
+        :param previous: OwidDataset
+        :return: dictionary with the (lower case) locations with rows which were added, revised or removed as keys and
+            the date of the earliest of these rows as values
+        """
+
+        dates = self.data['date'].to_numpy()
+        previous_dates = previous.data['date'].to_numpy()
+
+        changes = {}
+        for location, i in self._positions.items():
+            j = previous._positions.get(location)
+            if j is None:
+                changes[location] = pd.Timestamp(dates[self.starts[i]])
+                continue
+            if self.location_versions[location] == previous.location_versions[location]:
+                continue
+
+            rows = self._row_hashes[self.starts[i]:self.stops[i]]
+            previous_rows = previous._row_hashes[previous.starts[j]:previous.stops[j]]
+            n = min(len(rows), len(previous_rows))
+            differ = np.flatnonzero(rows[:n] != previous_rows[:n])
+            k = differ[0] if len(differ) else n
+            # The earliest of the rows at the first differing position, which may only exist in one of the versions
+            candidates = []
+            if k < len(rows):
+                candidates.append(dates[self.starts[i] + k])
+            if k < len(previous_rows):
+                candidates.append(previous_dates[previous.starts[j] + k])
+            changes[location] = pd.Timestamp(min(candidates))
+
+        for location, j in previous._positions.items():
+            if location not in self._positions:
+                changes[location] = pd.Timestamp(previous_dates[previous.starts[j]])
+
+        return changes
+
+    def _update_metrics(self, previous):
+        """Computes the statistics of the locations in changes from the rows which may have changed onwards, and copies
+        the statistics of the earlier rows and of the other locations from an earlier dataset.
+
+        The rows computed again start at the first changed row, or earlier where the vaccinations of earlier rows
+        depend on it: the rows after the last total vaccinations before it, which are interpolated from the next total,
+        and the last metrics.TRUNC_DAYS rows of either version, which may have been trimmed. They are computed from a
+        window starting metrics.CONTEXT_ROWS rows (or the last total vaccinations) before them.
+
+        :param previous: OwidDataset
+        :return: tuple of (series, latest) as returned by metrics.compute_metrics
+        """
+
+        series = np.empty((len(self.data), len(metrics.SERIES)))
+        kept = np.empty((len(self.starts), len(metrics.TRIMMED)))
+        previous_series = previous.metrics[metrics.SERIES].to_numpy()
+        previous_kept = previous.latest[[c + '_kept' for c in metrics.TRIMMED]].to_numpy()
+
+        dates = self.data['date'].to_numpy()
+        totals = self.data['total_vaccinations'].to_numpy()
+
+        windows = []
+        for location, i in self._positions.items():
+            start, stop = self.starts[i], self.stops[i]
+            j = previous._positions.get(location)
+            if location not in self.changes:
+                series[start:stop] = previous_series[previous.starts[j]:previous.stops[j]]
+                kept[i] = previous_kept[j]
+                continue
+
+            first = start
+            if j is not None:
+                first += np.searchsorted(dates[start:stop], np.datetime64(self.changes[location]))
+                valid = np.flatnonzero(~np.isnan(totals[start:first]))
+                if len(valid):
+                    first = min(first, start + valid[-1] + 1)
+                first = max(start, min(first, stop - metrics.TRUNC_DAYS,
+                                       start + previous.stops[j] - previous.starts[j] - metrics.TRUNC_DAYS))
+                series[start:first] = previous_series[previous.starts[j]:previous.starts[j] + first - start]
+
+            window = max(start, first - metrics.CONTEXT_ROWS)
+            valid = np.flatnonzero(~np.isnan(totals[start:window + 1]))
+            if len(valid):
+                window = start + valid[-1]
+            windows.append((i, first, window))
+
+        if windows:
+            positions, firsts, windows = (np.array(a, dtype='int64') for a in zip(*windows))
+            lengths = self.stops[positions] - windows
+            rows = np.concatenate([np.arange(w, self.stops[i]) for i, w in zip(positions, windows)])
+            stops = np.cumsum(lengths)
+            population = self.data['population'].to_numpy(dtype='float64')[self.starts[positions]]
+            window_series, window_kept = metrics.compute_series(self.data.iloc[rows], stops - lengths, stops,
+                                                                population=population)
+            computed = rows >= np.repeat(firsts, lengths)
+            series[rows[computed]] = window_series[metrics.SERIES].to_numpy()[computed]
+            for n, c in enumerate(metrics.TRIMMED):
+                kept[positions, n] = windows - self.starts[positions] + window_kept[c]
+
+        series = pd.DataFrame(series, index=self.data.index, columns=metrics.SERIES)
+        latest = metrics.compute_latest(self.data, series, dict(zip(metrics.TRIMMED, kept.T)), self.starts,
+                                        self.stops)
+
+        return series, latest
+
+    def __contains__(self, location):
+        return self.index.resolve(location) is not None
+
+    def __len__(self):
+        return len(self.data)
+
+    def memory_usage(self):
+        """The memory used by the data and the precomputed statistics.
+
+        :return: integer, number of bytes
+        """
+
+        return int(self.data.memory_usage(deep=True).sum() + self.metrics.memory_usage().sum()
+                   + self.latest.memory_usage().sum())
+
+    def resolve(self, location):
+        """Returns the name of a location as it appears in the data (see locations.LocationIndex.resolve).
+
+        :param location: name (case-insensitive) or ISO code of the location
+        :return: string, or None if there is no such location
+        """
+
+        return self.index.resolve(location)
+
+    def _position(self, location):
+        name = self.index.resolve(location)
+        if name is None:
+            raise KeyError(f"Unknown location: {location}")
+
+        return self._positions[name.lower()]
+
+    def _rows(self, location):
+        i = self._position(location)
+
+        return slice(int(self.starts[i]), int(self.stops[i]))
+
+    def location_data(self, location):
+        """Returns the rows for a location, sorted by date and indexed by date. The result is a slice of the dataset,
+        not a copy, so it must not be modified.
+
+        :param location: name (case-insensitive) or ISO code of the location
+        :return: pandas.DataFrame
+            Containing the data for the location
+        """
+
+        return self.data.iloc[self._rows(location)]
+
+    def location_metrics(self, location):
+        """Returns the precomputed statistics for a location (see metrics.compute_metrics). The series are a slice of
+        the dataset, not a copy, so they must not be modified.
+
+        :param location: name (case-insensitive) or ISO code of the location
+        :return: tuple of
+            - pandas.DataFrame containing the daily series in metrics.SERIES, indexed by date
+            - pandas.Series containing the most recent values in metrics.LATEST
+        """
+
+        rows = self._rows(location)
+
+        return self.metrics.iloc[rows], self.latest.iloc[self._position(location)]
+
+
+def load_owid_dataset(previous=None):
+    """Loads the coronavirus data for Our World In Data from the local snapshot (see load_owid_snapshot), adds the
+    regions (see regions.add_regions) and indexes it by location.
+
+    :param previous: OwidDataset, default None
+        Previously loaded dataset. If given, only the statistics of the locations which have changed are computed
+        again (including the regions with a changed country), and the previous dataset itself is returned if nothing
+        has changed.
+    :return: OwidDataset
+        Containing the data from Our World In Data
+    """
+
+    data = load_owid_snapshot()
+    with timing.stage('regions'):
+        data = regions.add_regions(data)
+    with timing.stage('dataset_build'):
+        dataset = OwidDataset(data, previous)
+    if previous is not None and dataset.version == previous.version:
+        return previous
+
+    return dataset
+
+
+class DataCache:
+    """ Keeps one loaded copy of a dataset per process and refreshes it in the background once it is older than the
+    time-to-live.
+
+    Only one load runs at a time: concurrent requests for an empty cache wait for the same load, and once the cache is
+    populated a stale snapshot keeps being served while a single background thread fetches the new one.
+    """
+
+    def __init__(self, loader, ttl=OWID_CACHE_TTL, incremental=False):
+        """Initialises an empty cache.
+
+        :param loader: callable returning the data to be cached
+        :param ttl: float, default OWID_CACHE_TTL
+            Number of seconds after which the data is refreshed. Refreshing is disabled when None.
+        :param incremental: boolean, default False
+            If True, the loader is called with the previously loaded data (None for the first load) so that it can
+            reuse what has not changed. Otherwise it is called without arguments.
+        """
+
+        self.loader = loader
+        self.ttl = ttl
+        self.incremental = incremental
+        self.version = 0
+        self.loaded_at = None
+
+        self._data = None
+        self._checked_at = None
+        self._refreshing = False
+        self._listeners = []
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+
+    @property
+    def data(self):
+        """The cached data as it is, without loading or refreshing it.
+
+        :return: the data returned by the loader, or None if nothing has been loaded yet
+        """
+
+        return self._data
+
+    @property
+    def is_stale(self):
+        """Whether the time-to-live has passed since the data was last loaded (or a load was last attempted).
+
+        :return: boolean
+        """
+
+        if self._checked_at is None:
+            return True
+        if self.ttl is None:
+            return False
+
+        return time.monotonic() - self._checked_at >= self.ttl
+
+    def get(self):
+        """Returns the cached data, loading it first if the cache is empty.
+
+        If the data is stale a background refresh is started and the current snapshot is returned straight away.
+
+        :return: the data returned by the loader
+        """
+
+        data = self._data
+        if data is None:
+            with self._load_lock:
+                if self._data is None:
+                    self._load()
+            return self._data
+
+        if self.is_stale:
+            self._start_refresh()
+
+        return data
+
+    def refresh(self):
+        """Reloads the data in the calling thread, waiting for any load which is already running.
+
+        :return: the data returned by the loader
+        """
+
+        with self._load_lock:
+            self._load()
+
+        return self._data
+
+    def add_listener(self, callback):
+        """Registers a function to be called with the new data after each load, e.g. to invalidate results derived
+        from the previous data.
+
+        :param callback: callable taking the new data as its only argument
+        """
+
+        self._listeners.append(callback)
+
+    def clear(self):
+        """Drops the cached data so that the next call to get() loads it again."""
+
+        with self._load_lock:
+            self._data = None
+            self._checked_at = None
+            self.loaded_at = None
+
+    def _start_refresh(self):
+        with self._state_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        thread = threading.Thread(target=self._background_refresh, name='data-cache-refresh', daemon=True)
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            with self._load_lock:
+                if self.is_stale:
+                    self._load()
+        except Exception:
+            # Keep serving the previous snapshot and try again after the next time-to-live has passed
+            logger.exception("Background refresh of cached data failed")
+        finally:
+            with self._state_lock:
+                self._refreshing = False
+
+    def _load(self):
+        self._checked_at = time.monotonic()
+        data = self.loader(self._data) if self.incremental else self.loader()
+        if data is self._data:
+            return
+
+        self._data = data
+        self.loaded_at = time.time()
+        self.version += 1
+
+        for callback in self._listeners:
+            callback(data)
+
+
+def load_dataset(previous=None):
+    """Loads the dataset used by the app. If OWID_SHARED_DIR is set, the dataset is memory-mapped from there and shared
+    with the other processes on the machine (see shared.load_shared_dataset), otherwise it is loaded into this process
+    (see load_owid_dataset).
+
+    :param previous: dataset returned by the previous call, default None
+    :return: OwidDataset
+        Containing the data from Our World In Data
+    """
+
+    if OWID_SHARED_DIR:
+        from app import shared  # shared builds on this module
+
+        return shared.load_shared_dataset(previous)
+
+    return load_owid_dataset(previous)
+
+
+OWID_CACHE = DataCache(load_dataset, incremental=True)
+
+
+def get_owid_data():
+    """Returns the data from Our World In Data, shared by all requests handled by this process.
+
+    The data is loaded from the local snapshot on first use and revalidated against the source in the background every
+    OWID_CACHE_TTL seconds.
+
+    :return: OwidDataset
+        Containing the data from Our World In Data
+    """
+
+    return OWID_CACHE.get()
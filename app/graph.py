@@ -4,52 +4,125 @@
 2. Functions for generating each of the graphs to be displayed
 """
 
+import concurrent.futures
+import functools
+import os
+import time
+
 from bokeh.models import HoverTool, ColumnDataSource, Range1d
 from bokeh.models.annotations import Span
-from bokeh.palettes import Category10, Category20
+from bokeh.palettes import Category10, Category20, Turbo256, linear_palette
 from bokeh.plotting import figure
-from numpy import isnan
+from numpy import flatnonzero, isnan
+
+from app import cache
+from app import downsample
+from app import getdata
+from app import metrics
+from app import timing
 
 CHART_WIDTH = 600
 CHART_HEIGHT = 300
 CHART_SIZING = 'scale_both'
+# Number of days shown in the line charts unless a date range is given, 0 for the full history
+CHART_DAYS = int(os.environ.get('CHART_DAYS', 60))
+SERIES_CACHE_BYTES = int(os.environ.get('SERIES_CACHE_BYTES', 32 * 1024 * 1024))
+
+# Series of Country shown in the line charts (see COUNTRY_SERIES)
+CHART_SERIES = ('cases_by_population', 'r_number', 'deaths_by_population', 'vaccinations_by_population')
+
+
+def memoized_property(method):
+    """Decorator working like property, except that the value is only computed on first access. It is then stored in
+    the _cache dictionary of the object until the object's invalidate() method is called.
+    """
+
+    name = method.__name__
+
+    @functools.wraps(method)
+    def getter(self):
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = self._cache[name] = method(self)
+            return value
+
+    return property(getter)
 
 
 class Country:
     """ A simple class which takes the coronavirus data and for a specified country generates statistics and series
     for graphing.
+
+    The statistics are computed when first used and then kept, so the returned series must not be modified. Slots are
+    used so that keeping many Country objects alive costs little more than the series they hold.
     """
 
+    __slots__ = ('name', 'version', 'date', 'cases', 'deaths', 'vaccinations', 'vaccinated', 'fully_vaccinated',
+                 'population', '_cache')
+
     def __init__(self, covid_data, country_name):
         """Initialises the Country object for the specified country. Generates:
+            - name: name of the country as given (string)
+            - version: version of the data of the country if taken from a getdata.OwidDataset, otherwise None
             - date: series of dates (pandas.Series)
             - cases: number of coronavirus cases each day (pandas.Series)
             - deaths: number of coronavirus related deaths each day (pandas.Series)
             - vaccinations: number of coronavirus vaccinations each day (pandas.Series)
             - population: population of the country (float)
 
-        :param covid_data: pandas.DataFrame containing the following daily series
+        :param covid_data: pandas.DataFrame (or getdata.OwidDataset) containing the following daily series
+            - 'location': name of the country
             - 'date': dates
             - 'new_cases': number of coronavirus cases each day
             - 'new_deaths': number of coronavirus related deaths each day
             - 'total_vaccinations': total vaccinations up to and included that day
+            - 'people_vaccinated': total number of people with at least one dose of the vaccine
+            - 'people_fully_vaccinated': total number of people who are fully vaccinated
             - 'population': population of the country
-        :param country_name:
+        :param country_name: name of the country (case-insensitive), or its ISO code if covid_data is a
+            getdata.OwidDataset. Raises KeyError if there is no such country.
         """
 
+        self.name = country_name
+        self.version = None
+        self._cache = {}
+
         # Prepare data
-        country_data = covid_data[covid_data['location'].str.lower() == country_name.lower()]
-        country_data.set_index('date', drop=False, inplace=True)
-
-        self.date = country_data['date'].sort_index()
-        self.cases = country_data['new_cases'].sort_index()
-        self.deaths = country_data['new_deaths'].sort_index()
-        total_vaccinations = country_data['total_vaccinations'].interpolate(method='linear').sort_index()
-        self.vaccinations = self.trunc_data(total_vaccinations.diff())
-        self.vaccinated = self.trunc_data(country_data['people_vaccinated'].sort_index())
-        self.fully_vaccinated = self.trunc_data(country_data['people_fully_vaccinated'].sort_index())
+        if isinstance(covid_data, getdata.OwidDataset):
+            # Already sorted, indexed by date and cleaned (see metrics.clean_data), so the series are only sliced
+            country_data = covid_data.location_data(country_name)
+            series, latest = covid_data.location_metrics(country_name)
+            self.version = covid_data.location_versions[covid_data.resolve(country_name).lower()]
+            self.vaccinations = series['vaccinations'][:int(latest['vaccinations_kept'])]
+            self.vaccinated = country_data['people_vaccinated'][:int(latest['people_vaccinated_kept'])]
+            self.fully_vaccinated = \
+                country_data['people_fully_vaccinated'][:int(latest['people_fully_vaccinated_kept'])]
+        else:
+            country_data = covid_data[covid_data['location'].str.lower() == country_name.lower()]
+            if country_data.empty:
+                raise KeyError(f"Unknown location: {country_name}")
+            country_data = country_data.set_index('date', drop=False).sort_index()
+            total_vaccinations = country_data['total_vaccinations'].interpolate(method='linear')
+            self.vaccinations = self.trunc_data(total_vaccinations.diff().rename('vaccinations'))
+            self.vaccinated = self.trunc_data(country_data['people_vaccinated'])
+            self.fully_vaccinated = self.trunc_data(country_data['people_fully_vaccinated'])
+
+        self.date = country_data['date']
+        self.cases = country_data['new_cases']
+        self.deaths = country_data['new_deaths']
         self.population = country_data['population'][0]
 
+        if isinstance(covid_data, getdata.OwidDataset):
+            # The statistics have already been computed for all locations, so they only need to be looked up
+            for name in ['cases_by_population', 'deaths_by_population', 'active_cases']:
+                self._cache[name] = series[name]
+            self._cache['vaccinations_by_population'] = series['vaccinations_by_population'][:len(self.vaccinations)]
+            self._cache[('r_number', metrics.R_NUMBER_LAG, metrics.R_NUMBER_DAYS)] = series['r_number']
+            for name in ['current_cases_by_population', 'total_vaccinations_by_population',
+                         'total_vaccinated_by_population', 'total_fully_vaccinated_by_population']:
+                self._cache[name] = latest[name]
+
     def r_number(self, lag=1, n_days=1):
         """Calculates a simple version of the R-number - the number of additional people infected by each infected
         individual.
@@ -65,12 +138,22 @@ class Country:
             Containing the resulting R-number
         """
 
-        x = self.cases.rolling(n_days).sum()
-        x_lag = x.shift(lag)
+        key = ('r_number', lag, n_days)
+        if key not in self._cache:
+            x = self.cases.rolling(n_days).sum()
+            x_lag = x.shift(lag)
+            self._cache[key] = x / x_lag
+
+        return self._cache[key]
+
+    def invalidate(self):
+        """Drops all computed statistics, so that they are computed again from the series of the object when next
+        used.
+        """
 
-        return x / x_lag
+        self._cache.clear()
 
-    @property
+    @memoized_property
     def active_cases(self, recovery_days=14):
         """Calculates the number of active cases at any given point in time.
 
@@ -85,7 +168,7 @@ class Country:
 
         return self.cases.rolling(recovery_days).sum()
 
-    @property
+    @memoized_property
     def cases_by_population(self):
         """The number of cases over the last 7 days per 100k people.
 
@@ -95,7 +178,7 @@ class Country:
 
         return self.cases.rolling(7).sum() / (self.population / 100000)
 
-    @property
+    @memoized_property
     def current_cases_by_population(self):
         """The current number of cases over the last 7 days per 100k people.
 
@@ -108,7 +191,7 @@ class Country:
 
         return cases_by_pop[-1]
 
-    @property
+    @memoized_property
     def deaths_by_population(self):
         """The number of cases over the last 7 days per 100k people.
 
@@ -118,7 +201,7 @@ class Country:
 
         return self.deaths.rolling(7).sum() / (self.population / 100000)
 
-    @property
+    @memoized_property
     def vaccinations_by_population(self):
         """The average number of vaccinations over the last 7 days per 100 people.
 
@@ -128,7 +211,7 @@ class Country:
 
         return self.vaccinations.rolling(7).mean() / (self.population / 100)
 
-    @property
+    @memoized_property
     def total_vaccinations_by_population(self):
         """The most recent total number of vaccinations per 100 people
 
@@ -138,7 +221,7 @@ class Country:
 
         return self.vaccinations.sum() / (self.population / 100)
 
-    @property
+    @memoized_property
     def total_vaccinated_by_population(self):
         """The total number of people who have had at least one dose of the vaccine as a percentage of the population.
 
@@ -151,7 +234,7 @@ class Country:
 
         return vacc[-1] / self.population * 100
 
-    @property
+    @memoized_property
     def total_fully_vaccinated_by_population(self):
         """The total number of people who are fully vaccinated as a percentage of the population.
 
@@ -177,118 +260,283 @@ class Country:
             Truncated series
         """
 
-        for i in range(7):
-            if x[-1] == 0 or isnan(x[-1]):
-                x = x[:-1]
+        tail = x.to_numpy()[-7:]
+        good = flatnonzero(~((tail == 0) | isnan(tail)))
+        n_removed = len(tail) - (good[-1] + 1 if len(good) else 0)
 
-        return x
+        return x[:len(x) - n_removed]
+
+
+def get_countries(data, countries, executor=None, timeout=None):
+    """Returns a Country object for each of the countries, constructing only those which are given by name.
+
+    :param data: pandas.Dataframe or getdata.OwidDataset containing data for the relevant countries
+    :param countries: list of country names (strings) and/or Country objects
+    :param executor: concurrent.futures.Executor, default None
+        If given, the countries are constructed in parallel on the executor, computing all statistics used by the
+        graphs
+    :param timeout: float, default None
+        Maximum number of seconds to wait for the executor. concurrent.futures.TimeoutError is raised if the countries
+        are not ready by then. Countries which have not started yet are cancelled, those being prepared finish in the
+        background.
+    :return: list of Country objects
+    """
+
+    with timing.stage('countries'):
+        if executor is None:
+            return [c if isinstance(c, Country) else Country(data, c) for c in countries]
+
+        futures = [executor.submit(_prepare_country, data, c) for c in countries]
+        done, not_done = concurrent.futures.wait(futures, timeout=timeout)
+
+    if not_done:
+        for f in not_done:
+            f.cancel()
+        raise concurrent.futures.TimeoutError(f"{len(not_done)} of {len(futures)} countries not ready after {timeout}s")
+
+    return [f.result() for f in futures]
+
+
+def _prepare_country(data, country):
+    my_country = country if isinstance(country, Country) else Country(data, country)
+
+    # Computes (or looks up) and keeps everything the graphs use
+    my_country.current_cases_by_population
+    my_country.total_vaccinated_by_population
+    my_country.total_fully_vaccinated_by_population
+    my_country.cases_by_population
+    my_country.r_number(metrics.R_NUMBER_LAG, metrics.R_NUMBER_DAYS)
+    my_country.deaths_by_population
+    my_country.vaccinations_by_population
+
+    return my_country
+
+
+def get_palettes(n):
+    """Returns two colour schemes for n countries: one for lines and bars, and a lighter one with matching colours
+    (used for the people vaccinated once).
+
+    Up to 10 countries Category10 and the matching light colours of Category20 are used, above that colours are taken
+    at equal intervals from Turbo256.
+
+    :param n: integer, number of countries
+    :return: tuple of two lists of n colours
+    """
+
+    if n <= 10:
+        colours = Category10[max(n, 3)][:n]  # Category10 does not work with an input of <3
+        colours2 = Category20[max(n * 2, 6)]
+        colours2 = [colours2[2 * i + 1] for i in range(n)]
+    else:
+        colours = list(linear_palette(Turbo256, n))
+        colours2 = [_lighten(c) for c in colours]
+
+    return colours, colours2
+
+
+def _lighten(colour, amount=0.5):
+    rgb = [int(colour[i:i + 2], 16) for i in (1, 3, 5)]
+    return '#' + ''.join(f'{round(c + (255 - c) * amount):02x}' for c in rgb)
+
+
+# Daily series of a Country by name, as served by the data API
+COUNTRY_SERIES = {
+    'cases': lambda c: c.cases,
+    'deaths': lambda c: c.deaths,
+    'vaccinations': lambda c: c.vaccinations,
+    'vaccinated': lambda c: c.vaccinated,
+    'fully_vaccinated': lambda c: c.fully_vaccinated,
+    'active_cases': lambda c: c.active_cases,
+    'cases_by_population': lambda c: c.cases_by_population,
+    'deaths_by_population': lambda c: c.deaths_by_population,
+    'vaccinations_by_population': lambda c: c.vaccinations_by_population,
+    'r_number': lambda c: c.r_number(metrics.R_NUMBER_LAG, metrics.R_NUMBER_DAYS),
+}
+
+
+# Series downsampled for the charts, keyed by (location, version, series, date range, resolution)
+SERIES_CACHE = cache.LRUCache(SERIES_CACHE_BYTES, sizeof=lambda s: int(s.memory_usage(index=True)), name='series')
+
+
+def chart_series(my_country, series, date_range=None, resolution=CHART_WIDTH):
+    """Returns a daily series of a country as it is drawn in a chart: limited to a date range and reduced to at most
+    one point per pixel (see downsample.lttb). Days without a value are left out if the series is reduced.
+
+    Series of countries taken from a getdata.OwidDataset are cached per version of their data.
+
+    :param my_country: Country object
+    :param series: name of the series in COUNTRY_SERIES
+    :param date_range: tuple of (first, last) date, either of which may be None, default None
+        If None, the last CHART_DAYS days are used
+    :param resolution: maximum number of points, default CHART_WIDTH
+    :return: pandas.Series
+    """
+
+    def compute():
+        s = COUNTRY_SERIES[series](my_country)
+        if date_range is None:
+            s = s[-CHART_DAYS:] if CHART_DAYS else s
+        else:
+            s = s[date_range[0]:date_range[1]]
+        if len(s) > resolution:
+            s = s[s.notna()]
+            s = s.iloc[downsample.lttb(s.index.asi8, s.to_numpy(), resolution)]
+        return s
+
+    if my_country.version is None:
+        return compute()
+
+    key = (my_country.name.lower(), my_country.version, series, date_range, resolution)
+
+    return SERIES_CACHE.get_or_create(key, compute)
 
 
 # BOKEH GRAPH FUNCTIONS --------------------------
 
-def graph_current_cases(data, countries, colours):
+def _lines(p, countries, series, colours, live, date_range):
+    """Draws a line per country. In live mode each line has its own empty data source, named '<series>/<country>' so
+    that the client can stream into it. Otherwise all lines are drawn by one multi_line glyph from a single data source,
+    with one legend item per country, so that the cost of building and serialising the chart grows with the number of
+    points rather than with the number of glyphs and legend items.
+    """
+
+    if live:
+        for my_country, colour in zip(countries, colours):
+            source = ColumnDataSource(data={'x': [], 'y': []}, name=f'{series}/{my_country.name}')
+            p.line('x', 'y', source=source, name=my_country.name, legend_label=my_country.name, line_width=2,
+                   line_color=colour)
+        return
+
+    xs, ys = [], []
+    for my_country in countries:
+        s = chart_series(my_country, series, date_range)
+        xs.append(s.index.asi8 // 10 ** 6)  # milliseconds since the epoch, as Bokeh uses for datetimes
+        ys.append(s.to_numpy(dtype='float64'))
+    source = ColumnDataSource(data={'xs': xs, 'ys': ys, 'country': [c.name for c in countries],
+                                    'colour': list(colours[:len(countries)])})
+    p.multi_line('xs', 'ys', source=source, line_color='colour', line_width=2, legend_field='country')
+
+
+def _line_hover(live, label, value):
+    # The country is the name of the line in live mode, and a column of the multi_line source otherwise (see _lines)
+    return HoverTool(tooltips=[('country', '$name' if live else '@country'), ('date', '$x{%F}'), (label, value)],
+                     formatters={'$x': 'datetime'})
+
+
+def graph_current_cases(data, countries, colours, live=False):
     """ Generates Bokeh horizontal bar charts showing current cases in the previous week per 100k people.
 
-    :param data: pandas.Dataframe containing data for the relevant countries
-    :param countries: countries to be graphed given as a list of strings
+    :param data: pandas.Dataframe or getdata.OwidDataset containing data for the relevant countries
+    :param countries: countries to be graphed given as a list of strings or Country objects
     :param colours: colour scheme from bokeh.palettes
+    :param live: boolean, default False
+        If True, the bars start at zero and their data source is named 'current_cases', so that the client can fill it
+        (see routes.api_delta)
     :return: horizontal bar chart
     """
 
     hover = HoverTool(tooltips=[('cases', '@current_cases{0.0}')])
-    p = figure(y_range=countries, width=CHART_WIDTH, height=CHART_HEIGHT, sizing_mode=CHART_SIZING,
+    countries = get_countries(data, countries)
+    names = [c.name for c in countries]
+    p = figure(y_range=names, width=CHART_WIDTH, height=CHART_HEIGHT, sizing_mode=CHART_SIZING,
                title="Current cases in previous week per 100k people", toolbar_location=None, tools=[hover])
 
     current_cases = []
 
-    for i, country in enumerate(countries):
-        my_country = Country(data, country)
-        current_cases.append(my_country.current_cases_by_population)
+    for i, my_country in enumerate(countries):
+        current_cases.append(0 if live else my_country.current_cases_by_population)
 
-    source = ColumnDataSource(data=dict(countries=countries, current_cases=current_cases, color=colours))
+    source = ColumnDataSource(data=dict(countries=names, current_cases=current_cases, color=colours),
+                              name='current_cases' if live else None)
     p.hbar(y='countries', right='current_cases', left=0, height=0.6, color='color', source=source)
 
     return p
 
 
-def graph_vaccinated(data, countries, colours1, colours2):
+def graph_vaccinated(data, countries, colours1, colours2, live=False):
     """ Generates Bokeh stacked horizontal bar charts showing the percentage of the population that has been vaccinated
      and the percentage of the population fully vaccinated.
 
-    :param data: pandas.Dataframe containing data for the relevant countries
-    :param countries: countries to be graphed given as a list of strings
+    :param data: pandas.Dataframe or getdata.OwidDataset containing data for the relevant countries
+    :param countries: countries to be graphed given as a list of strings or Country objects
     :param colours1: colour scheme from bokeh.palettes (used for fully vaccinated)
     :param colours2: second colour scheme from bokeh.palettes (used for vaccinated)
+    :param live: boolean, default False
+        If True, the bars start at zero and their data source is named 'vaccinated', so that the client can fill it
+        (see routes.api_delta)
     :return: horizontal bar chart
     """
     
     hover = HoverTool(tooltips=[('fully vaccinated', '@fully_vaccinated{0.0}'), ('vaccinated', '@vaccinated{0.0}')])
-    p = figure(y_range=countries, width=CHART_WIDTH, height=CHART_HEIGHT, sizing_mode=CHART_SIZING,
+    countries = get_countries(data, countries)
+    names = [c.name for c in countries]
+    p = figure(y_range=names, width=CHART_WIDTH, height=CHART_HEIGHT, sizing_mode=CHART_SIZING,
                title="Percentage of the population that has been vaccinated", toolbar_location=None, tools=[hover])
     p.x_range = Range1d(0, 100)
                 
     vaccinated = []
     fully_vaccinated = []
     
-    for i, country in enumerate(countries):
-        my_country = Country(data, country)
-        vaccinated.append(my_country.total_vaccinated_by_population)
-        fully_vaccinated.append(my_country.total_fully_vaccinated_by_population)
+    for i, my_country in enumerate(countries):
+        vaccinated.append(0 if live else my_country.total_vaccinated_by_population)
+        fully_vaccinated.append(0 if live else my_country.total_fully_vaccinated_by_population)
         
-    source = ColumnDataSource(data=dict(countries=countries, vaccinated=vaccinated, fully_vaccinated=fully_vaccinated,
-                                        color1=colours1, color2=colours2))
+    source = ColumnDataSource(data=dict(countries=names, vaccinated=vaccinated, fully_vaccinated=fully_vaccinated,
+                                        color1=colours1, color2=colours2), name='vaccinated' if live else None)
     p.hbar(y='countries', right='vaccinated', left=0, height=0.6, color='color2', source=source)
     p.hbar(y='countries', right='fully_vaccinated', left=0, height=0.6, color='color1', source=source)
     
     return p
 
 
-def graph_cases(data, countries, colours):
+def graph_cases(data, countries, colours, live=False, date_range=None):
     """ Generates Bokeh line charts showing cases in previous week per 100k people
 
-    :param data: pandas.Dataframe containing data for the relevant countries
-    :param countries: countries to be graphed given as a list of strings
+    :param data: pandas.Dataframe or getdata.OwidDataset containing data for the relevant countries
+    :param countries: countries to be graphed given as a list of strings or Country objects
     :param colours: colour scheme from bokeh.palettes
+    :param live: boolean, default False
+        If True, the lines are drawn from empty data sources named 'cases_by_population/<country>', so that the client
+        can fill them (see routes.api_delta)
+    :param date_range: tuple of (first, last) date, either of which may be None, default None
+        If None, the last CHART_DAYS days are shown
     :return: line chart
     """
     
-    hover = HoverTool(tooltips=[('country', '$name'), ('date', '$x{%F}'), ('cases', '$y{0,0}')],
-                      formatters={'$x': 'datetime'})
+    hover = _line_hover(live, 'cases', '$y{0,0}')
     p = figure(width=CHART_WIDTH, height=CHART_HEIGHT, sizing_mode=CHART_SIZING,
                title="Cases in previous week per 100k people", tools=[hover], x_axis_type="datetime",
                x_axis_label='date', y_axis_label='cases', toolbar_location=None)
     p.xaxis.formatter.days = '%d-%b'
     p.y_range.start = 0
     
-    for i, country in enumerate(countries):
-        my_country = Country(data, country)
-        s = my_country.cases_by_population[-60:]
-        p.line(s.index, s.values, name=country, legend_label=country, line_width=2, line_color=colours[i])
+    _lines(p, get_countries(data, countries), 'cases_by_population', colours, live, date_range)
 
     p.legend.location = 'top_left'
         
     return p
 
 
-def graph_r_number(data, countries, colours):
+def graph_r_number(data, countries, colours, live=False, date_range=None):
     """ Generates Bokeh line charts showing R-Number
 
-    :param data: pandas.Dataframe containing data for the relevant countries
-    :param countries: countries to be graphed given as a list of strings
+    :param data: pandas.Dataframe or getdata.OwidDataset containing data for the relevant countries
+    :param countries: countries to be graphed given as a list of strings or Country objects
     :param colours: colour scheme from bokeh.palettes
+    :param live: boolean, default False
+        If True, the lines are drawn from empty data sources named 'r_number/<country>', so that the client
+        can fill them (see routes.api_delta)
+    :param date_range: tuple of (first, last) date, either of which may be None, default None
+        If None, the last CHART_DAYS days are shown
     :return: line chart
     """
     
-    hover = HoverTool(tooltips=[('country', '$name'), ('date', '$x{%F}'), ('r-number', '$y')],
-                      formatters={'$x': 'datetime'})
+    hover = _line_hover(live, 'r-number', '$y')
     p = figure(width=CHART_WIDTH, height=CHART_HEIGHT, sizing_mode=CHART_SIZING, title="R-Number", tools=[hover],
                x_axis_type="datetime", x_axis_label='date', y_axis_label='r-number', toolbar_location=None)
     p.xaxis.formatter.days = '%d-%b'
 
-    for i, country in enumerate(countries):
-        my_country = Country(data, country)
-        s = my_country.r_number(4, 7)[-60:]
-        p.line(s.index, s.values, name=country, legend_label=country, line_width=2, line_color=colours[i])
+    _lines(p, get_countries(data, countries), 'r_number', colours, live, date_range)
     
     r_one = Span(location=1, dimension='width', line_color='maroon', line_width=2)
     p.add_layout(r_one)
@@ -297,65 +545,86 @@ def graph_r_number(data, countries, colours):
     return p
 
 
-def graph_deaths(data, countries, colours):
+def graph_deaths(data, countries, colours, live=False, date_range=None):
     """ Generates Bokeh line charts showing deaths in previous week per 100k people
 
-    :param data: pandas.Dataframe containing data for the relevant countries
-    :param countries: countries to be graphed given as a list of strings
+    :param data: pandas.Dataframe or getdata.OwidDataset containing data for the relevant countries
+    :param countries: countries to be graphed given as a list of strings or Country objects
     :param colours: colour scheme from bokeh.palettes
+    :param live: boolean, default False
+        If True, the lines are drawn from empty data sources named 'deaths_by_population/<country>', so that the client
+        can fill them (see routes.api_delta)
+    :param date_range: tuple of (first, last) date, either of which may be None, default None
+        If None, the last CHART_DAYS days are shown
     :return: line chart
     """
 
-    hover = HoverTool(tooltips=[('country', '$name'), ('date', '$x{%F}'), ('deaths', '$y{0.0}')],
-                      formatters={'$x': 'datetime'})
+    hover = _line_hover(live, 'deaths', '$y{0.0}')
     p = figure(width=CHART_WIDTH, height=CHART_HEIGHT, sizing_mode=CHART_SIZING,
                title="Deaths in previous week per 100k people", tools=[hover], x_axis_type="datetime",
                x_axis_label='date', y_axis_label='deaths', toolbar_location=None)
     p.xaxis.formatter.days = '%d-%b'
     p.y_range.start = 0
     
-    for i, country in enumerate(countries):
-        my_country = Country(data, country)
-        s = my_country.deaths_by_population[-60:]
-        p.line(s.index, s.values, name=country, legend_label=country, line_width=2, line_color=colours[i])
+    _lines(p, get_countries(data, countries), 'deaths_by_population', colours, live, date_range)
 
     p.legend.location = 'top_left'
 
     return p
 
 
-def graph_vaccinations(data, countries, colours):
+def graph_vaccinations(data, countries, colours, live=False, date_range=None):
     """ Generates Bokeh line charts showing average vaccinations in last 7 days per 100 people
 
-    :param data: pandas.Dataframe containing data for the relevant countries
-    :param countries: countries to be graphed given as a list of strings
+    :param data: pandas.Dataframe or getdata.OwidDataset containing data for the relevant countries
+    :param countries: countries to be graphed given as a list of strings or Country objects
     :param colours: colour scheme from bokeh.palettes
+    :param live: boolean, default False
+        If True, the lines are drawn from empty data sources named 'vaccinations_by_population/<country>', so that
+        the client can fill them (see routes.api_delta)
+    :param date_range: tuple of (first, last) date, either of which may be None, default None
+        If None, the last CHART_DAYS days are shown
     :return: line chart
     """
 
-    hover = HoverTool(tooltips=[('country', '$name'), ('date', '$x{%F}'), ('vaccinations', '$y{0.00}')],
-                      formatters={'$x': 'datetime'})
+    hover = _line_hover(live, 'vaccinations', '$y{0.00}')
     p = figure(width=CHART_WIDTH, height=CHART_HEIGHT, sizing_mode=CHART_SIZING,
                title="Average vaccinations in last 7 days per 100 people", tools=[hover], x_axis_type="datetime",
                x_axis_label='date', y_axis_label='vaccinations', toolbar_location=None)
     p.xaxis.formatter.days = '%d-%b'
     p.y_range.start = 0
 
-    for i, country in enumerate(countries):
-        my_country = Country(data, country)
-        s = my_country.vaccinations_by_population[-60:]
-        p.line(s.index, s.values, name=country, legend_label=country, line_width=2, line_color=colours[i])
+    _lines(p, get_countries(data, countries), 'vaccinations_by_population', colours, live, date_range)
 
     p.legend.location = 'top_left'
 
     return p
 
 
-def make_graphs(data, countries):
+def check_deadline(deadline, stage):
+    """Raises concurrent.futures.TimeoutError if the deadline has passed, so that a request stops before its next
+    stage rather than after all of them.
+
+    :param deadline: time.monotonic() value, or None for no deadline
+    :param stage: name of the stage about to start, for the error message
+    """
+
+    if deadline is not None and time.monotonic() > deadline:
+        raise concurrent.futures.TimeoutError(f"Deadline passed before {stage}")
+
+
+def make_graphs(data, countries, live=False, date_range=None, deadline=None):
     """Generates six graphs using the input coronavirus data as listed below.
 
-    :param data: pandas.Dataframe containing data for the relevant countries
-    :param countries: countries to be graphed given as a list of strings
+    :param data: pandas.Dataframe or getdata.OwidDataset containing data for the relevant countries (only used for
+        countries given by name)
+    :param countries: countries to be graphed given as a list of strings or Country objects
+    :param live: boolean, default False
+        If True, the charts are generated without data, which the client fills from routes.api_delta
+    :param date_range: tuple of (first, last) date of the line charts, either of which may be None, default None
+        If None, the last CHART_DAYS days are shown
+    :param deadline: time.monotonic() value, default None
+        If given, concurrent.futures.TimeoutError is raised when it has passed before a graph is started
     :return: six bokeh charts
         - current_cases: Current cases in previous week per 100k people
         - vaccinated: Percentage of the population vaccinated
@@ -365,19 +634,20 @@ def make_graphs(data, countries):
         - vaccinations: Average vaccinations in last 7 days per 100 people
     """
 
-    colours = Category10[max(len(countries), 3)]  # Category10 does not work with an input of <3
-    if len(countries) > len(colours):
-        raise ValueError(f"The maximum number of countries which can be plotted is {len(colours)}")
-        
-    colours2 = Category20[max(len(countries) * 2, 6)]  # Category20 does not work with an input of <3
-    colours2 = [colours2[2 * i + 1] for i in range(len(countries))]
+    colours, colours2 = get_palettes(len(countries))
 
-    current_cases = graph_current_cases(data, countries, colours)
-    vaccinated = graph_vaccinated(data, countries, colours, colours2)
+    # Prepare the data for each country once and share it between all graphs
+    countries = get_countries(data, countries)
 
-    cases = graph_cases(data, countries, colours)
-    r_number = graph_r_number(data, countries, colours)
-    deaths = graph_deaths(data, countries, colours)
-    vaccinations = graph_vaccinations(data, countries, colours)
+    graphs = []
+    for name, func, args in [('graph_current_cases', graph_current_cases, (colours, live)),
+                             ('graph_vaccinated', graph_vaccinated, (colours, colours2, live)),
+                             ('graph_cases', graph_cases, (colours, live, date_range)),
+                             ('graph_r_number', graph_r_number, (colours, live, date_range)),
+                             ('graph_deaths', graph_deaths, (colours, live, date_range)),
+                             ('graph_vaccinations', graph_vaccinations, (colours, live, date_range))]:
+        check_deadline(deadline, name)
+        with timing.stage(name):
+            graphs.append(func(data, countries, *args))
 
-    return current_cases, vaccinated, cases, r_number, deaths, vaccinations
+    return tuple(graphs)
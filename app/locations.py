@@ -0,0 +1,109 @@
+""" locations.py
+
+Index of the location names in the data, built once when the data is loaded, for resolving the names given in URLs and
+for the autocompletion of names.
+"""
+
+import bisect
+import difflib
+import hashlib
+import re
+import unicodedata
+
+
+def normalize(name):
+    """Reduces a name to lower case letters and digits without accents, so that e.g. "Cote d'Ivoire", "côte-d'ivoire"
+    and "CÔTE D IVOIRE" are the same.
+
+    :param name: string
+    :return: string
+    """
+
+    ascii_name = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+
+    return re.sub(r'[^a-z0-9]', '', ascii_name.lower())
+
+
+class LocationIndex:
+    """ Resolves location names exactly, case-insensitively, by ISO code (e.g. 'DEU' for Germany) or ignoring accents,
+    spaces and punctuation, and searches them by prefix with a fallback to close matches for misspelt names.
+    """
+
+    def __init__(self, names, iso_codes=None):
+        """Builds the index.
+
+        :param names: location names as they appear in the data
+        :param iso_codes: dictionary of location name to ISO code, default None
+        """
+
+        iso_codes = iso_codes or {}
+        self.names = sorted(names)
+        self.iso_codes = {name: iso_codes[name] for name in self.names if isinstance(iso_codes.get(name), str)}
+        self.version = hashlib.sha1(repr(sorted(self.iso_codes.items()) + self.names).encode()).hexdigest()[:16]
+
+        self._exact = {name: name for name in self.names}
+        self._lower = {name.lower(): name for name in self.names}
+        self._iso = {code.upper(): name for name, code in self.iso_codes.items()}
+        self._normalized = {}
+        for name in self.names:
+            self._normalized.setdefault(normalize(name), name)
+        self._keys = sorted(self._normalized)
+
+        # The normalized words of each name, e.g. 'kingdom' for 'United Kingdom', for searching within names
+        self._words = sorted({(normalize(word), name) for name in self.names
+                              for word in re.split(r'[\s\-\(\),]+', name)[1:] if normalize(word)})
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, query):
+        return self.resolve(query) is not None
+
+    def resolve(self, query):
+        """Returns the name of the location given by a name or ISO code.
+
+        :param query: string
+        :return: name of the location as it appears in the data, or None if there is no such location
+        """
+
+        return self._exact.get(query) or self._lower.get(query.lower()) or self._iso.get(query.upper()) or \
+            self._normalized.get(normalize(query))
+
+    def search(self, query, limit=10):
+        """Searches locations for autocompletion. The location with the query as ISO code comes first, followed by the
+        locations whose name starts with the query, those with another word starting with the query and finally those
+        with a similar name.
+
+        :param query: string
+        :param limit: maximum number of results, default 10
+        :return: list of location names
+        """
+
+        key = normalize(query)
+        if not key:
+            return []
+
+        results = []
+
+        def add(name):
+            if name not in results:
+                results.append(name)
+
+        if query.upper() in self._iso:
+            add(self._iso[query.upper()])
+
+        i = bisect.bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i].startswith(key) and len(results) < limit:
+            add(self._normalized[self._keys[i]])
+            i += 1
+
+        i = bisect.bisect_left(self._words, (key, ''))
+        while i < len(self._words) and self._words[i][0].startswith(key) and len(results) < limit:
+            add(self._words[i][1])
+            i += 1
+
+        if len(results) < limit:
+            for match in difflib.get_close_matches(key, self._keys, n=limit, cutoff=0.75):
+                add(self._normalized[match])
+
+        return results[:limit]
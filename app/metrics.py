@@ -0,0 +1,246 @@
+""" metrics.py
+
+Cleans the counts and computes the statistics of graph.Country for every location at once, in a single vectorised pass
+over the data sorted by location and date (see getdata.OwidDataset).
+"""
+
+import numpy as np
+import pandas as pd
+
+R_NUMBER_LAG = 4  # r_number as shown in the graphs
+R_NUMBER_DAYS = 7
+RECOVERY_DAYS = 14  # default of Country.active_cases
+TRUNC_DAYS = 7  # number of values looked at by Country.trunc_data
+
+# Number of rows before a row on which its statistics depend (see compute_series)
+CONTEXT_ROWS = max(RECOVERY_DAYS, R_NUMBER_DAYS, 7) + R_NUMBER_LAG
+
+# Series of which Country.trunc_data removes the zeros and NaNs at the end (see clean_data)
+TRIMMED = ['vaccinations', 'people_vaccinated', 'people_fully_vaccinated']
+
+# Daily series computed for every row of the data: the cleaned daily vaccinations, and the statistics
+SERIES = ['vaccinations', 'cases_by_population', 'deaths_by_population', 'active_cases', 'r_number',
+          'vaccinations_by_population']
+
+# Values computed for every location: the statistics, and the number of values of each series in TRIMMED which are
+# kept when the zeros and NaNs at the end are removed
+LATEST = ['current_cases_by_population', 'current_deaths_by_population', 'current_active_cases',
+          'current_r_number', 'current_vaccinations_by_population', 'total_vaccinations_by_population',
+          'total_vaccinated_by_population', 'total_fully_vaccinated_by_population', *[c + '_kept' for c in TRIMMED]]
+
+
+def clean_data(data, starts, stops):
+    """Cleans the counts as graph.Country does for a single location: the daily vaccinations are the differences of the
+    linearly interpolated total vaccinations, and the zeros and NaNs among the last TRUNC_DAYS values of the series in
+    TRIMMED are removed.
+
+    :param data: pandas.DataFrame sorted by location and date, containing the columns used by graph.Country
+    :param starts: numpy array with the first row of each location
+    :param stops: numpy array with the row following the last row of each location
+    :return: tuple of
+        - series: dictionary of numpy arrays with a value for every row of data, for the series in TRIMMED
+        - kept: dictionary of numpy arrays with the number of values kept of each location, for the series in TRIMMED
+    """
+
+    total_vaccinations = data['total_vaccinations'].to_numpy(dtype='float64')
+    series = {'vaccinations': _diff(interpolate(total_vaccinations, starts, stops), starts),
+              'people_vaccinated': data['people_vaccinated'].to_numpy(dtype='float64'),
+              'people_fully_vaccinated': data['people_fully_vaccinated'].to_numpy(dtype='float64')}
+
+    # The removed values are at the end of each location, so counting them gives the number of values kept
+    kept = {c: (stops - starts) - np.add.reduceat(trailing_trim(values, starts, stops), starts)
+            for c, values in series.items()}
+
+    return series, kept
+
+
+def compute_metrics(data, starts, stops):
+    """Computes the statistics of graph.Country for all locations.
+
+    :param data: pandas.DataFrame sorted by location and date, containing the columns used by graph.Country
+    :param starts: numpy array with the first row of each location
+    :param stops: numpy array with the row following the last row of each location
+    :return: tuple of
+        - series: pandas.DataFrame with the same index as data, containing the columns in SERIES
+        - latest: pandas.DataFrame with one row per location (in the order of starts), containing the columns in
+          LATEST. The values are the most recent ones which are not NaN.
+    """
+
+    series, kept = compute_series(data, starts, stops)
+
+    return series, compute_latest(data, series, kept, starts, stops)
+
+
+def compute_series(data, starts, stops, population=None):
+    """Computes the daily series of graph.Country for all locations. The value of a row only depends on the
+    CONTEXT_ROWS rows before it and, for the vaccinations, on the total vaccinations before and after it, so the series
+    of the later rows of a location can be computed from its rows starting CONTEXT_ROWS rows earlier (see
+    getdata.OwidDataset._update_metrics).
+
+    :param data: pandas.DataFrame sorted by location and date, containing the columns used by graph.Country
+    :param starts: numpy array with the first row of each location
+    :param stops: numpy array with the row following the last row of each location
+    :param population: numpy array with the population of each location, default the population in its first row
+    :return: tuple of
+        - series: pandas.DataFrame with the same index as data, containing the columns in SERIES
+        - kept: dictionary of numpy arrays with the number of values kept of each location, for the series in TRIMMED
+          (see clean_data)
+    """
+
+    lengths = stops - starts
+    groups = np.repeat(np.arange(len(starts)), lengths)
+    if population is None:
+        population = data['population'].to_numpy(dtype='float64')[starts]
+    population = np.repeat(np.asarray(population, dtype='float64'), lengths)
+
+    cases = data['new_cases'].to_numpy()
+    deaths = data['new_deaths'].to_numpy()
+
+    cases_7 = _rolling_sum(cases, groups, 7)
+    cases_r = cases_7 if R_NUMBER_DAYS == 7 else _rolling_sum(cases, groups, R_NUMBER_DAYS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_number = cases_r / _shift(cases_r, starts, stops, R_NUMBER_LAG)
+
+    cleaned, kept = clean_data(data, starts, stops)
+    trimmed = _trimmed(kept['vaccinations'], starts, stops)
+
+    vaccinations = cleaned['vaccinations']
+    vaccinations_by_population = _rolling_mean(vaccinations, groups, 7) / (population / 100)
+    vaccinations_by_population[trimmed] = np.nan
+
+    series = pd.DataFrame({
+        'vaccinations': vaccinations,
+        'cases_by_population': cases_7 / (population / 100000),
+        'deaths_by_population': _rolling_sum(deaths, groups, 7) / (population / 100000),
+        'active_cases': _rolling_sum(cases, groups, RECOVERY_DAYS),
+        'r_number': r_number,
+        'vaccinations_by_population': vaccinations_by_population,
+    }, index=data.index)
+
+    return series, kept
+
+
+def compute_latest(data, series, kept, starts, stops):
+    """Computes the most recent values of the statistics of graph.Country for all locations from their daily series.
+
+    :param data: pandas.DataFrame sorted by location and date, containing the columns used by graph.Country
+    :param series: pandas.DataFrame with the same index as data, containing the columns in SERIES
+    :param kept: dictionary of numpy arrays with the number of values kept of each location, for the series in TRIMMED
+    :param starts: numpy array with the first row of each location
+    :param stops: numpy array with the row following the last row of each location
+    :return: pandas.DataFrame with one row per location (in the order of starts), containing the columns in LATEST. The
+        values are the most recent ones which are not NaN.
+    """
+
+    population = data['population'].to_numpy(dtype='float64')[starts]
+    vaccinated = data['people_vaccinated'].to_numpy(dtype='float64')
+    vaccinated = np.where(_trimmed(kept['people_vaccinated'], starts, stops), np.nan, vaccinated)
+    fully_vaccinated = data['people_fully_vaccinated'].to_numpy(dtype='float64')
+    fully_vaccinated = np.where(_trimmed(kept['people_fully_vaccinated'], starts, stops), np.nan, fully_vaccinated)
+    vaccinations = series['vaccinations'].to_numpy(dtype='float64')
+
+    return pd.DataFrame({
+        'current_cases_by_population': last_valid(series['cases_by_population'].to_numpy(), starts, stops),
+        'current_deaths_by_population': last_valid(series['deaths_by_population'].to_numpy(), starts, stops),
+        'current_active_cases': last_valid(series['active_cases'].to_numpy(), starts, stops),
+        'current_r_number': last_valid(series['r_number'].to_numpy(), starts, stops),
+        'current_vaccinations_by_population':
+            last_valid(series['vaccinations_by_population'].to_numpy(), starts, stops),
+        'total_vaccinations_by_population': np.add.reduceat(np.nan_to_num(vaccinations), starts) / (population / 100),
+        'total_vaccinated_by_population': last_valid(vaccinated, starts, stops) / population * 100,
+        'total_fully_vaccinated_by_population': last_valid(fully_vaccinated, starts, stops) / population * 100,
+        **{c + '_kept': np.asarray(kept[c], dtype='float64') for c in TRIMMED},
+    })
+
+
+def interpolate(values, starts, stops):
+    """Interpolates missing values linearly within each location, as pandas.Series.interpolate(method='linear') does
+    for a single location: missing values before the first value are kept, missing values after the last value are
+    filled with the last value.
+
+    :param values: numpy array
+    :param starts: numpy array with the first row of each location
+    :param stops: numpy array with the row following the last row of each location
+    :return: numpy array
+    """
+
+    lengths = stops - starts
+    rows = np.arange(len(values))
+    valid = ~np.isnan(values)
+    first = np.repeat(np.minimum.reduceat(np.where(valid, rows, len(values)), starts), lengths)
+    last = np.repeat(np.maximum.reduceat(np.where(valid, rows, -1), starts), lengths)
+
+    # Values between the first and the last value of a location only depend on values of the same location
+    result = pd.Series(values).interpolate(method='linear', limit_area='inside').to_numpy()
+    after = (rows > last) & (last >= 0)
+    result[after] = values[last[after]]
+    result[rows < first] = np.nan
+
+    return result
+
+
+def trailing_trim(values, starts, stops, n_days=TRUNC_DAYS):
+    """Finds the values which Country.trunc_data removes: zeros and NaNs at the end of each location, looking only at
+    the last n_days values.
+
+    :param values: numpy array
+    :param starts: numpy array with the first row of each location
+    :param stops: numpy array with the row following the last row of each location
+    :param n_days: integer, default TRUNC_DAYS
+    :return: numpy array of booleans, True for the values to be removed
+    """
+
+    lengths = stops - starts
+    rows = np.arange(len(values))
+    good = ~((values == 0) | np.isnan(values))
+    last_good = np.repeat(np.maximum.reduceat(np.where(good, rows, -1), starts), lengths)
+
+    return (rows > last_good) & (rows >= np.repeat(stops, lengths) - n_days)
+
+
+def last_valid(values, starts, stops):
+    """Returns the last value which is not NaN of each location.
+
+    :param values: numpy array
+    :param starts: numpy array with the first row of each location
+    :param stops: numpy array with the row following the last row of each location
+    :return: numpy array with one value per location, NaN if a location has no values
+    """
+
+    rows = np.arange(len(values))
+    last = np.maximum.reduceat(np.where(np.isnan(values), -1, rows), starts)
+
+    return np.where(last >= 0, values[np.maximum(last, 0)], np.nan)
+
+
+def _rolling_sum(values, groups, window):
+    return pd.Series(values).groupby(groups, sort=False).rolling(window).sum().to_numpy()
+
+
+def _rolling_mean(values, groups, window):
+    return pd.Series(values).groupby(groups, sort=False).rolling(window).mean().to_numpy()
+
+
+def _shift(values, starts, stops, periods):
+    lengths = stops - starts
+    result = np.empty(len(values), dtype='float64')
+    result[periods:] = values[:-periods]
+    result[:periods] = np.nan
+    result[np.arange(len(values)) - np.repeat(starts, lengths) < periods] = np.nan
+
+    return result
+
+
+def _trimmed(kept, starts, stops):
+    lengths = stops - starts
+    offsets = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+
+    return offsets >= np.repeat(kept, lengths)
+
+
+def _diff(values, starts):
+    result = np.empty_like(values)
+    result[1:] = values[1:] - values[:-1]
+    result[starts] = np.nan
+
+    return result
@@ -0,0 +1,125 @@
+""" regions.py
+
+Adds regions to the data, i.e. the continents and groups of countries such as the European Union, so that they can be
+looked up, graphed and compared like countries.
+
+The daily counts of a region are the sums of those of its countries and its population is their total population, so
+the statistics computed from them (e.g. the cases per 100,000 people or the share of people vaccinated) are weighted by
+the population of the countries. The sums are computed for all regions at once in a single groupby over the rows of the
+countries.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+REGIONS_FILE = os.environ.get('REGIONS_FILE')  # JSON file of {"<region>": ["<country>", ...], ...}, e.g. income groups
+REGION_CONTINENTS = os.environ.get('REGION_CONTINENTS', '1') != '0'  # add a region for each continent in the data
+
+EU_COUNTRIES = ['Austria', 'Belgium', 'Bulgaria', 'Croatia', 'Cyprus', 'Czechia', 'Denmark', 'Estonia', 'Finland',
+                'France', 'Germany', 'Greece', 'Hungary', 'Ireland', 'Italy', 'Latvia', 'Lithuania', 'Luxembourg',
+                'Malta', 'Netherlands', 'Poland', 'Portugal', 'Romania', 'Slovakia', 'Slovenia', 'Spain', 'Sweden']
+
+# Groups of countries added as regions, extended (or overridden) by the groups in REGIONS_FILE
+REGIONS = {'European Union': EU_COUNTRIES}
+if REGIONS_FILE:
+    with open(REGIONS_FILE, encoding='utf_8') as _f:
+        REGIONS.update(json.load(_f))
+
+# Counts summed for the regions. The totals up to a day are carried forward over the days on which a country does not
+# report them, so that the totals of a region do not drop on those days.
+SUM_COLUMNS = ['new_cases', 'new_deaths', 'total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated']
+CUMULATIVE_COLUMNS = ['total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated']
+
+
+def region_members(data, groups=None, continents=REGION_CONTINENTS):
+    """Returns the countries of each region which are in the data.
+
+    :param data: pandas.DataFrame containing the columns 'location' and, for the continents, 'continent'
+    :param groups: dictionary of region name to list of country names, default REGIONS
+    :param continents: boolean, default REGION_CONTINENTS
+        If True, the continents given in the column 'continent' are added as regions
+    :return: dictionary of region name to list of country names, leaving out regions without countries in the data
+    """
+
+    groups = REGIONS if groups is None else groups
+    locations = data['location'].unique()
+    present = {str(name).lower(): str(name) for name in locations}
+
+    members = {}
+    if continents and 'continent' in data:
+        countries = data[['location', 'continent']].drop_duplicates().dropna()
+        for continent, names in countries.groupby('continent', observed=True)['location']:
+            members[str(continent)] = sorted(str(name) for name in names)
+    for region, names in groups.items():
+        names = sorted({present[n.lower()] for n in names if n.lower() in present})
+        if names:
+            members[region] = names
+
+    return members
+
+
+def add_regions(data, groups=None, continents=REGION_CONTINENTS):
+    """Adds the rows of the regions to the data. Rows already in the data for a location with the name of a region
+    (e.g. the aggregates published by OWID for the continents) are replaced, keeping their ISO code.
+
+    A region has a row for each day on which any of its countries has one. Daily counts are NaN where none of its
+    countries reports them, and countries which have not reported a total yet do not add to the total of the region.
+
+    :param data: pandas.DataFrame containing the columns in getdata.OWID_COLUMNS
+    :param groups: dictionary of region name to list of country names, default REGIONS
+    :param continents: boolean, default REGION_CONTINENTS
+    :return: pandas.DataFrame with the same columns and column types
+    """
+
+    members = region_members(data, groups, continents)
+    if not members:
+        return data
+
+    is_region = data['location'].isin(members).to_numpy()
+    countries = data[~is_region]
+
+    # Counts of each country in the order of the dates
+    codes, names = pd.factorize(countries['location'])
+    names = pd.Index(names.astype(str))
+    order = np.lexsort((countries['date'].to_numpy(), codes))
+    codes = codes[order]
+    counts = countries[SUM_COLUMNS].iloc[order].astype('float64')
+    counts[CUMULATIVE_COLUMNS] = counts[CUMULATIVE_COLUMNS].groupby(codes, sort=False).ffill()
+
+    # The rows of the countries of each region, so that all regions are summed by one groupby
+    regions = list(members)
+    rows = [np.flatnonzero(np.isin(codes, names.get_indexer(members[region]))) for region in regions]
+    region_codes = np.repeat(np.arange(len(regions)), [len(r) for r in rows])
+    rows = np.concatenate(rows)
+    dates = countries['date'].to_numpy()[order][rows]
+    sums = counts.iloc[rows].groupby([region_codes, dates]).sum(min_count=1)
+
+    # The population of a region is the total of the first population of each of its countries, as used by
+    # metrics.compute_metrics for the countries
+    first = np.flatnonzero(np.diff(codes, prepend=-1) != 0)
+    population = pd.Series(countries['population'].to_numpy(dtype='float64')[order][first], index=names[codes[first]])
+    populations = np.array([population[members[region]].sum() for region in regions])
+
+    iso_codes = {}
+    if 'iso_code' in data:
+        iso_codes = data.loc[is_region, ['location', 'iso_code']].dropna().drop_duplicates('location')
+        iso_codes = dict(zip(iso_codes['location'].astype(str), iso_codes['iso_code'].astype(str)))
+
+    region_codes = sums.index.get_level_values(0).to_numpy()
+    result = pd.DataFrame({'date': sums.index.get_level_values(1), **{c: sums[c].to_numpy() for c in SUM_COLUMNS}})
+    result['location'] = np.array(regions, dtype=object)[region_codes]
+    result['population'] = populations[region_codes]
+    if 'iso_code' in data:
+        result['iso_code'] = result['location'].map(iso_codes)
+    if 'continent' in data:
+        result['continent'] = np.nan
+
+    result = pd.concat([countries, result[data.columns.intersection(result.columns)]], ignore_index=True)
+    for c in data.columns:
+        if data[c].dtype != result[c].dtype:
+            result[c] = result[c].astype(data[c].dtype if data[c].dtype.name != 'category' else 'category')
+
+    return result
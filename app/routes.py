@@ -2,66 +2,618 @@
 
 Application routes for the different pages of the web application.
  - "/" Coronavirus Dashboard
+ - "/country/<country>" Coronavirus Dashboard for a single country
+ - "/compare?countries=..." Coronavirus Dashboard comparing any list of countries
+ - "/api/series" Daily series of one or more countries as JSON
+ - "/api/locations?q=..." Location names and ISO codes matching a search, for autocompletion
+ - "/live?countries=..." Coronavirus Dashboard updated in the browser, with "/api/layout" and "/api/delta"
+ - "/metrics" Timings and other metrics in Prometheus format
+ - "/healthz", "/readyz" Health and readiness checks (see warmup.py)
 
+Responses are compressed as accepted by the client (see compression.py). The dashboard pages and the API responses have
+ETags derived from the versions of the data, so that clients revalidating them get 304 until the data changes.
+
+The data modules (and with them pandas and Bokeh) are only imported when they are first used, so that a new worker
+answers health checks straight away.
 """
 
-from bokeh.embed import components
-from flask import render_template
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+import time
+
+from flask import abort, jsonify, render_template, request
 
 from app import app
-from app import getdata
-from app import graph
+from app import cache
+from app import compression
+from app import timing
+from app import warmup
+
+FRAGMENT_CACHE_BYTES = int(os.environ.get('FRAGMENT_CACHE_BYTES', 64 * 1024 * 1024))
+LAYOUT_CACHE_BYTES = int(os.environ.get('LAYOUT_CACHE_BYTES', 16 * 1024 * 1024))
+LAYOUT_MAX_AGE = int(os.environ.get('LAYOUT_MAX_AGE', 24 * 60 * 60))  # seconds browsers may cache the chart layouts
+LIVE_POLL_INTERVAL = float(os.environ.get('LIVE_POLL_INTERVAL', 5 * 60))  # seconds
+# Cache-Control of the dashboard pages: browsers revalidate them with their ETag, unless set e.g. to 'max-age=300'
+DASHBOARD_CACHE_CONTROL = os.environ.get('DASHBOARD_CACHE_CONTROL', 'no-cache')
+COMPARE_MAX_COUNTRIES = int(os.environ.get('COMPARE_MAX_COUNTRIES', 50))
+COMPARE_TIME_BUDGET = float(os.environ.get('COMPARE_TIME_BUDGET', 10))  # seconds
+COMPARE_WORKERS = int(os.environ.get('COMPARE_WORKERS', 8))
+LOCATIONS_LIMIT = int(os.environ.get('LOCATIONS_LIMIT', 10))  # default number of results of /api/locations
+LOCATIONS_MAX_LIMIT = int(os.environ.get('LOCATIONS_MAX_LIMIT', 500))
+
+# Countries shown on the start page
+DASHBOARD_COUNTRIES = ('Germany', 'Netherlands', 'Slovakia', 'United Kingdom')
+
+
+def _fragments_size(fragments):
+    script1, div1, script2, div2 = fragments
+    return len(script1) + len(script2) + sum(len(d) for d in div1.values()) + sum(len(d) for d in div2.values())
+
+
+# Rendered (script1, div1, script2, div2) of the dashboard, keyed by the country names and the versions of their data
+FRAGMENT_CACHE = cache.LRUCache(FRAGMENT_CACHE_BYTES, sizeof=_fragments_size, name='fragments')
+
+
+def _evict_fragments(data):
+    if data.changes is None:
+        FRAGMENT_CACHE.clear()
+    else:
+        # Only the dashboards showing a country whose data has changed are out of date
+        FRAGMENT_CACHE.evict(lambda key: any(c.lower() in data.changes for c in key[0]))
+
+
+# JSON of the chart layouts of the live dashboard and its ETag, keyed by the country names. The layouts do not contain
+# any data, so they stay valid when the data changes.
+LAYOUT_CACHE = cache.LRUCache(LAYOUT_CACHE_BYTES, sizeof=lambda value: len(value[0]), name='layouts')
+
+_getdata_module = None
+_getdata_lock = threading.Lock()
+
+
+def _getdata():
+    """Returns the getdata module, importing it on first use and registering the eviction of outdated dashboards
+    with its cache.
+
+    :return: module app.getdata
+    """
+
+    global _getdata_module
+
+    if _getdata_module is None:
+        with _getdata_lock:
+            if _getdata_module is None:
+                from app import getdata
+
+                getdata.OWID_CACHE.add_listener(_evict_fragments)
+                _getdata_module = getdata
+
+    return _getdata_module
+
+
+def get_owid_data():
+    """Returns the data from Our World In Data (see getdata.get_owid_data).
+
+    :return: getdata.OwidDataset
+    """
+
+    return _getdata().get_owid_data()
+
+
+# Shared by all requests, so that the number of threads preparing countries stays bounded
+COMPARE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=COMPARE_WORKERS, thread_name_prefix='compare')
+
+
+def _fragments_key(data, countries, date_range):
+    # Use the names from the data, so that e.g. '/country/denmark', '/country/DNK' and '/country/Denmark' share the
+    # same entry, and '/compare?countries=DNK,Denmark' graphs Denmark once
+    countries = tuple(dict.fromkeys(data.resolve(c) or c for c in countries))
+
+    return countries, tuple(data.location_versions.get(c.lower()) for c in countries), date_range
+
+
+def dashboard_fragments(data, countries, executor=None, timeout=None, date_range=None):
+    """Generates the scripts and divs of the dashboard graphs for the countries, or returns them from the cache if they
+    have already been generated for the same versions of the data of the countries.
+
+    :param data: getdata.OwidDataset containing data for the relevant countries
+    :param countries: countries to be graphed given as a list of strings
+    :param executor: concurrent.futures.Executor on which the countries are prepared in parallel, default None
+    :param timeout: maximum number of seconds for preparing the countries and building the graphs, default None.
+        concurrent.futures.TimeoutError is raised if the countries are not ready in time, or if it has passed before
+        the next graph or the components are started.
+    :param date_range: tuple of (first, last) date of the line charts, default None (see graph.make_graphs)
+    :return: tuple of (script1, div1, script2, div2) where
+        - script1, div1: components of the current cases and vaccinated graphs
+        - script2, div2: components of the cases, r-number, deaths and vaccinations graphs
+    """
+
+    key = _fragments_key(data, countries, date_range)
+    countries = key[0]
+
+    def render():
+        from bokeh.embed import components
+        from app import graph
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        my_countries = graph.get_countries(data, countries, executor=executor, timeout=timeout)
+        current_cases, vaccinated, cases, r_number, deaths, vaccinations = graph.make_graphs(
+            data, my_countries, date_range=date_range, deadline=deadline)
+
+        graph.check_deadline(deadline, 'components')
+        with timing.stage('components'):
+            plots1 = {'current_cases': current_cases, 'vaccinated': vaccinated}
+            script1, div1 = components(plots1)
+
+            plots2 = {'cases': cases, 'r_number': r_number, 'deaths': deaths, 'vaccinations': vaccinations}
+            script2, div2 = components(plots2)
+
+        return script1, div1, script2, div2
+
+    return FRAGMENT_CACHE.get_or_create(key, render)
+
+
+def _date_range():
+    """Returns the date range of the line charts given by the query parameters 'start' and 'end' (YYYY-MM-DD), e.g.
+    '/?start=2020-03-01' for the whole history. Responds with 400 if a date is invalid.
+
+    :return: tuple of (first, last) date as pandas.Timestamp or None, or None if neither is given
+    """
+
+    import pandas as pd
+
+    if not request.args.get('start') and not request.args.get('end'):
+        return None
+    try:
+        return tuple(pd.to_datetime(request.args[a], format='%Y-%m-%d') if request.args.get(a) else None
+                     for a in ('start', 'end'))
+    except ValueError:
+        abort(400, "Dates must be given as YYYY-MM-DD")
+
+
+def _render_dashboard(script1, div1, script2, div2):
+    with timing.stage('render_template'):
+        return render_template('dashboard.html', the_div1=div1, the_script1=script1, the_div2=div2,
+                               the_script2=script2)
+
+
+def _dashboard_response(data, countries, executor=None, timeout=None):
+    """Responds with the dashboard page for the countries and the date range given in the query (see _date_range),
+    or with 304 if the client already has the page for the current versions of the data of the countries.
+
+    :param data: getdata.OwidDataset
+    :param countries: countries to be graphed given as a list of strings
+    :param executor: see dashboard_fragments
+    :param timeout: see dashboard_fragments
+    :return: flask.Response
+    """
+
+    date_range = _date_range()
+    etag = hashlib.sha1(repr(_fragments_key(data, countries, date_range)).encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        script1, div1, script2, div2 = dashboard_fragments(data, countries, executor=executor, timeout=timeout,
+                                                           date_range=date_range)
+        response = app.make_response(_render_dashboard(script1, div1, script2, div2))
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = DASHBOARD_CACHE_CONTROL
+
+    return response
 
 
 @app.route("/")
 def covid():
-    """ Generates the relevant graphs based on OWID data and displays it in the template dashboard.html. Graphs
+    """ Generates the relevant graphs based on OWID data and displays it in the template dashboard.html. The line charts
+    show the last graph.CHART_DAYS days unless a date range is given with the query parameters 'start' and 'end'. Graphs
     generated for:
         - Germany
         - Netherlands
         - Slovakia
         - United Kingdom
-        - European Union
 
     :return: dashboard.html page with current data
     """
 
     # Prepare data
-    countries = ('Germany', 'Netherlands', 'Slovakia', 'United Kingdom')
-    data = getdata.import_owid_data()
+    data = get_owid_data()
 
-    current_cases, total_vaccinations, cases, r_number, deaths, vaccinations = graph.make_graphs(data, countries)
+    return _dashboard_response(data, DASHBOARD_COUNTRIES)
 
-    plots1 = {'current_cases': current_cases, 'total_vaccinations': total_vaccinations}
-    script1, div1 = components(plots1)
 
-    plots2 = {'cases': cases, 'r_number': r_number, 'deaths': deaths, 'vaccinations': vaccinations}
-    script2, div2 = components(plots2)
+@app.route("/country/<string:country>")
+def covid_by_country(country):
+    """ Generates the relevant graphs based on OWID data and displays it in the template dashboard.html. Graphs
+    generated for single specified country. The date range of the line charts can be given as for "/".
 
-    return render_template('dashboard.html', the_div1=div1, the_script1=script1, the_div2=div2, the_script2=script2)
+    :param country: name (case-insensitive) or ISO code of the country for which the charts should be constructed
+    :return: dashboard.html page with current data
+    """
 
+    # Prepare data
+    data = get_owid_data()
+    if country not in data:
+        abort(404, f"Unknown country: {country}")
 
-@app.route("/country/<string:country>")
-def covid_by_country(country):
+    return _dashboard_response(data, [country])
+
+
+@app.route("/compare")
+def covid_compare():
     """ Generates the relevant graphs based on OWID data and displays it in the template dashboard.html. Graphs
-    generated for single specified country.
+    generated for the countries given as comma separated list in the query parameter 'countries', e.g.
+    '/compare?countries=Denmark,Sweden,Norway'. The date range of the line charts can be given as for "/".
+
+    The countries are prepared in parallel and the graphs are built within COMPARE_TIME_BUDGET seconds, checked before
+    each graph, otherwise the request fails with 503 rather than tying up the worker.
 
-    :param country: country for which the charts should be constructed as a string
     :return: dashboard.html page with current data
     """
 
     # Prepare data
-    country = [country]
-    print(country)
-    print(type(country))
-    data = getdata.import_owid_data()
+    countries = list(dict.fromkeys(_split_arg('countries')))
+    if not countries:
+        abort(400, "No countries given")
+    if len(countries) > COMPARE_MAX_COUNTRIES:
+        abort(400, f"The maximum number of countries which can be compared is {COMPARE_MAX_COUNTRIES}")
+
+    data = get_owid_data()
+    unknown = [c for c in countries if c not in data]
+    if unknown:
+        abort(404, f"Unknown countries: {', '.join(unknown)}")
+
+    try:
+        return _dashboard_response(data, countries, executor=COMPARE_EXECUTOR, timeout=COMPARE_TIME_BUDGET)
+    except concurrent.futures.TimeoutError:
+        abort(503, "The graphs could not be prepared in time, please try again later")
+
+
+@app.route("/live")
+def covid_live():
+    """ Displays the dashboard for the countries given as comma separated list in the query parameter 'countries'
+    (default the countries of the start page) in the template live.html, which loads the charts from "/api/layout" and
+    then keeps their data up to date from "/api/delta". The layouts are cached by the browser, so that a refresh only
+    transfers the data which is new.
+
+    :return: live.html page
+    """
+
+    from app import graph
+
+    countries = list(dict.fromkeys(_split_arg('countries'))) or list(DASHBOARD_COUNTRIES)
+    if len(countries) > COMPARE_MAX_COUNTRIES:
+        abort(400, f"The maximum number of countries which can be compared is {COMPARE_MAX_COUNTRIES}")
+
+    data = get_owid_data()
+    unknown = [c for c in countries if c not in data]
+    if unknown:
+        abort(404, f"Unknown countries: {', '.join(unknown)}")
+
+    return render_template('live.html', countries=[data.resolve(c) for c in countries],
+                           poll_interval=LIVE_POLL_INTERVAL, chart_days=graph.CHART_DAYS)
+
+
+def _split_arg(name):
+    return [v.strip() for v in request.args.get(name, '').split(',') if v.strip()]
+
 
-    current_cases, vaccinated, cases, r_number, deaths, vaccinations = graph.make_graphs(data, country)
+def _api_error(status, message):
+    response = jsonify(error=message)
+    response.status_code = status
+    return response
 
-    plots1 = {'current_cases': current_cases, 'vaccinated': vaccinated}
-    script1, div1 = components(plots1)
 
-    plots2 = {'cases': cases, 'r_number': r_number, 'deaths': deaths, 'vaccinations': vaccinations}
-    script2, div2 = components(plots2)
+@app.route("/api/series")
+def api_series():
+    """ Returns daily series of graph.Country for one or more countries as JSON, in columnar form:
+        {"countries": {<country>: {"date": [...], <series>: [...], ...}, ...}, "versions": {<country>: <version>, ...}}
+    Missing values are given as null.
+
+    Query parameters:
+        - countries: comma separated country names (required, at most COMPARE_MAX_COUNTRIES)
+        - series: comma separated names from graph.COUNTRY_SERIES, default all
+        - start, end: first and last date to be included (YYYY-MM-DD), default all dates
+
+    The response has a strong ETag based on the versions of the data of the countries and the query, so that clients
+    polling with If-None-Match get an empty 304 response until the data of one of the countries changes.
+
+    :return: JSON response
+    """
+
+    import numpy as np
+    import pandas as pd
+    from app import graph
+
+    data = get_owid_data()
+    countries, error = _api_countries(data)
+    if error:
+        return error
+
+    names = _split_arg('series') or list(graph.COUNTRY_SERIES)
+    unknown = [n for n in names if n not in graph.COUNTRY_SERIES]
+    if unknown:
+        return _api_error(400, f"Unknown series: {', '.join(unknown)}")
+
+    try:
+        start = pd.to_datetime(request.args['start'], format='%Y-%m-%d') if request.args.get('start') else None
+        end = pd.to_datetime(request.args['end'], format='%Y-%m-%d') if request.args.get('end') else None
+    except ValueError:
+        return _api_error(400, "Dates must be given as YYYY-MM-DD")
+
+    versions = [data.location_versions[c.lower()] for c in countries]
+    etag = hashlib.sha1(repr((versions, countries, names, start, end)).encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        result = {}
+        for my_country in graph.get_countries(data, countries):
+            frame = pd.DataFrame({n: graph.COUNTRY_SERIES[n](my_country) for n in names})[start:end]
+            columns = {'date': frame.index.strftime('%Y-%m-%d').tolist()}
+            for n in names:
+                values = frame[n].to_numpy(dtype='float64').round(4)
+                columns[n] = np.where(np.isnan(values), None, values).tolist()
+            result[my_country.name] = columns
+        response = jsonify(countries=result, versions=dict(zip(countries, versions)))
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+
+    return response
+
+
+def _api_countries(data):
+    countries = _split_arg('countries')
+    if not countries:
+        return None, _api_error(400, "No countries given")
+    if len(countries) > COMPARE_MAX_COUNTRIES:
+        return None, _api_error(400, f"The maximum number of countries is {COMPARE_MAX_COUNTRIES}")
+    unknown = [c for c in countries if c not in data]
+    if unknown:
+        return None, _api_error(404, f"Unknown countries: {', '.join(unknown)}")
+
+    return list(dict.fromkeys(data.resolve(c) for c in countries)), None
+
+
+@app.route("/api/layout")
+def api_layout():
+    """ Returns the charts of the live dashboard for one or more countries (query parameter 'countries') as Bokeh JSON
+    items without data:
+        {"current_cases": <item>, "vaccinated": <item>, "cases": <item>, "r_number": <item>, "deaths": <item>,
+         "vaccinations": <item>}
+    The data sources of the charts are named as described for the live parameter of the graph functions in graph.py
+    and are filled from "/api/delta".
+
+    As the layouts do not change with the data, browsers may cache them for LAYOUT_MAX_AGE seconds.
+
+    :return: JSON response
+    """
+
+    from bokeh.embed import json_item
+    from app import graph
+
+    data = get_owid_data()
+    countries, error = _api_countries(data)
+    if error:
+        return error
+
+    def render():
+        plots = graph.make_graphs(data, countries, live=True)
+        names = ['current_cases', 'vaccinated', 'cases', 'r_number', 'deaths', 'vaccinations']
+        body = json.dumps({name: json_item(plot) for name, plot in zip(names, plots)})
+        return body, hashlib.sha1(body.encode()).hexdigest()
+
+    body, etag = LAYOUT_CACHE.get_or_create(tuple(countries), render)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={LAYOUT_MAX_AGE}'
+
+    return response
+
+
+@app.route("/api/delta")
+def api_delta():
+    """ Returns the data of the charts of the live dashboard (see "/api/layout") which is newer than the data the client
+    already has, as JSON:
+        {"series": {<series>: {<country>: {"x": [...], "y": [...]}, ...}, ...},
+         "latest": {"current_cases": {"countries": [...], "current_cases": [...]},
+                    "vaccinated": {"countries": [...], "vaccinated": [...], "fully_vaccinated": [...]}}}
+    where the series are those in graph.CHART_SERIES, x are dates in milliseconds since the epoch (as used by Bokeh) and
+    days without a value are left out.
+
+    Query parameters:
+        - countries: comma separated country names (required)
+        - since: only points after this time in milliseconds since the epoch are returned, default the last
+          graph.CHART_DAYS days
+
+    Values of days before 'since' which are revised later are not sent again, they are updated when the page is
+    reloaded. The response has an ETag like "/api/series".
+
+    :return: JSON response
+    """
+
+    import numpy as np
+    import pandas as pd
+    from app import graph
+
+    data = get_owid_data()
+    countries, error = _api_countries(data)
+    if error:
+        return error
+
+    try:
+        since = pd.Timestamp(int(request.args['since']), unit='ms') if request.args.get('since') else None
+    except ValueError:
+        return _api_error(400, "'since' must be given in milliseconds since the epoch")
+
+    versions = [data.location_versions[c.lower()] for c in countries]
+    etag = hashlib.sha1(repr((versions, countries, since)).encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        def values(x):
+            x = np.asarray(x, dtype='float64').round(4)
+            return np.where(np.isnan(x), None, x).tolist()
+
+        my_countries = graph.get_countries(data, countries)
+        series = {}
+        for name in graph.CHART_SERIES:
+            series[name] = {}
+            for my_country in my_countries:
+                s = graph.COUNTRY_SERIES[name](my_country)
+                s = s[-graph.CHART_DAYS:] if since is None else s[s.index > since]
+                s = s[s.notna()]
+                series[name][my_country.name] = {'x': (s.index.asi8 // 10 ** 6).tolist(), 'y': values(s.values)}
+
+        latest = {
+            'current_cases': {'countries': countries,
+                              'current_cases': values([c.current_cases_by_population for c in my_countries])},
+            'vaccinated': {'countries': countries,
+                           'vaccinated': values([c.total_vaccinated_by_population for c in my_countries]),
+                           'fully_vaccinated': values([c.total_fully_vaccinated_by_population for c in my_countries])}
+        }
+        response = jsonify(series=series, latest=latest)
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+
+    return response
+
+
+@app.route("/api/locations")
+def api_locations():
+    """ Returns the locations matching a search for autocompletion as JSON:
+        {"locations": [{"name": <name>, "iso_code": <ISO code or null>}, ...]}
+    ordered as described for locations.LocationIndex.search.
+
+    Query parameters:
+        - q: beginning of a name or ISO code, default '' for all locations
+        - limit: maximum number of locations, default LOCATIONS_LIMIT
+
+    The response has an ETag based on the version of the index and the query, which only changes when locations are
+    added to or removed from the data.
+
+    :return: JSON response
+    """
+
+    data = get_owid_data()
+
+    query = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', LOCATIONS_LIMIT))
+    except ValueError:
+        return _api_error(400, "'limit' must be an integer")
+    if not 0 < limit <= LOCATIONS_MAX_LIMIT:
+        return _api_error(400, f"'limit' must be between 1 and {LOCATIONS_MAX_LIMIT}")
+
+    etag = hashlib.sha1(repr((data.index.version, query, limit)).encode()).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        names = data.index.search(query, limit=limit) if query else data.index.names[:limit]
+        response = jsonify(locations=[{'name': n, 'iso_code': data.index.iso_codes.get(n)} for n in names])
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+
+    return response
+
+
+@app.route("/healthz")
+def healthz():
+    """ Health check, answered without touching the data so that it responds while the worker is starting.
+
+    :return: JSON response with 'status' and 'ready'
+    """
+
+    return jsonify(status='ok', ready=warmup.is_ready())
+
+
+@app.route("/readyz")
+def readyz():
+    """ Readiness check, answering 503 until the warmup has finished, or 200 if no warmup was started (see warmup.py).
+
+    :return: JSON response with 'ready' and 'time_to_ready' in seconds
+    """
+
+    ready = warmup.is_ready()
+    response = jsonify(ready=ready, time_to_ready=warmup.TIME_TO_READY)
+    if not ready:
+        response.status_code = 503
+
+    return response
+
+
+@app.before_request
+def wait_for_warmup():
+    """Starts the warmup on the first request of the worker unless WARMUP_ENABLED is 0, and lets requests arriving
+    during the warmup wait for it, except for the health and metrics checks.
+    """
+
+    if warmup.WARMUP_ENABLED:
+        warmup.start()
+    if request.endpoint not in ('healthz', 'readyz', 'prometheus_metrics', 'static'):
+        warmup.wait()
+
+
+app.after_request(compression.compress_response)
+
+
+@app.after_request
+def add_server_timing(response):
+    """Adds the durations of the stages of the request (see timing.stage) as Server-Timing header."""
+
+    if timing.TIMING_ENABLED:
+        header = timing.server_timing_header()
+        if header:
+            response.headers['Server-Timing'] = header
+
+    return response
+
+
+def _dataset_gauge(func):
+    def gauge():
+        data = None if _getdata_module is None else _getdata_module.OWID_CACHE.data
+        return None if data is None else func(data)
+    return gauge
+
+
+def _dataset_age():
+    loaded_at = None if _getdata_module is None else _getdata_module.OWID_CACHE.loaded_at
+    return None if loaded_at is None else time.time() - loaded_at
+
+
+def _cache_gauge(func):
+    def gauge():
+        # Every cache in cache.CACHES, including those of the modules which are only imported later (e.g. graph.py)
+        return {f'cache="{name}"{labels}': value for name, c in sorted(cache.CACHES.items())
+                for labels, value in func(c).items()}
+    return gauge
+
+
+timing.register_gauge('app_cache_hit_ratio', "Share of lookups answered from the cache",
+                      _cache_gauge(lambda c: {'': c.hit_ratio}))
+timing.register_gauge('app_cache_lookups', "Number of lookups in the cache",
+                      _cache_gauge(lambda c: {',result="hit"': c.hits, ',result="miss"': c.misses}))
+timing.register_gauge('app_cache_bytes', "Size of the values in the cache", _cache_gauge(lambda c: {'': c.bytes}))
+timing.register_gauge('app_dataset_age_seconds', "Time since the dataset was loaded", _dataset_age)
+timing.register_gauge('app_dataset_bytes', "Memory used by the dataset", _dataset_gauge(lambda d: d.memory_usage()))
+timing.register_gauge('app_dataset_rows', "Number of rows in the dataset", _dataset_gauge(len))
+timing.register_gauge('app_time_to_ready_seconds', "Time from the start of the process until the warmup finished",
+                      lambda: warmup.TIME_TO_READY)
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """ Returns the timings of the stages of loading data and rendering pages, the cache hit ratios and the age and size
+    of the dataset in the Prometheus text format.
+
+    :return: text response
+    """
 
-    return render_template('dashboard.html', the_div1=div1, the_script1=script1, the_div2=div2, the_script2=script2)
+    return app.response_class(timing.render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,224 @@
+""" shared.py
+
+Publishes the loaded dataset as memory-mapped NumPy files, so that all worker processes on a machine share one read-only
+copy of the data and the precomputed statistics instead of each holding their own.
+
+The files of each version are written to their own directory and the symlink 'current' is switched to it atomically,
+so readers always see a complete version. Mappings of a replaced version stay valid until the readers drop them.
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from app import getdata
+from app import locations
+from app import metrics
+
+FLOAT_COLUMNS = getdata.OWID_NUMERIC_COLUMNS
+
+
+def publish_dataset(dataset, directory):
+    """Writes a dataset to a new version directory and makes it the current version.
+
+    :param dataset: getdata.OwidDataset
+    :param directory: directory containing the versions
+    :return: string, path of the version directory
+    """
+
+    path = os.path.join(directory, dataset.version)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    os.makedirs(tmp_path, exist_ok=True)
+
+    arrays = {'date': dataset.data['date'].to_numpy(dtype='datetime64[ns]'), 'starts': dataset.starts,
+              'stops': dataset.stops}
+    for c in FLOAT_COLUMNS:
+        arrays[c] = dataset.data[c].to_numpy()
+    for c in metrics.SERIES:
+        arrays['metrics_' + c] = dataset.metrics[c].to_numpy()
+    for c in metrics.LATEST:
+        arrays['latest_' + c] = dataset.latest[c].to_numpy()
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), array)
+
+    if os.path.exists(path):
+        shutil.rmtree(tmp_path)  # unchanged since it was last published, only the metadata is renewed
+    else:
+        os.rename(tmp_path, path)
+
+    meta = {'version': dataset.version, 'names': list(dataset.latest.index), 'published_at': time.time(),
+            'location_versions': dataset.location_versions, 'labels': dataset.labels}
+    with open(os.path.join(path, 'meta.json.tmp'), 'w', encoding='utf_8') as f:
+        json.dump(meta, f)
+    os.replace(os.path.join(path, 'meta.json.tmp'), os.path.join(path, 'meta.json'))
+
+    # Switch the current version atomically, then remove all versions except the new and the replaced one
+    current = os.path.join(directory, 'current')
+    replaced = os.readlink(current) if os.path.islink(current) else None
+    os.symlink(dataset.version, current + '.tmp')
+    os.replace(current + '.tmp', current)
+
+    for name in os.listdir(directory):
+        if name not in (dataset.version, replaced, 'current', 'publish.lock') and '.tmp' not in name:
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    return path
+
+
+def current_version(directory):
+    """Returns the path and metadata of the current version.
+
+    :param directory: directory containing the versions
+    :return: tuple of (path, dictionary of metadata), or (None, None) if nothing has been published yet
+    """
+
+    current = os.path.join(directory, 'current')
+    if not os.path.islink(current):
+        return None, None
+
+    path = os.path.join(directory, os.readlink(current))
+    with open(os.path.join(path, 'meta.json'), encoding='utf_8') as f:
+        return path, json.load(f)
+
+
+class SharedDataset(getdata.OwidDataset):
+    """ A getdata.OwidDataset whose columns are read-only memory maps of a published version, so that the data is only
+    held once in memory however many processes use it. Looking up a location returns Series which are views of the
+    mapped files.
+    """
+
+    def __init__(self, path):
+        """Maps a published version of a dataset.
+
+        :param path: path of the version directory (see publish_dataset)
+        """
+
+        with open(os.path.join(path, 'meta.json'), encoding='utf_8') as f:
+            meta = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+        self.path = path
+        self.version = meta['version']
+        self.location_versions = meta['location_versions']
+        self.changes = None
+        self.starts = np.asarray(load('starts'))
+        self.stops = np.asarray(load('stops'))
+
+        self.locations = {name.lower(): name for name in meta['names']}
+        self._positions = {name.lower(): i for i, name in enumerate(meta['names'])}
+        self.labels = meta['labels']
+        self.index = locations.LocationIndex(meta['names'], self.labels.get('iso_code'))
+
+        self._dates = load('date')
+        self._columns = {c: load(c) for c in FLOAT_COLUMNS}
+        self._metrics = {c: load('metrics_' + c) for c in metrics.SERIES}
+        self.latest = pd.DataFrame({c: load('latest_' + c) for c in metrics.LATEST},
+                                   index=pd.Index(meta['names'], name='location'))
+
+    def __len__(self):
+        return len(self._dates)
+
+    def memory_usage(self):
+        """The size of the mapped files, which are shared with the other processes using the same version.
+
+        :return: integer, number of bytes
+        """
+
+        arrays = [self._dates, *self._columns.values(), *self._metrics.values()]
+
+        return int(sum(a.nbytes for a in arrays) + self.latest.memory_usage().sum())
+
+    @property
+    def data(self):
+        """The whole dataset as a pandas.DataFrame. This copies the mapped data, so it should only be used where the
+        table is needed as a whole.
+
+        :return: pandas.DataFrame
+        """
+
+        names = self.latest.index.to_numpy()
+        lengths = self.stops - self.starts
+        location = pd.Categorical.from_codes(np.repeat(np.arange(len(names)), lengths), names)
+        labels = {c: pd.Categorical(np.repeat(np.array([self.labels[c].get(n) for n in names], dtype=object), lengths))
+                  for c in self.labels}
+        data = pd.DataFrame({**labels, 'location': location, 'date': self._dates, **self._columns})
+        data.index = pd.DatetimeIndex(data['date'])
+
+        return data
+
+    @property
+    def metrics(self):
+        """The precomputed daily series as a pandas.DataFrame (see metrics.compute_metrics). This copies the mapped
+        data, so it should only be used where the table is needed as a whole.
+
+        :return: pandas.DataFrame
+        """
+
+        return pd.DataFrame(self._metrics, index=pd.DatetimeIndex(self._dates, name='date'))
+
+    def location_data(self, location):
+        """Returns the rows for a location as views of the mapped files.
+
+        :param location: name (case-insensitive) or ISO code of the location
+        :return: dictionary of pandas.Series indexed by date, for 'date' and the other columns in getdata.OWID_COLUMNS
+            except 'location'
+        """
+
+        rows = self._rows(location)
+        index = pd.DatetimeIndex(self._dates[rows], copy=False)
+        columns = {c: pd.Series(a[rows], index=index, name=c, copy=False) for c, a in self._columns.items()}
+
+        return {'date': pd.Series(index, index=index, name='date'), **columns}
+
+    def location_metrics(self, location):
+        """Returns the precomputed statistics for a location as views of the mapped files.
+
+        :param location: name (case-insensitive) or ISO code of the location
+        :return: tuple of
+            - dictionary of pandas.Series containing the daily series in metrics.SERIES, indexed by date
+            - pandas.Series containing the most recent values in metrics.LATEST
+        """
+
+        rows = self._rows(location)
+        index = pd.DatetimeIndex(self._dates[rows], copy=False)
+        series = {c: pd.Series(a[rows], index=index, name=c, copy=False) for c, a in self._metrics.items()}
+
+        return series, self.latest.iloc[self._position(location)]
+
+
+def load_shared_dataset(previous=None, directory=None, ttl=getdata.OWID_CACHE_TTL):
+    """Maps the current shared version of the dataset. If there is none, or it is older than the time-to-live, the data
+    is loaded (see getdata.load_owid_dataset) and published first. A file lock makes sure that only one process at a
+    time loads and publishes, the others wait and then map the new version.
+
+    :param previous: SharedDataset, default None
+        Previously mapped dataset, returned as it is if the current version has not changed
+    :param directory: directory containing the versions, default getdata.OWID_SHARED_DIR
+    :param ttl: float, default getdata.OWID_CACHE_TTL
+        Number of seconds after which a published version is replaced
+    :return: SharedDataset
+    """
+
+    directory = directory or getdata.OWID_SHARED_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    with open(os.path.join(directory, 'publish.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            path, meta = current_version(directory)
+            if meta is None or time.time() - meta['published_at'] >= ttl:
+                path = publish_dataset(getdata.load_owid_dataset(), directory)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    if getattr(previous, 'path', None) == path:
+        return previous
+
+    return SharedDataset(path)
@@ -0,0 +1,151 @@
+""" timing.py
+
+Measures how long each stage of loading the data and rendering a page takes. The durations of the stages of a request
+are sent in its Server-Timing header, and all durations are collected in histograms which are published in Prometheus
+format together with other gauges (see render_metrics).
+
+Set the environment variable TIMING_ENABLED to 0 to turn the measurements off, in which case stage() returns a shared
+no-op context manager.
+"""
+
+import contextlib
+import os
+import threading
+import time
+
+from flask import g, has_request_context
+
+TIMING_ENABLED = os.environ.get('TIMING_ENABLED', '1') != '0'
+
+# Upper bounds in seconds of the histogram buckets
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+_NULL_STAGE = contextlib.nullcontext()
+
+
+class Histogram:
+    """ A thread-safe histogram of durations with cumulative buckets, as used by Prometheus. """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Adds a value to the histogram.
+
+        :param value: float
+        """
+
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+
+HISTOGRAMS = {}
+_histograms_lock = threading.Lock()
+
+# Gauges collected when the metrics are rendered: name -> (help text, callable returning a value or a dictionary of
+# label values to values)
+GAUGES = {}
+
+
+def observe(name, seconds):
+    """Records the duration of a stage, in its histogram and (during a request) for the Server-Timing header.
+
+    :param name: name of the stage
+    :param seconds: duration in seconds
+    """
+
+    histogram = HISTOGRAMS.get(name)
+    if histogram is None:
+        with _histograms_lock:
+            histogram = HISTOGRAMS.setdefault(name, Histogram())
+    histogram.observe(seconds)
+
+    if has_request_context():
+        timings = g.setdefault('stage_timings', {})
+        timings[name] = timings.get(name, 0) + seconds
+
+
+@contextlib.contextmanager
+def _stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def stage(name):
+    """Context manager measuring the duration of a stage.
+
+        with timing.stage('components'):
+            ...
+
+    :param name: name of the stage
+    :return: context manager
+    """
+
+    if not TIMING_ENABLED:
+        return _NULL_STAGE
+
+    return _stage(name)
+
+
+def register_gauge(name, help_text, func):
+    """Registers a gauge which is read when the metrics are rendered.
+
+    :param name: name of the metric
+    :param help_text: description of the metric
+    :param func: callable returning the value (or None if not available), or a dictionary mapping label strings such
+        as 'cache="fragments"' to values
+    """
+
+    GAUGES[name] = (help_text, func)
+
+
+def server_timing_header():
+    """Returns the Server-Timing header value for the stages of the current request.
+
+    :return: string, or None if no stage was measured
+    """
+
+    timings = g.get('stage_timings')
+    if not timings:
+        return None
+
+    return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timings.items())
+
+
+def render_metrics():
+    """Renders the histograms of the stage durations and the gauges in the Prometheus text format.
+
+    :return: string
+    """
+
+    lines = ['# HELP app_stage_duration_seconds Duration of the stages of loading data and rendering pages',
+             '# TYPE app_stage_duration_seconds histogram']
+    for name, histogram in sorted(HISTOGRAMS.items()):
+        with histogram._lock:
+            counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+        for bound, bucket_count in zip(histogram.buckets, counts):
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'app_stage_duration_seconds_bucket{{stage="{name}",le="{le}"}} {bucket_count}')
+        lines.append(f'app_stage_duration_seconds_sum{{stage="{name}"}} {total}')
+        lines.append(f'app_stage_duration_seconds_count{{stage="{name}"}} {count}')
+
+    for name, (help_text, func) in sorted(GAUGES.items()):
+        value = func()
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        if isinstance(value, dict):
+            lines += [f'{name}{{{labels}}} {v}' for labels, v in value.items() if v is not None]
+        elif value is not None:
+            lines.append(f'{name} {value}')
+
+    return '\n'.join(lines) + '\n'
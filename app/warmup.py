@@ -0,0 +1,112 @@
+""" warmup.py
+
+Prepares a worker before it serves traffic: loads the dataset and renders the dashboard of the start page and of the
+popular countries in WARMUP_COUNTRIES, so that the first requests after a restart do not pay for the imports, the
+download and the computation.
+
+    from app import warmup
+    warmup.start()  # in a background thread, or warmup.run() to block until ready
+
+Unless WARMUP_ENABLED is 0, the app starts the warmup itself when a worker receives its first request, usually the first
+"/readyz" probe, so that it also warms up when served by gunicorn or "flask run" rather than by run.py. Until the warmup
+has finished, "/readyz" answers 503 so that load balancers hold traffic back, while "/healthz" answers immediately.
+Other requests wait up to WARMUP_TIMEOUT seconds for the warmup rather than repeating its work. Without a warmup,
+"/readyz" answers 200.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from app import timing
+
+# Comma separated countries rendered in addition to the start page, e.g. 'France,Italy,Spain'
+WARMUP_COUNTRIES = [c.strip() for c in os.environ.get('WARMUP_COUNTRIES', '').split(',') if c.strip()]
+WARMUP_TIMEOUT = float(os.environ.get('WARMUP_TIMEOUT', 60))  # seconds
+WARMUP_ENABLED = os.environ.get('WARMUP_ENABLED', '1') != '0'  # start the warmup on the first request of a worker
+
+# Start of the process, as close to it as the app can measure
+STARTED_AT = time.time()
+
+# Seconds from STARTED_AT until the warmup finished, None until then
+TIME_TO_READY = None
+
+READY = threading.Event()
+
+logger = logging.getLogger(__name__)
+
+_thread = None
+_lock = threading.Lock()
+
+
+def run(countries=None):
+    """Loads the dataset and renders the dashboards, then marks the worker as ready. A failure is logged and the worker
+    is marked as ready regardless, so that requests are served (and fail or retry) as without the warmup.
+
+    :param countries: countries whose dashboards are rendered in addition to the start page, default WARMUP_COUNTRIES
+    :return: float, seconds from the start of the process until ready
+    """
+
+    global TIME_TO_READY
+
+    from app import routes  # routes imports this module
+
+    countries = WARMUP_COUNTRIES if countries is None else countries
+    try:
+        with timing.stage('warmup'):
+            data = routes.get_owid_data()
+            routes.dashboard_fragments(data, routes.DASHBOARD_COUNTRIES)
+            for country in countries:
+                if country in data:
+                    routes.dashboard_fragments(data, [country])
+                else:
+                    logger.warning("Unknown warmup country %s", country)
+    except Exception:
+        logger.exception("Warmup failed")
+    finally:
+        TIME_TO_READY = time.time() - STARTED_AT
+        READY.set()
+
+    logger.info("Ready after %.2f seconds", TIME_TO_READY)
+
+    return TIME_TO_READY
+
+
+def start(countries=None):
+    """Runs the warmup in a background thread, once per process.
+
+    :param countries: see run
+    :return: threading.Thread
+    """
+
+    global _thread
+
+    with _lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run, args=(countries,), name='warmup', daemon=True)
+            _thread.start()
+
+    return _thread
+
+
+def wait(timeout=WARMUP_TIMEOUT):
+    """Waits for a started warmup to finish. Returns immediately if no warmup was started.
+
+    :param timeout: maximum number of seconds to wait
+    :return: boolean, True if the worker is ready or no warmup was started
+    """
+
+    if _thread is None:
+        return True
+
+    return READY.wait(timeout)
+
+
+def is_ready():
+    """Tells whether the worker is ready, without waiting.
+
+    :return: boolean, True if the warmup has finished or no warmup was started
+    """
+
+    return _thread is None or READY.is_set()
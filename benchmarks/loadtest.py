@@ -0,0 +1,424 @@
+""" loadtest.py
+
+Load test of the app under concurrent requests: a local stand-in for the OWID server serves generated data (see
+synthetic.py), the app is started with one or more worker processes which load the data from it (OWID_DATA_URL), and
+a mix of requests is sent to the workers in turn, as a load balancer would.
+
+    python -m benchmarks.loadtest                                            # 1 worker, default mix
+    python -m benchmarks.loadtest --workers 1,2,4 --concurrency 16 --duration 20
+    python -m benchmarks.loadtest --mix "/country/{country}=4" --mix "/compare?countries={country},{country}=1"
+    python -m benchmarks.loadtest --shared --save loadtest.json
+
+'{country}' in a path is replaced by one of --countries locations of the generated data, so each path of the mix stands
+for a set of pages. For each number of workers the report gives:
+    - first: the first request to each worker, which loads the data
+    - cold: each page requested once on each worker, so that every graph is rendered
+    - warm: the mix for --duration seconds on the same pages, served from the caches
+with the throughput, the latency percentiles per path and the memory of each worker after the warm phase (resident set
+size, and proportional set size which divides the pages shared between workers, e.g. the data mapped with --shared).
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import http.server
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from benchmarks.synthetic import LOCATIONS, write_owid_csv
+
+DEFAULT_MIX = [('/', 1.0), ('/country/{country}', 4.0)]
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _OwidHandler(http.server.BaseHTTPRequestHandler):
+    """ Serves the CSV file of the server, answering 304 to requests revalidating it with its ETag. """
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.send_header('ETag', server.etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(server.body)))
+        self.send_header('ETag', server.etag)
+        self.end_headers()
+        self.wfile.write(server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_owid_stub(path):
+    """Serves a CSV file over HTTP on a free local port in a background thread, in place of the OWID server.
+
+    :param path: path of the CSV file
+    :return: http.server.ThreadingHTTPServer with the 'url' of the file and the number of 'requests' served
+    """
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _OwidHandler)
+    with open(path, 'rb') as f:
+        server.body = f.read()
+    server.etag = '"' + hashlib.sha1(server.body).hexdigest() + '"'
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/owid-covid-data.csv'
+    server.requests = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name='owid-stub', daemon=True).start()
+
+    return server
+
+
+def serve_worker(port, warmup=False):
+    """Serves the app on a local port until the process is terminated. Runs in the worker processes started by
+    start_workers, with the environment set there.
+
+    :param port: integer
+    :param warmup: boolean, default False
+        If True, the worker warms up before serving as when started by run.py (see app/warmup.py)
+    """
+
+    import logging
+    from werkzeug.serving import make_server
+    from app import app
+    from app import warmup as app_warmup
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    app_warmup.WARMUP_ENABLED = warmup  # otherwise the first health check would warm up the cold workers
+    if warmup:
+        app_warmup.start()
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_workers(n_workers, env, warmup=False, timeout=120):
+    """Starts worker processes serving the app and waits until they answer their health check, or with warmup until
+    they are ready.
+
+    :param n_workers: number of processes
+    :param env: dictionary of environment variables of the processes, in addition to those of this process. '{worker}'
+        in a value is replaced by the number of the worker.
+    :param warmup: boolean, default False (see serve_worker)
+    :param timeout: maximum number of seconds to wait for a worker
+    :return: list of (subprocess.Popen, base URL) for each worker
+    """
+
+    workers = []
+    for i in range(n_workers):
+        port = _free_port()
+        worker_env = {**os.environ, **{k: v.format(worker=i) for k, v in env.items()}}
+        command = [sys.executable, '-m', 'benchmarks.loadtest', '--serve', str(port)] + (['--warmup'] if warmup else [])
+        workers.append((subprocess.Popen(command, cwd=REPO_DIR, env=worker_env), f'http://127.0.0.1:{port}'))
+
+    for process, url in workers:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with urllib.request.urlopen(url + ('/readyz' if warmup else '/healthz'), timeout=1):
+                    break
+            except (urllib.error.URLError, ConnectionError):
+                if process.poll() is not None or time.monotonic() > deadline:
+                    stop_workers(workers)
+                    raise RuntimeError(f"Worker {url} did not start")
+                time.sleep(0.05)
+
+    return workers
+
+
+def stop_workers(workers):
+    for process, _ in workers:
+        process.terminate()
+    for process, _ in workers:
+        process.wait()
+
+
+def worker_memory(pid):
+    """Returns the memory used by a process, as read from /proc (Linux only).
+
+    :param pid: process id
+    :return: dictionary with 'rss' and 'pss' in bytes, None where not available
+    """
+
+    memory = {'rss': None, 'pss': None}
+    for key, file_name, field in [('rss', 'status', 'VmRSS:'), ('pss', 'smaps_rollup', 'Pss:')]:
+        try:
+            with open(f'/proc/{pid}/{file_name}', encoding='ascii') as f:
+                for line in f:
+                    if line.startswith(field):
+                        memory[key] = int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+
+    return memory
+
+
+def fetch(url):
+    """Requests a URL.
+
+    :param url: string
+    :return: tuple of (seconds until the response was read, HTTP status or 0 if the request failed)
+    """
+
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(url, timeout=120) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except (urllib.error.URLError, ConnectionError, TimeoutError):
+        status = 0
+
+    return time.perf_counter() - start, status
+
+
+def expand_mix(mix, countries, n_countries, seed=0):
+    """Replaces '{country}' in the paths of the mix with locations, so that each path stands for a set of pages.
+
+    :param mix: list of (path, weight)
+    :param countries: names of the locations in the data
+    :param n_countries: number of pages for each path containing '{country}'
+    :param seed: seed of the choice of locations
+    :return: list of (path, page, weight of the page)
+    """
+
+    rng = random.Random(seed)
+    pages = []
+    for path, weight in mix:
+        if '{country}' not in path:
+            pages.append((path, path, weight))
+            continue
+        for _ in range(n_countries):
+            page = path
+            while '{country}' in page:
+                page = page.replace('{country}', urllib.parse.quote(rng.choice(countries)), 1)
+            pages.append((path, page, weight / n_countries))
+
+    return pages
+
+
+def run_requests(requests, concurrency):
+    """Sends requests from a pool of threads.
+
+    :param requests: iterable of (path, URL), consumed by the threads until it is exhausted
+    :param concurrency: number of requests in flight
+    :return: tuple of (list of (path, seconds, status), elapsed seconds)
+    """
+
+    requests = iter(requests)
+    lock = threading.Lock()
+    results = []
+
+    def client():
+        while True:
+            with lock:
+                request = next(requests, None)
+            if request is None:
+                return
+            seconds, status = fetch(request[1])
+            with lock:
+                results.append((request[0], seconds, status))
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(client) for _ in range(concurrency)]:
+            future.result()
+
+    return results, time.perf_counter() - start
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))] if values else None
+
+
+def summarize(results, elapsed):
+    """Summarizes the results of run_requests.
+
+    :param results: list of (path, seconds, status)
+    :param elapsed: seconds
+    :return: dictionary with the 'requests', 'errors' and 'throughput' (requests per second) of all requests, and for
+        each path ('paths') the 'requests', 'errors' and 'p50', 'p90', 'p99' and 'max' latency in seconds
+    """
+
+    paths = {}
+    for path in dict.fromkeys(r[0] for r in results):
+        seconds = [s for p, s, _ in results if p == path]
+        paths[path] = {'requests': len(seconds), 'errors': sum(1 for p, _, status in results
+                                                             if p == path and status not in (200, 304)),
+                       'p50': percentile(seconds, 50), 'p90': percentile(seconds, 90),
+                       'p99': percentile(seconds, 99), 'max': max(seconds)}
+
+    return {'requests': len(results), 'errors': sum(p['errors'] for p in paths.values()),
+            'throughput': len(results) / elapsed if elapsed else None, 'paths': paths}
+
+
+def run_load_test(n_workers, stub, mix, concurrency, duration, n_countries, countries, shared=False, warmup=False,
+                  seed=0):
+    """Starts the workers, runs the first, cold and warm phases against them and stops them again.
+
+    :param n_workers: number of worker processes
+    :param stub: server returned by start_owid_stub
+    :param mix: list of (path, weight)
+    :param concurrency: number of requests in flight
+    :param duration: seconds of the warm phase
+    :param n_countries: number of pages for each path containing '{country}'
+    :param countries: names of the locations in the data
+    :param shared: boolean, default False
+        If True, the workers share the data as memory-mapped files (see app/shared.py)
+    :param warmup: boolean, default False
+        If True, the workers warm up before the first phase (see serve_worker)
+    :param seed: seed of the choice of pages
+    :return: dictionary with the results of each phase (see summarize), the 'memory' of each worker (see
+        worker_memory) and the number of requests to the OWID stand-in ('owid_requests')
+    """
+
+    directory = tempfile.mkdtemp(prefix='covid-webapp-load-')
+    env = {'OWID_DATA_URL': stub.url, 'OWID_SNAPSHOT_DIR': os.path.join(directory, 'snapshot-{worker}'),
+           'OWID_CACHE_TTL': str(24 * 60 * 60)}
+    if shared:
+        env['OWID_SHARED_DIR'] = os.path.join(directory, 'shared')
+    owid_requests = stub.requests
+
+    workers = start_workers(n_workers, env, warmup)
+    try:
+        urls = [url for _, url in workers]
+        rng = random.Random(seed)
+        pages = expand_mix(mix, countries, n_countries, seed)
+        results = {}
+
+        # The first request to each worker loads the data (the workers start at the same time, as after a deploy).
+        # '/api/locations' renders no graphs, so that the pages are still cold afterwards.
+        results['first'] = summarize(*run_requests([('/api/locations', url + '/api/locations') for url in urls],
+                                                   n_workers))
+
+        cold = [(path, url + page) for url in urls for path, page, _ in pages]
+        rng.shuffle(cold)
+        results['cold'] = summarize(*run_requests(cold, concurrency))
+
+        deadline = time.monotonic() + duration
+        weights = [weight for _, _, weight in pages]
+
+        def warm():
+            i = 0
+            while time.monotonic() < deadline:
+                path, page, _ = rng.choices(pages, weights)[0]
+                yield path, urls[i % len(urls)] + page
+                i += 1
+
+        results['warm'] = summarize(*run_requests(warm(), concurrency))
+        results['memory'] = [worker_memory(process.pid) for process, _ in workers]
+        results['owid_requests'] = stub.requests - owid_requests
+    finally:
+        stop_workers(workers)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return results
+
+
+def _ms(seconds):
+    return f'{seconds * 1000:9.1f}' if seconds is not None else f'{"-":>9}'
+
+
+def _mb(n_bytes):
+    return f'{n_bytes / 2 ** 20:.0f}MB' if n_bytes is not None else '-'
+
+
+def print_report(n_workers, results, file=sys.stderr):
+    print(f"\n{n_workers} worker(s), {results['owid_requests']} request(s) to the OWID stand-in", file=file)
+    print(f"{'phase':<6} {'path':<40} {'requests':>8} {'errors':>6} {'req/s':>8} "
+          f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}", file=file)
+    for phase in ['first', 'cold', 'warm']:
+        summary = results[phase]
+        for path, p in summary['paths'].items():
+            print(f"{phase:<6} {path:<40} {p['requests']:>8} {p['errors']:>6} {summary['throughput']:8.1f} "
+                  f"{_ms(p['p50'])} {_ms(p['p90'])} {_ms(p['p99'])} {_ms(p['max'])}", file=file)
+    memory = ', '.join(f"{_mb(m['rss'])} RSS / {_mb(m['pss'])} PSS" for m in results['memory'])
+    print(f"memory per worker: {memory}", file=file)
+
+
+def _parse_mix(values):
+    mix = []
+    for value in values:
+        path, _, weight = value.rpartition('=')
+        mix.append((path, float(weight)))
+
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1],
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)  # runs a worker on this port (see serve_worker)
+    parser.add_argument('--workers', default='1', help="comma separated numbers of worker processes (default 1)")
+    parser.add_argument('--concurrency', type=int, default=8, help="number of requests in flight (default 8)")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of the warm phase (default 10)")
+    parser.add_argument('--mix', action='append', metavar='PATH=WEIGHT',
+                        help="path and weight of the requests, repeated for each path (default '/=1' and\n"
+                             "'/country/{country}=4')")
+    parser.add_argument('--countries', type=int, default=10,
+                        help="number of locations replacing {country} in each path (default 10)")
+    parser.add_argument('--locations', type=int, default=50, help="number of locations in the data (default 50)")
+    parser.add_argument('--days', type=int, default=600, help="number of days per location (default 600)")
+    parser.add_argument('--shared', action='store_true', help="share the data between the workers (OWID_SHARED_DIR)")
+    parser.add_argument('--warmup', action='store_true', help="let the workers warm up before serving (see warmup.py)")
+    parser.add_argument('--save', help="file to which the results are written")
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve_worker(args.serve, args.warmup)
+        return 0
+
+    directory = tempfile.mkdtemp(prefix='covid-webapp-load-')
+    try:
+        source = write_owid_csv(os.path.join(directory, 'owid-covid-data.csv'), n_locations=args.locations,
+                                n_days=args.days)
+        stub = start_owid_stub(source)
+        countries = list(LOCATIONS)[:args.locations]
+        countries += [f'Location {i + 1}' for i in range(args.locations - len(countries))]
+        mix = _parse_mix(args.mix) if args.mix else DEFAULT_MIX
+
+        # Keyed by the number of workers as a string, as in the saved JSON
+        results = {}
+        for n_workers in [int(n) for n in args.workers.split(',')]:
+            results[str(n_workers)] = run_load_test(n_workers, stub, mix, args.concurrency, args.duration,
+                                                    args.countries, countries, shared=args.shared, warmup=args.warmup)
+            print_report(n_workers, results[str(n_workers)])
+        stub.shutdown()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if args.save:
+        results['_scale'] = {'locations': args.locations, 'days': args.days, 'concurrency': args.concurrency,
+                             'duration': args.duration, 'mix': mix, 'shared': args.shared, 'warmup': args.warmup}
+        with open(args.save, 'w', encoding='utf_8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
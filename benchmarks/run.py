@@ -0,0 +1,253 @@
+""" run.py
+
+Benchmarks of the data loading, the Country statistics, the graph functions and the dashboard route, run offline against
+generated data (see synthetic.py).
+
+    python -m benchmarks.run                                  # run and print the results
+    python -m benchmarks.run --save benchmarks/baseline.json  # record a baseline
+    python -m benchmarks.run --compare benchmarks/baseline.json
+
+The benchmarks of reading the CSV file also report their peak memory, measured in a new process (Linux only).
+
+With --compare, benchmarks which are slower than the baseline by more than --tolerance are reported and the exit code
+is 1. Benchmarks which are not in the baseline are listed as such, and the baseline should be recorded again whenever
+benchmarks are added. Baselines are only comparable on the same machine and at the same scale.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import subprocess
+import time
+
+from benchmarks.synthetic import write_owid_csv
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+COUNTRIES = ['Germany', 'Netherlands', 'Slovakia', 'United Kingdom']
+
+METRICS = ['active_cases', 'cases_by_population', 'current_cases_by_population', 'deaths_by_population',
+           'vaccinations_by_population', 'total_vaccinations_by_population', 'total_vaccinated_by_population',
+           'total_fully_vaccinated_by_population']
+
+
+def timeit(func, repeat):
+    """Runs a function repeatedly.
+
+    :param func: callable without arguments
+    :param repeat: number of runs
+    :return: dictionary with the 'median' and 'min' run time in seconds
+    """
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    return {'median': statistics.median(times), 'min': min(times)}
+
+
+def peak_memory(expression, source):
+    """Evaluates an expression in a new process, so that the memory allocated by the CSV parser (which is not traced by
+    tracemalloc) is measured as well.
+
+    :param expression: string, evaluated with the module getdata and the path of the CSV file as source
+    :param source: path of the CSV file
+    :return: number of bytes by which the peak resident set size of the process grew during the evaluation (Linux
+        only)
+    """
+
+    # Resets the peak resident set size of the process to the current one after the imports (Linux only)
+    script = ("import sys\n"
+              "from app import getdata\n"
+              "def status(field):\n"
+              "    with open('/proc/self/status') as f:\n"
+              "        return next(int(line.split()[1]) * 1024 for line in f if line.startswith(field))\n"
+              "with open('/proc/self/clear_refs', 'w') as f:\n"
+              "    f.write('5')\n"
+              "before = status('VmRSS:')\n"
+              "result = eval(sys.argv[1], {'getdata': getdata, 'source': sys.argv[2]})\n"
+              "print(status('VmHWM:') - before)\n")
+    output = subprocess.run([sys.executable, '-c', script, expression, source], cwd=REPO_DIR, capture_output=True,
+                            text=True, check=True).stdout
+
+    return int(output)
+
+
+def run_benchmarks(n_locations, n_days, repeat):
+    """Runs all benchmarks on generated data.
+
+    :param n_locations: number of locations in the generated data
+    :param n_days: number of days per location in the generated data
+    :param repeat: number of runs of each benchmark
+    :return: dictionary of benchmark name to timings (see timeit)
+    """
+
+    directory = tempfile.mkdtemp(prefix='covid-webapp-bench-')
+    source = write_owid_csv(os.path.join(directory, 'owid-covid-data.csv'), n_locations=n_locations, n_days=n_days)
+
+    # Imported here so that the app uses the generated data
+    from app import getdata
+    getdata.OWID_DATA_URL = source
+    getdata.OWID_SNAPSHOT_DIR = os.path.join(directory, 'snapshot')
+
+    from bokeh.embed import components
+    from app import app, graph, regions, routes
+
+    results = {}
+
+    def bench(name, func, memory=None):
+        results[name] = timeit(func, repeat)
+        line = f"{name:<50} {results[name]['median'] * 1000:10.2f} ms"
+        if memory:
+            results[name]['peak_bytes'] = peak_memory(memory, source)
+            line += f" {results[name]['peak_bytes'] / 2 ** 20:8.1f} MB peak"
+        print(line, file=sys.stderr)
+
+    # Streaming only saves memory when the rows are filtered, e.g. to the countries of the start page with
+    # OWID_LOCATIONS
+    bench('import_owid_data', lambda: getdata.import_owid_data(source), memory='getdata.import_owid_data(source)')
+    bench('import_owid_data(compact)', lambda: getdata.import_owid_data(source, compact=True),
+          memory='getdata.import_owid_data(source, compact=True)')
+    bench('stream_owid_data', lambda: getdata.stream_owid_data(source), memory='getdata.stream_owid_data(source)')
+    bench('stream_owid_data(locations)', lambda: getdata.stream_owid_data(source, COUNTRIES),
+          memory=f'getdata.stream_owid_data(source, {COUNTRIES!r})')
+    bench('stream_owid_data(locations, 10000 rows)', lambda: getdata.stream_owid_data(source, COUNTRIES, 10000),
+          memory=f'getdata.stream_owid_data(source, {COUNTRIES!r}, 10000)')
+
+    data = getdata.import_owid_data(source)
+    compact = getdata.import_owid_data(source, compact=True)
+    bench('add_regions', lambda: regions.add_regions(compact))
+    bench('OwidDataset', lambda: getdata.OwidDataset(compact))
+    dataset = getdata.OwidDataset(compact)
+
+    # Refresh after a new day for every location, as OWID publishes it
+    previous = getdata.OwidDataset(compact[compact['date'] < compact['date'].max()])
+    bench('OwidDataset(previous)', lambda: getdata.OwidDataset(compact, previous))
+
+    bench('Country.__init__(DataFrame)', lambda: graph.Country(data, 'Germany'))
+    bench('Country.__init__(OwidDataset)', lambda: graph.Country(dataset, 'Germany'))
+
+    # Fresh objects, so that each statistic is computed rather than taken from the memo
+    for name in METRICS:
+        countries = [graph.Country(data, 'Germany') for _ in range(repeat)]
+        bench(f'Country.{name}', lambda: getattr(countries.pop(), name))
+    countries = [graph.Country(data, 'Germany') for _ in range(repeat)]
+    bench('Country.r_number', lambda: countries.pop().r_number(4, 7))
+
+    colours, colours2 = graph.get_palettes(len(COUNTRIES))
+    for name, func in [('graph_current_cases', lambda: graph.graph_current_cases(data, COUNTRIES, colours)),
+                       ('graph_vaccinated', lambda: graph.graph_vaccinated(data, COUNTRIES, colours, colours2)),
+                       ('graph_cases', lambda: graph.graph_cases(data, COUNTRIES, colours)),
+                       ('graph_r_number', lambda: graph.graph_r_number(data, COUNTRIES, colours)),
+                       ('graph_deaths', lambda: graph.graph_deaths(data, COUNTRIES, colours)),
+                       ('graph_vaccinations', lambda: graph.graph_vaccinations(data, COUNTRIES, colours))]:
+        bench(name, func)
+
+    bench('make_graphs(DataFrame)', lambda: graph.make_graphs(data, COUNTRIES))
+    bench('make_graphs(OwidDataset)', lambda: graph.make_graphs(dataset, COUNTRIES))
+
+    def full_history():
+        graph.SERIES_CACHE.clear()
+        graph.make_graphs(dataset, COUNTRIES, date_range=(None, None))
+
+    bench('make_graphs(full history)', full_history)
+    bench('make_graphs+components', lambda: components(graph.make_graphs(dataset, COUNTRIES)))
+
+    client = app.test_client()
+    client.get('/')  # loads the data
+
+    def cold():
+        routes.FRAGMENT_CACHE.clear()
+        assert client.get('/').status_code == 200
+
+    bench('GET / (uncached graphs)', cold)
+    bench('GET / (cached graphs)', lambda: client.get('/'))
+
+    # As many countries as /compare accepts. It answers 503 rather than 200 if the graphs are not built within
+    # COMPARE_TIME_BUDGET, which fails the benchmark
+    compared = ','.join(list(data['location'].unique())[:routes.COMPARE_MAX_COUNTRIES])
+
+    def cold_compare():
+        routes.FRAGMENT_CACHE.clear()
+        graph.SERIES_CACHE.clear()
+        assert client.get(f'/compare?countries={compared}').status_code == 200
+
+    bench(f'GET /compare ({routes.COMPARE_MAX_COUNTRIES} countries, uncached graphs)', cold_compare)
+
+    results['_scale'] = {'locations': n_locations, 'days': n_days, 'repeat': repeat}
+    shutil.rmtree(directory, ignore_errors=True)
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compares results with a baseline. Benchmarks missing from the baseline (e.g. added since it was recorded) are
+    reported, so that they are not silently left out.
+
+    :param results: dictionary returned by run_benchmarks
+    :param baseline: dictionary returned by run_benchmarks for the baseline
+    :param tolerance: float, share by which a benchmark may be slower than the baseline
+    :return: tuple of
+        - list of (name, baseline median, median) of the benchmarks which are too slow
+        - list of the names of the benchmarks which are not in the baseline
+    """
+
+    regressions = []
+    missing = []
+    for name, timing in results.items():
+        if name.startswith('_'):
+            continue
+        if name not in baseline:
+            print(f"{name:<50}    no baseline", file=sys.stderr)
+            missing.append(name)
+            continue
+        ratio = timing['median'] / baseline[name]['median']
+        print(f"{name:<50} {ratio:6.2f}x baseline", file=sys.stderr)
+        if ratio > 1 + tolerance:
+            regressions.append((name, baseline[name]['median'], timing['median']))
+
+    return regressions, missing
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1],
+                                     formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--locations', type=int, default=50, help="number of locations (default 50)")
+    parser.add_argument('--days', type=int, default=600, help="number of days per location (default 600)")
+    parser.add_argument('--repeat', type=int, default=5, help="number of runs of each benchmark (default 5)")
+    parser.add_argument('--save', help="file to which the results are written")
+    parser.add_argument('--compare', help="baseline file to compare the results with")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="share by which a benchmark may be slower than the baseline (default 0.25)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.locations, args.days, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf_8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, encoding='utf_8') as f:
+            baseline = json.load(f)
+        if baseline.get('_scale', {}).get('locations') != args.locations or \
+                baseline.get('_scale', {}).get('days') != args.days:
+            print("Warning: the baseline was recorded at a different scale", file=sys.stderr)
+        regressions, missing = compare(results, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.2f} ms -> {after * 1000:.2f} ms", file=sys.stderr)
+        if missing:
+            print(f"Warning: {len(missing)} benchmarks have no baseline, record it again with --save", file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
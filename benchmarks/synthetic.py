@@ -0,0 +1,95 @@
+""" synthetic.py
+
+Generates data in the shape of the Our World In Data coronavirus dataset, so that the app can be tested and benchmarked
+offline and at any scale.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Named locations come first, so that the usual countries are available at every scale
+LOCATIONS = {'Germany': ('DEU', 'Europe', 83.2e6), 'Netherlands': ('NLD', 'Europe', 17.4e6),
+             'Slovakia': ('SVK', 'Europe', 5.46e6), 'United Kingdom': ('GBR', 'Europe', 67.2e6),
+             'France': ('FRA', 'Europe', 67.4e6), 'Denmark': ('DNK', 'Europe', 5.8e6),
+             'United States': ('USA', 'North America', 331e6), 'Brazil': ('BRA', 'South America', 213e6),
+             'India': ('IND', 'Asia', 1380e6), 'South Africa': ('ZAF', 'Africa', 59.3e6),
+             'Australia': ('AUS', 'Oceania', 25.7e6), 'Japan': ('JPN', 'Asia', 126e6)}
+CONTINENTS = ['Africa', 'Asia', 'Europe', 'North America', 'Oceania', 'South America']
+
+
+def generate_owid_data(n_locations=len(LOCATIONS), n_days=500, start='2020-02-01', n_extra_columns=50, seed=0):
+    """Generates random data with the columns and quirks of the OWID data:
+        - daily cases and deaths following waves, with some missing days
+        - vaccination totals starting part way through the period, reported on some days only
+        - people (fully) vaccinated missing at the end and daily totals repeated at the end, so that the daily
+          vaccinations end in zeros (as handled by graph.Country.trunc_data)
+        - additional numeric columns which the app does not use
+
+    :param n_locations: integer, default the number of named LOCATIONS
+        Number of locations. Locations beyond the named ones are called 'Location 1', 'Location 2' ...
+    :param n_days: integer, default 500
+        Number of days per location
+    :param start: first date, default '2020-02-01'
+    :param n_extra_columns: integer, default 50
+        Number of unused columns
+    :param seed: integer, default 0
+        Seed of the random number generator, the same seed always gives the same data
+    :return: pandas.DataFrame
+        Sorted by location and date, with dates as strings as in the CSV file
+    """
+
+    rng = np.random.default_rng(seed)
+    names = list(LOCATIONS)[:n_locations] + [f'Location {i + 1}' for i in range(n_locations - len(LOCATIONS))]
+    dates = pd.date_range(start, periods=n_days).strftime('%Y-%m-%d')
+    days = np.arange(n_days)
+
+    frames = []
+    for i, name in enumerate(names):
+        iso_code, continent, population = LOCATIONS.get(
+            name, (f'L{i:03d}', CONTINENTS[i % len(CONTINENTS)], float(rng.integers(1e5, 1e8))))
+
+        # Waves of infections with noise, and deaths following the cases
+        rate = 1e-4 * (1 + np.sin(days / rng.uniform(40, 90) + rng.uniform(0, 2 * np.pi))) + 1e-6
+        new_cases = rng.poisson(rate * population).astype('float64')
+        new_deaths = rng.binomial(new_cases.astype('int64'), 0.01).astype('float64')
+        new_cases[rng.random(n_days) < 0.02] = np.nan
+
+        # Vaccinations start part way through and are not reported every day
+        vaccination_start = int(n_days * rng.uniform(0.4, 0.7))
+        daily = np.where(days >= vaccination_start, rng.uniform(0.001, 0.005) * population, 0)
+        total_vaccinations = np.cumsum(daily)
+        total_vaccinations[days < vaccination_start] = np.nan
+        total_vaccinations[(rng.random(n_days) < 0.3) & (days > vaccination_start)] = np.nan
+        n_repeated = int(rng.integers(0, 4))
+        if n_repeated:
+            total_vaccinations[-n_repeated:] = total_vaccinations[-n_repeated - 1]
+        people_vaccinated = np.minimum(total_vaccinations * 0.6, population * 0.9)
+        people_fully_vaccinated = np.minimum(total_vaccinations * 0.4, population * 0.8)
+        people_vaccinated[-int(rng.integers(1, 4)):] = np.nan
+        people_fully_vaccinated[-int(rng.integers(1, 4)):] = np.nan
+
+        frame = pd.DataFrame({'iso_code': iso_code, 'continent': continent, 'location': name, 'date': dates,
+                              'total_cases': np.nancumsum(new_cases), 'new_cases': new_cases,
+                              'total_deaths': np.nancumsum(new_deaths), 'new_deaths': new_deaths,
+                              'total_vaccinations': total_vaccinations, 'people_vaccinated': people_vaccinated,
+                              'people_fully_vaccinated': people_fully_vaccinated, 'population': population})
+        frames.append(frame)
+
+    data = pd.concat(frames, ignore_index=True)
+    extra = rng.random((len(data), n_extra_columns)).round(3)
+    extra = pd.DataFrame(extra, columns=[f'extra_{i + 1}' for i in range(n_extra_columns)])
+
+    return pd.concat([data, extra], axis=1)
+
+
+def write_owid_csv(path, **kwargs):
+    """Writes generated data (see generate_owid_data) to a CSV file in the format of OWID.
+
+    :param path: path of the CSV file
+    :param kwargs: arguments of generate_owid_data
+    :return: path of the CSV file
+    """
+
+    generate_owid_data(**kwargs).to_csv(path, index=False)
+
+    return path
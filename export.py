@@ -0,0 +1,33 @@
+""" export.py
+
+Renders the dashboards of the start page and of every location to static HTML (see app/export.py).
+
+    python export.py                              # export all pages to export/
+    python export.py --output /var/www/covid --workers 4
+    python export.py --countries Denmark,SWE --force
+"""
+
+import argparse
+import logging
+import sys
+
+from app import export
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--output', default=export.EXPORT_DIR, help=f"export directory (default {export.EXPORT_DIR})")
+    parser.add_argument('--countries',
+                        help="comma separated names or ISO codes of the locations to be exported (default all)")
+    parser.add_argument('--workers', type=int, help="number of processes (default the number of CPUs)")
+    parser.add_argument('--force', action='store_true', help="render all pages again, even if their data is unchanged")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    countries = [c.strip() for c in args.countries.split(',')] if args.countries else None
+    try:
+        result = export.export_all(args.output, countries=countries, workers=args.workers, force=args.force)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"{len(result['exported'])} pages exported, {len(result['skipped'])} unchanged, "
+          f"{len(result['failed'])} failed", file=sys.stderr)
+    sys.exit(1 if result['failed'] else 0)
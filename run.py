@@ -1,4 +1,12 @@
+import os
+
 from app import app
+from app import warmup
+
+DEBUG = True
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=8080, debug=True)
+    # With the reloader the app is served by a child process, which is the one to warm up
+    if not DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warmup.start()
+    app.run(host="127.0.0.1", port=8080, debug=DEBUG)
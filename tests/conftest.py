@@ -0,0 +1,22 @@
+""" Unless OWID_LIVE_TESTS is set, the tests run against generated data (see benchmarks/synthetic.py) instead of
+downloading the data from Our World In Data, so that they are fast and deterministic. The app does not warm up on the
+first request, so that the tests control the caches (see test_warmup.py).
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+import app.getdata as getdata
+import app.warmup as warmup
+from benchmarks.synthetic import write_owid_csv
+
+if not os.environ.get('OWID_LIVE_TESTS'):
+    _DIR = tempfile.mkdtemp(prefix='covid-webapp-tests-')
+    atexit.register(shutil.rmtree, _DIR, ignore_errors=True)
+
+    getdata.OWID_DATA_URL = write_owid_csv(os.path.join(_DIR, 'owid-covid-data.csv'), n_days=600)
+    getdata.OWID_SNAPSHOT_DIR = os.path.join(_DIR, 'snapshot')
+
+warmup.WARMUP_ENABLED = False
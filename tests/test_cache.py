@@ -0,0 +1,61 @@
+import app.cache as cache
+
+
+def test_lru_cache_hits_and_misses():
+    c = cache.LRUCache(100, sizeof=len)
+
+    assert(c.get('a') is None)
+    c.put('a', 'x' * 10)
+    assert(c.get('a') == 'x' * 10)
+
+    assert(c.hits == 1)
+    assert(c.misses == 1)
+    assert(c.hit_ratio == 0.5)
+
+
+def test_lru_cache_memory_bound():
+    c = cache.LRUCache(100, sizeof=len)
+
+    c.put('a', 'x' * 40)
+    c.put('b', 'x' * 40)
+    c.get('a')  # 'b' is now the least recently used value
+    c.put('c', 'x' * 40)
+
+    assert('a' in c and 'c' in c and 'b' not in c)
+    assert(c.bytes == 80)
+
+    c.put('d', 'x' * 101)  # too big to be stored
+    assert('d' not in c and len(c) == 2)
+
+
+def test_lru_cache_get_or_create():
+    c = cache.LRUCache(100, sizeof=len)
+    created = []
+
+    def create():
+        created.append(1)
+        return 'value'
+
+    assert(c.get_or_create('a', create) == 'value')
+    assert(c.get_or_create('a', create) == 'value')
+    assert(len(created) == 1)
+
+
+def test_lru_cache_evict():
+    c = cache.LRUCache(100, sizeof=len)
+    c.put(('a', 1), 'x')
+    c.put(('b', 1), 'x')
+    c.put(('a', 2), 'x')
+
+    c.evict(lambda key: key[1] != 2)
+
+    assert(list(c._entries) == [('a', 2)])
+    assert(c.bytes == 1)
+
+
+def test_lru_cache_registered_by_name():
+    c = cache.LRUCache(100, sizeof=len, name='test')
+    try:
+        assert(cache.CACHES['test'] is c)
+    finally:
+        del cache.CACHES['test']
@@ -0,0 +1,38 @@
+import gzip
+
+from app import app
+from app import compression
+
+CLIENT = app.test_client()
+
+
+def test_compress_gzip():
+    data = b'{"x": [1, 2, 3]}' * 100
+    assert(gzip.decompress(compression.compress(data, 'gzip')) == data)
+
+
+def test_dashboard_compressed_and_cached():
+    plain = CLIENT.get('/country/Slovakia')
+    assert('Content-Encoding' not in plain.headers)
+
+    response = CLIENT.get('/country/Slovakia', headers={'Accept-Encoding': 'gzip'})
+    assert(response.headers['Content-Encoding'] == 'gzip')
+    assert('Accept-Encoding' in response.headers['Vary'])
+    assert(len(response.data) < len(plain.data))
+    assert(gzip.decompress(response.data) == plain.data)
+
+    # The compressed page is taken from the cache until the data changes
+    hits = compression.COMPRESSED_CACHE.hits
+    CLIENT.get('/country/slovakia', headers={'Accept-Encoding': 'gzip'})
+    assert(compression.COMPRESSED_CACHE.hits == hits + 1)
+
+
+def test_dashboard_not_modified():
+    response = CLIENT.get('/country/Slovakia', headers={'Accept-Encoding': 'gzip'})
+    etag = response.headers['ETag']
+    assert(etag.startswith('W/'))
+    assert(response.headers['Cache-Control'] == 'no-cache')
+
+    response = CLIENT.get('/country/Slovakia', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert(response.status_code == 304)
+    assert(response.data == b'')
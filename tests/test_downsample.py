@@ -0,0 +1,19 @@
+import numpy as np
+
+from app import downsample
+
+
+def test_lttb():
+    x = np.arange(1000)
+    y = np.sin(x / 50.0)
+
+    selected = downsample.lttb(x, y, 100)
+
+    assert(len(selected) == 100)
+    assert(selected[0] == 0 and selected[-1] == 999)
+    assert((np.diff(selected) > 0).all())
+    assert(np.abs(y[selected]).max() > 0.99)  # the peaks are kept
+
+
+def test_lttb_short_series():
+    assert((downsample.lttb(np.arange(10), np.zeros(10), 600) == np.arange(10)).all())
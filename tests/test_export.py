@@ -0,0 +1,70 @@
+import gzip
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import export
+from app import getdata
+from app import routes
+
+
+def test_export_all(tmp_path):
+    directory = str(tmp_path)
+
+    result = export.export_all(directory, countries=['denmark'], workers=2)
+    assert(sorted(result['exported']) == ['country/Denmark', 'index'])
+    assert(result['skipped'] == [])
+
+    with open(os.path.join(directory, 'manifest.json'), encoding='utf_8') as f:
+        manifest = json.load(f)
+    file = manifest['country/Denmark']['file']
+    assert(file.startswith('country/Denmark.') and file.endswith('.html'))
+
+    with open(os.path.join(directory, 'country', 'Denmark.html'), 'rb') as f:
+        html = f.read()
+    with gzip.open(os.path.join(directory, 'country', 'Denmark.html.gz')) as f:
+        assert(f.read() == html)
+    assert(b'Coronavirus Dashboard' in html)
+
+    # Unchanged data is not rendered again, whether the location is given by name or ISO code
+    result = export.export_all(directory, countries=['DNK'], workers=2)
+    assert(result['exported'] == [])
+    assert(sorted(result['skipped']) == ['country/Denmark', 'index'])
+
+    # A new rendering replaces the previous files
+    export.export_all(directory, countries=['Denmark'], workers=2, force=True)
+    with open(os.path.join(directory, 'manifest.json'), encoding='utf_8') as f:
+        assert(json.load(f)['country/Denmark']['file'] != file)
+    assert(not os.path.exists(os.path.join(directory, file)))
+
+
+def test_export_all_failure(tmp_path, monkeypatch):
+    # A location without any counts or population, like 'International' in the OWID data, cannot be rendered
+    data = getdata.import_owid_data(getdata.OWID_DATA_URL, compact=True)
+    international = data[data['location'] == 'Denmark'].copy()
+    international['location'] = 'International'
+    international['iso_code'] = 'OWID_INT'
+    for column in getdata.OWID_COLUMNS:
+        if column in international and pd.api.types.is_float_dtype(international[column]):
+            international[column] = np.nan
+    dataset = getdata.OwidDataset(pd.concat([data, international]))
+    monkeypatch.setattr(routes, 'get_owid_data', lambda: dataset)
+    directory = str(tmp_path)
+
+    result = export.export_all(directory, countries=['Denmark', 'International'], workers=2)
+    assert(result['failed'] == ['country/International'])
+    assert(sorted(result['exported']) == ['country/Denmark', 'index'])
+
+    with open(os.path.join(directory, 'manifest.json'), encoding='utf_8') as f:
+        manifest = json.load(f)
+    assert(sorted(manifest) == ['country/Denmark', 'index'])
+    assert(os.path.exists(os.path.join(directory, manifest['country/Denmark']['file'])))
+
+
+def test_export_all_unknown(tmp_path):
+    with pytest.raises(ValueError, match='Atlantis'):
+        export.export_all(str(tmp_path), countries=['Denmark', 'Atlantis'])
+    assert(not os.path.exists(os.path.join(str(tmp_path), 'manifest.json')))
@@ -1,6 +1,14 @@
+import functools
+import http.server
+import json
+import os
+import threading
+import time
+
 import pandas as pd
 
 import app.getdata as getdata
+import app.metrics as metrics
 
 
 def test_import_owid_data():
@@ -11,3 +19,324 @@ def test_import_owid_data():
     for c in ['date', 'new_cases', 'new_deaths', 'total_vaccinations', 'people_vaccinated', 'people_fully_vaccinated',
               'population']:
         assert c in data.columns
+
+
+def test_data_cache_loads_once():
+
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return len(calls)
+
+    cache = getdata.DataCache(loader, ttl=None)
+
+    assert(cache.get() == 1)
+    assert(cache.get() == 1)
+    assert(cache.version == 1)
+    assert(len(calls) == 1)
+
+
+def test_data_cache_single_flight():
+
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(5)
+        return 'data'
+
+    cache = getdata.DataCache(loader, ttl=None)
+    threads = [threading.Thread(target=cache.get) for _ in range(8)]
+    for t in threads:
+        t.start()
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert(cache.get() == 'data')
+    assert(len(calls) == 1)
+
+
+def test_data_cache_serves_stale_while_refreshing():
+
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        if len(calls) > 1:
+            release.wait(5)
+        return len(calls)
+
+    cache = getdata.DataCache(loader, ttl=0)
+
+    assert(cache.get() == 1)
+    assert(cache.get() == 1)  # stale, so a refresh is started but the old snapshot is returned
+    assert(cache.get() == 1)
+    release.set()
+
+    for _ in range(100):
+        if cache.version == 2:
+            break
+        time.sleep(0.01)
+
+    assert(len(calls) == 2)
+    assert(cache.version == 2)
+
+
+def test_data_cache_incremental():
+
+    received = []
+    notified = []
+
+    def loader(previous):
+        received.append(previous)
+        return previous if previous == 'unchanged' else 'unchanged'
+
+    cache = getdata.DataCache(loader, ttl=None, incremental=True)
+    cache.add_listener(notified.append)
+
+    assert(cache.get() == 'unchanged')
+    assert(cache.refresh() == 'unchanged')
+    assert(received == [None, 'unchanged'])
+    assert(notified == ['unchanged'])  # listeners are not called again if the loader returns the previous data
+    assert(cache.version == 1)
+
+
+def _write_owid_csv(path, n_days=30):
+    dates = pd.date_range('2021-01-01', periods=n_days).strftime('%Y-%m-%d')
+    frames = []
+    for location, population in [('Germany', 83e6), ('Slovakia', 5.4e6)]:
+        frames.append(pd.DataFrame({'iso_code': location[:3].upper(), 'continent': 'Europe', 'location': location,
+                                    'date': dates, 'new_cases': 100.0, 'new_deaths': 1.0, 'total_vaccinations': 1000.0,
+                                    'people_vaccinated': 600.0, 'people_fully_vaccinated': 400.0,
+                                    'population': population, 'stringency_index': 50.0}))
+    pd.concat(frames).to_csv(path, index=False)
+
+
+def test_load_owid_snapshot_local_file(tmp_path, monkeypatch):
+
+    source = str(tmp_path / 'owid.csv')
+    _write_owid_csv(source)
+
+    data = getdata.load_owid_snapshot(source, str(tmp_path / 'snapshot'))
+    assert(list(data.columns) == getdata.OWID_COLUMNS)
+    assert(data['date'].dtype.kind == 'M')
+
+    # The unchanged source must be served from the snapshot without parsing the CSV again
+    def fail(*args, **kwargs):
+        raise AssertionError("CSV parsed although the source is unchanged")
+
+    monkeypatch.setattr(getdata.pd, 'read_csv', fail)
+    snapshot = getdata.load_owid_snapshot(source, str(tmp_path / 'snapshot'))
+    pd.testing.assert_frame_equal(data, snapshot)
+
+    monkeypatch.undo()
+    _write_owid_csv(source, n_days=31)
+    assert(len(getdata.load_owid_snapshot(source, str(tmp_path / 'snapshot'))) == 62)
+
+
+def test_load_owid_snapshot_old_columns(tmp_path):
+
+    source = str(tmp_path / 'owid.csv')
+    _write_owid_csv(source)
+    snapshot_dir = str(tmp_path / 'snapshot')
+    getdata.load_owid_snapshot(source, snapshot_dir)
+
+    # A snapshot taken before the ISO codes and continents were kept, whose source has not changed since
+    old_columns = [c for c in getdata.OWID_COLUMNS if c not in ('iso_code', 'continent')]
+    data_path = os.path.join(snapshot_dir, 'owid-covid-data.feather')
+    meta_path = os.path.join(snapshot_dir, 'owid-covid-data.json')
+    pd.read_feather(data_path)[old_columns].to_feather(data_path)
+    with open(meta_path, encoding='utf_8') as f:
+        meta = json.load(f)
+    del meta['columns']
+    with open(meta_path, 'w', encoding='utf_8') as f:
+        json.dump(meta, f)
+
+    data = getdata.load_owid_snapshot(source, snapshot_dir)
+    assert(list(data.columns) == getdata.OWID_COLUMNS)
+    assert(list(pd.read_feather(data_path).columns) == getdata.OWID_COLUMNS)
+
+
+def test_load_owid_snapshot_http(tmp_path, monkeypatch):
+
+    _write_owid_csv(str(tmp_path / 'owid.csv'))
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(tmp_path))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    source = f'http://127.0.0.1:{server.server_port}/owid.csv'
+
+    try:
+        data = getdata.load_owid_snapshot(source, str(tmp_path / 'snapshot'))
+        assert(len(data) == 60)
+
+        monkeypatch.setattr(getdata.pd, 'read_csv', None)  # a 304 response must not parse anything
+        snapshot = getdata.load_owid_snapshot(source, str(tmp_path / 'snapshot'))
+        pd.testing.assert_frame_equal(data, snapshot)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_import_owid_data_compact(tmp_path):
+
+    source = str(tmp_path / 'owid.csv')
+    _write_owid_csv(source)
+
+    full = getdata.import_owid_data(source)
+    data = getdata.import_owid_data(source, compact=True)
+
+    assert(list(data.columns) == getdata.OWID_COLUMNS)
+    assert(data['location'].dtype == 'category')
+    assert(data['new_cases'].dtype == 'float32')
+    assert(data['date'].dtype == 'datetime64[ns]')
+    assert((data['date'] == full['date']).all())
+    assert(data.memory_usage(deep=True).sum() < full[getdata.OWID_COLUMNS].memory_usage(deep=True).sum())
+
+
+def test_stream_owid_data(tmp_path):
+
+    source = str(tmp_path / 'owid.csv')
+    _write_owid_csv(source)
+
+    compact = getdata.import_owid_data(source, compact=True)
+    data = getdata.stream_owid_data(source, chunksize=7)  # locations span several chunks
+    pd.testing.assert_frame_equal(data, compact)
+
+    data = getdata.stream_owid_data(source, locations=['slovakia'], chunksize=7)
+    assert(list(data['location'].cat.categories) == ['Slovakia'])
+    expected = compact[compact['location'] == 'Slovakia'].drop(columns='location').reset_index(drop=True)
+    pd.testing.assert_frame_equal(data.drop(columns='location'), expected, check_categorical=False)
+
+
+def test_iter_owid_locations_before_end_of_file(tmp_path):
+
+    source = str(tmp_path / 'owid.csv')
+    _write_owid_csv(source, n_days=2000)
+
+    class CountingFile:
+        def __init__(self, f):
+            self.f = f
+            self.bytes_read = 0
+
+        def read(self, size=-1):
+            data = self.f.read(size)
+            self.bytes_read += len(data)
+            return data
+
+    with open(source, 'rb') as f:
+        body = CountingFile(f)
+        locations = getdata.iter_owid_locations(body, chunksize=100)
+        location, arrays = next(locations)
+        assert(location == 'Germany')
+        assert(len(arrays['date']) == 2000)
+        assert(arrays['new_cases'].dtype == 'float32')
+        assert(body.bytes_read < os.path.getsize(source))  # the first location is ready before the file is read
+        assert([location for location, _ in locations] == ['Slovakia'])
+
+
+def test_stream_owid_data_http(tmp_path):
+
+    _write_owid_csv(str(tmp_path / 'owid.csv'))
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(tmp_path))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        data = getdata.stream_owid_data(f'http://127.0.0.1:{server.server_port}/owid.csv', locations=['Germany'])
+        assert(len(data) == 30)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_profile_import(tmp_path):
+
+    source = str(tmp_path / 'owid.csv')
+    _write_owid_csv(source)
+
+    results = getdata.profile_import(source)
+
+    for mode in ['full', 'compact', 'stream']:
+        assert(results[mode]['seconds'] > 0)
+        assert(results[mode]['peak_bytes'] > 0)
+    assert(results['frame_bytes_saved'] > 0)
+
+
+def test_owid_dataset(tmp_path):
+
+    source = str(tmp_path / 'owid.csv')
+    _write_owid_csv(source)
+    data = getdata.import_owid_data(source, compact=True).sample(frac=1, random_state=0)
+
+    dataset = getdata.OwidDataset(data)
+
+    assert(len(dataset) == len(data))
+    assert('germany' in dataset and 'SLOVAKIA' in dataset and 'Atlantis' not in dataset)
+    assert(dataset.locations == {'germany': 'Germany', 'slovakia': 'Slovakia'})
+    assert(dataset.resolve('SLO') == 'Slovakia' and dataset.resolve('Atlantis') is None)
+
+    germany = dataset.location_data('GERMANY')
+    assert(len(germany) == 30)
+    assert((germany['location'] == 'Germany').all())
+    assert(germany.index.is_monotonic_increasing)
+    assert((germany.index == germany['date']).all())
+
+
+def test_owid_dataset_update(tmp_path):
+
+    source = str(tmp_path / 'owid.csv')
+    _write_owid_csv(source)
+    data = getdata.import_owid_data(source, compact=True)
+    previous = getdata.OwidDataset(data)
+
+    # One revised row for Germany and one new day for Slovakia
+    new_day = data[data['location'] == 'Slovakia'].tail(1).assign(date=pd.Timestamp('2021-01-31'))
+    new_data = pd.concat([data, new_day], ignore_index=True)
+    new_data.loc[(new_data['location'] == 'Germany') & (new_data['date'] == '2021-01-20'), 'new_cases'] = 500.0
+
+    dataset = getdata.OwidDataset(new_data, previous)
+    assert(dataset.changes == {'germany': pd.Timestamp('2021-01-20'), 'slovakia': pd.Timestamp('2021-01-31')})
+    assert(dataset.version != previous.version)
+    assert(dataset.location_versions['germany'] != previous.location_versions['germany'])
+
+    full = getdata.OwidDataset(new_data)
+    pd.testing.assert_frame_equal(dataset.metrics, full.metrics)
+    pd.testing.assert_frame_equal(dataset.latest, full.latest)
+
+    # Only Slovakia changed, so the statistics of Germany are copied
+    new_day_only = getdata.OwidDataset(pd.concat([data, new_day], ignore_index=True), previous)
+    assert(list(new_day_only.changes) == ['slovakia'])
+    pd.testing.assert_frame_equal(new_day_only.metrics, getdata.OwidDataset(new_day_only.data).metrics)
+
+    unchanged = getdata.OwidDataset(data, previous)
+    assert(unchanged.changes == {})
+    assert(unchanged.version == previous.version)
+    pd.testing.assert_frame_equal(unchanged.metrics, previous.metrics)
+
+
+def test_owid_dataset_update_computes_only_recent_rows(monkeypatch):
+
+    data = getdata.import_owid_data(compact=True)
+    previous = getdata.OwidDataset(data[data['date'] < data['date'].max()])
+
+    computed = []
+    compute_series = metrics.compute_series
+
+    def counting_compute_series(rows, *args, **kwargs):
+        computed.append(len(rows))
+        return compute_series(rows, *args, **kwargs)
+
+    monkeypatch.setattr(metrics, 'compute_series', counting_compute_series)
+
+    full = getdata.OwidDataset(data)
+    dataset = getdata.OwidDataset(data, previous)
+
+    # The new day is computed from a window of rows per location rather than from the whole history
+    assert(dataset.changes)
+    assert(computed[0] == len(data) and computed[1] < len(data) / 10)
+    pd.testing.assert_frame_equal(dataset.metrics, full.metrics)
+    pd.testing.assert_frame_equal(dataset.latest, full.latest)
@@ -1,3 +1,7 @@
+import concurrent.futures
+import time
+
+import pandas as pd
 import pytest
 from bokeh.palettes import Category10, Category20
 from bokeh.plotting import show
@@ -6,6 +10,7 @@ import app.graph as graph
 import app.getdata as getdata
 
 DATA = getdata.import_owid_data()
+DATASET = getdata.OwidDataset(DATA)
 
 COUNTRIES = ['Germany', 'Netherlands', 'Slovakia', 'United Kingdom']
 COLOURS1 = Category10[max(len(COUNTRIES), 3)]
@@ -21,6 +26,40 @@ def test_init_country():
         graph.Country(DATA, c)
 
 
+def test_init_country_from_dataset():
+    for c in COUNTRIES:
+        from_data = graph.Country(DATA, c)
+        from_dataset = graph.Country(DATASET, c.upper())
+        pd.testing.assert_series_equal(from_data.cases, from_dataset.cases)
+        pd.testing.assert_series_equal(from_data.vaccinations, from_dataset.vaccinations)
+        assert(from_data.population == from_dataset.population)
+
+
+def test_precomputed_statistics():
+    for c in COUNTRIES:
+        computed = graph.Country(DATA, c)
+        looked_up = graph.Country(DATASET, c)
+        for name in ['cases_by_population', 'deaths_by_population', 'active_cases', 'vaccinations_by_population']:
+            pd.testing.assert_series_equal(getattr(computed, name), getattr(looked_up, name), check_names=False)
+        pd.testing.assert_series_equal(computed.r_number(4, 7), looked_up.r_number(4, 7), check_names=False)
+        for name in ['current_cases_by_population', 'total_vaccinations_by_population',
+                     'total_vaccinated_by_population', 'total_fully_vaccinated_by_population']:
+            assert(getattr(computed, name) == pytest.approx(getattr(looked_up, name), rel=1e-6))
+
+
+def test_init_country_unknown():
+    with pytest.raises(KeyError):
+        graph.Country(DATASET, 'Atlantis')
+    with pytest.raises(KeyError):
+        graph.Country(DATA, 'Atlantis')
+
+
+def test_init_country_by_iso_code():
+    germany = graph.Country(DATASET, 'DEU')
+    pd.testing.assert_series_equal(germany.cases, graph.Country(DATASET, 'Germany').cases)
+    assert(germany.version == DATASET.location_versions['germany'])
+
+
 def test_r_number():
     germany = graph.Country(DATA, 'Germany')
     print(germany.r_number)
@@ -66,6 +105,51 @@ def test_total_fully_vaccinated_by_population():
     print(germany.total_fully_vaccinated_by_population)
 
 
+def test_memoized_statistics():
+    germany = graph.Country(DATASET, 'Germany')
+
+    assert(germany.cases_by_population is germany.cases_by_population)
+    assert(germany.r_number(4, 7) is germany.r_number(4, 7))
+    assert(germany.r_number(4, 7) is not germany.r_number(1, 1))
+
+    cases_by_population = germany.cases_by_population
+    germany.invalidate()
+    assert(germany.cases_by_population is not cases_by_population)
+    pd.testing.assert_series_equal(germany.cases_by_population, cases_by_population, check_names=False)
+
+
+def test_country_slots():
+    germany = graph.Country(DATASET, 'Germany')
+    assert(not hasattr(germany, '__dict__'))
+
+
+@pytest.mark.parametrize('values, expected', [([1, 2, 0, float('nan')], [1, 2]), ([1] + [0] * 8, [1, 0]),
+                                              ([0, float('nan')], []), ([], []), ([0, 1, 0], [0, 1])])
+def test_trunc_data(values, expected):
+    result = graph.Country.trunc_data(pd.Series(values, dtype='float64'))
+    assert(list(result) == expected)
+
+
+def test_country_from_dataset_cleaned_once(monkeypatch):
+    # The vaccinations of all locations were cleaned when the dataset was built, so nothing is computed per country
+    def fail(*args, **kwargs):
+        raise AssertionError("Series cleaned again for a country")
+
+    monkeypatch.setattr(pd.Series, 'interpolate', fail)
+    monkeypatch.setattr(graph.Country, 'trunc_data', fail)
+    for c in DATASET.locations.values():
+        graph.Country(DATASET, c)
+
+
+def test_cleaned_series_of_all_locations():
+    for c in DATASET.locations.values():
+        from_data = graph.Country(DATA, c)
+        from_dataset = graph.Country(DATASET, c)
+        pd.testing.assert_series_equal(from_data.vaccinations, from_dataset.vaccinations)
+        pd.testing.assert_series_equal(from_data.vaccinated, from_dataset.vaccinated)
+        pd.testing.assert_series_equal(from_data.fully_vaccinated, from_dataset.fully_vaccinated)
+
+
 # Test of graphing function
 @pytest.mark.parametrize('country', ['Germany', 'Netherlands', 'Slovakia', 'United Kingdom'])
 def test_graph_current_cases_country(country):
@@ -105,3 +189,75 @@ def test_graph_vaccinations():
 
 def test_make_graphs():
     graph.make_graphs(DATA, COUNTRIES)
+
+
+def test_make_graphs_dataset():
+    graph.make_graphs(DATASET, COUNTRIES)
+
+
+def test_make_graphs_live():
+    current_cases, vaccinated, cases, r_number, deaths, vaccinations = graph.make_graphs(DATASET, COUNTRIES, live=True)
+
+    assert(current_cases.select_one({'name': 'current_cases'}).data['current_cases'] == [0] * len(COUNTRIES))
+    for p, series in zip([cases, r_number, deaths, vaccinations], graph.CHART_SERIES):
+        for country in COUNTRIES:
+            assert(p.select_one({'name': f'{series}/{country}'}).data == {'x': [], 'y': []})
+
+
+def test_chart_series():
+    my_country = graph.Country(DATASET, 'Germany')
+
+    s = graph.chart_series(my_country, 'cases_by_population')
+    assert(len(s) == graph.CHART_DAYS)
+
+    s = graph.chart_series(my_country, 'cases_by_population', date_range=(None, None), resolution=100)
+    assert(len(s) == 100)
+    assert(s.index[-1] == my_country.cases_by_population.index[-1])
+
+    s = graph.chart_series(my_country, 'r_number', date_range=(pd.Timestamp('2021-01-01'), pd.Timestamp('2021-01-31')))
+    assert(len(s) == 31)
+
+    # Cached per version of the data of the country
+    hits = graph.SERIES_CACHE.hits
+    graph.chart_series(graph.Country(DATASET, 'germany'), 'cases_by_population', date_range=(None, None),
+                       resolution=100)
+    assert(graph.SERIES_CACHE.hits == hits + 1)
+
+
+def test_graph_functions_with_country_objects():
+    countries = graph.get_countries(DATASET, COUNTRIES)
+    graph.graph_current_cases(None, countries, COLOURS1)
+    graph.graph_vaccinated(None, countries, COLOURS1, COLOURS2)
+    graph.graph_cases(None, countries, COLOURS1)
+
+
+def test_make_graphs_builds_countries_once(monkeypatch):
+    built = []
+    init = graph.Country.__init__
+
+    def counting_init(self, covid_data, country_name):
+        built.append(country_name)
+        init(self, covid_data, country_name)
+
+    monkeypatch.setattr(graph.Country, '__init__', counting_init)
+    graph.make_graphs(DATASET, COUNTRIES)
+
+    assert(sorted(built) == sorted(COUNTRIES))
+
+
+@pytest.mark.parametrize('n', [1, 3, 10, 11, 50])
+def test_get_palettes(n):
+    colours, colours2 = graph.get_palettes(n)
+    assert(len(colours) == len(colours2) == n)
+    assert(len(set(colours)) == n)
+
+
+def test_get_countries_parallel():
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        countries = graph.get_countries(DATASET, COUNTRIES, executor=executor, timeout=10)
+    assert([c.name for c in countries] == COUNTRIES)
+
+
+def test_make_graphs_deadline():
+    with pytest.raises(concurrent.futures.TimeoutError):
+        graph.make_graphs(DATASET, COUNTRIES, deadline=time.monotonic() - 1)
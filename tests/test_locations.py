@@ -0,0 +1,55 @@
+import pytest
+
+from app import locations
+
+INDEX = locations.LocationIndex(['Germany', 'Slovakia', 'Slovenia', 'United Kingdom', 'United States',
+                                 "Cote d'Ivoire", 'Curacao', 'Europe'],
+                                iso_codes={'Germany': 'DEU', 'Slovakia': 'SVK', 'Slovenia': 'SVN',
+                                           'United Kingdom': 'GBR', 'United States': 'USA', 'Europe': float('nan')})
+
+
+@pytest.mark.parametrize('query, name', [('Germany', 'Germany'), ('germany', 'Germany'), ('DEU', 'Germany'),
+                                         ('deu', 'Germany'), ('united-kingdom', 'United Kingdom'),
+                                         ("Côte d'Ivoire", "Cote d'Ivoire"), ('cote divoire', "Cote d'Ivoire"),
+                                         ('Atlantis', None), ('', None)])
+def test_resolve(query, name):
+    assert(INDEX.resolve(query) == name)
+
+
+def test_contains():
+    assert('usa' in INDEX and 'Atlantis' not in INDEX)
+    assert(len(INDEX) == 8)
+
+
+def test_iso_codes_without_code():
+    # Aggregates such as 'Europe' have no ISO code in the data
+    assert('Europe' not in INDEX.iso_codes)
+    assert(INDEX.resolve('Europe') == 'Europe')
+
+
+def test_search_prefix():
+    assert(INDEX.search('slo') == ['Slovakia', 'Slovenia'])
+    assert(INDEX.search('United') == ['United Kingdom', 'United States'])
+    assert(INDEX.search('slo', limit=1) == ['Slovakia'])
+
+
+def test_search_iso_code_first():
+    assert(INDEX.search('USA')[0] == 'United States')
+
+
+def test_search_word():
+    assert(INDEX.search('kingdom') == ['United Kingdom'])
+
+
+def test_search_misspelt():
+    assert(INDEX.search('Slovaka') == ['Slovakia'])
+    assert(INDEX.search('Grmany') == ['Germany'])
+
+
+def test_search_empty():
+    assert(INDEX.search('') == [] and INDEX.search(' - ') == [])
+
+
+def test_version():
+    assert(INDEX.version == locations.LocationIndex(reversed(INDEX.names), INDEX.iso_codes).version)
+    assert(INDEX.version != locations.LocationIndex(INDEX.names[1:], INDEX.iso_codes).version)
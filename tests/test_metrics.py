@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import app.metrics as metrics
+
+VALUES = [np.nan, 1.0, np.nan, 3.0, 0.0, np.nan,  # first location
+          np.nan, np.nan,  # second location, only missing values
+          2.0, np.nan, 4.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]  # third location, more than 7 zeros at the end
+STARTS = np.array([0, 6, 8])
+STOPS = np.array([6, 8, 19])
+
+
+def _by_location(values):
+    return [pd.Series(values[start:stop]) for start, stop in zip(STARTS, STOPS)]
+
+
+def test_interpolate():
+    values = np.array(VALUES)
+    result = metrics.interpolate(values, STARTS, STOPS)
+
+    expected = pd.concat([s.interpolate(method='linear') for s in _by_location(values)]).to_numpy()
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_trailing_trim():
+    values = np.array(VALUES)
+    trimmed = metrics.trailing_trim(values, STARTS, STOPS)
+
+    for i, s in enumerate(_by_location(values)):
+        for _ in range(7):
+            if len(s) and (s.iloc[-1] == 0 or np.isnan(s.iloc[-1])):
+                s = s[:-1]
+        assert((~trimmed[STARTS[i]:STOPS[i]]).sum() == len(s))
+
+
+def test_clean_data():
+    data = pd.DataFrame({'total_vaccinations': VALUES, 'people_vaccinated': VALUES, 'people_fully_vaccinated': VALUES})
+    series, kept = metrics.clean_data(data, STARTS, STOPS)
+
+    expected = pd.concat([s.interpolate(method='linear').diff() for s in _by_location(np.array(VALUES))]).to_numpy()
+    np.testing.assert_array_equal(series['vaccinations'], expected)
+    np.testing.assert_array_equal(kept['vaccinations'], [5, 0, 4])
+    np.testing.assert_array_equal(kept['people_vaccinated'], [4, 0, 4])
+
+
+def test_last_valid():
+    values = np.array(VALUES)
+    result = metrics.last_valid(values, STARTS, STOPS)
+
+    np.testing.assert_array_equal(result, [0.0, np.nan, 0.0])
+
+
+def test_compute_metrics():
+    dates = pd.date_range('2021-01-01', periods=len(VALUES))
+    data = pd.DataFrame({'location': ['A'] * 6 + ['B'] * 2 + ['C'] * 11, 'new_cases': np.arange(len(VALUES)) % 5,
+                         'new_deaths': 1.0, 'total_vaccinations': VALUES, 'people_vaccinated': VALUES,
+                         'people_fully_vaccinated': VALUES, 'population': 1000.0}, index=dates)
+
+    series, latest = metrics.compute_metrics(data, STARTS, STOPS)
+
+    assert(list(series.columns) == metrics.SERIES)
+    assert(list(latest.columns) == metrics.LATEST)
+    assert(len(series) == len(data) and len(latest) == 3)
+
+    c = data['new_cases'][8:]
+    expected = c.rolling(7).sum() / (1000 / 100000)
+    np.testing.assert_allclose(series['cases_by_population'][8:], expected)
+    assert(latest['current_cases_by_population'][2] == pytest.approx(expected.iloc[-1]))
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+import app.getdata as getdata
+import app.graph as graph
+import app.regions as regions
+
+
+def _owid_data():
+    dates = pd.date_range('2021-01-01', periods=10)
+    frames = []
+    for location, continent, population, start in [('Germany', 'Europe', 80e6, 0), ('Slovakia', 'Europe', 5e6, 2),
+                                                   ('Japan', 'Asia', 120e6, 0)]:
+        frame = pd.DataFrame({'iso_code': location[:3].upper(), 'continent': continent, 'location': location,
+                              'date': dates[start:], 'new_cases': 100.0, 'new_deaths': 1.0,
+                              'total_vaccinations': np.nan, 'people_vaccinated': np.nan,
+                              'people_fully_vaccinated': np.nan, 'population': population})
+        frame['total_vaccinations'] = np.arange(len(frame)) * 1000.0
+        frames.append(frame)
+    # Aggregate published by OWID, which is replaced by the computed one
+    frames.append(frames[0].assign(iso_code='OWID_EUR', continent=np.nan, location='Europe', new_cases=1.0))
+    data = pd.concat(frames, ignore_index=True)
+    data.loc[(data['location'] == 'Slovakia') & (data['date'] == '2021-01-06'), 'total_vaccinations'] = np.nan
+
+    return data.astype({c: t for c, t in getdata.OWID_COMPACT_DTYPES.items() if c != 'date'})
+
+
+def test_region_members():
+    members = regions.region_members(_owid_data(), groups={'Group': ['germany', 'Atlantis'], 'Empty': ['Atlantis']})
+    assert(members == {'Asia': ['Japan'], 'Europe': ['Germany', 'Slovakia'], 'Group': ['Germany']})
+
+
+def test_add_regions():
+    data = _owid_data()
+    result = regions.add_regions(data, groups={'European Union': ['Germany', 'Slovakia']})
+
+    assert(list(result.dtypes.astype(str)) == list(data.dtypes.astype(str)))
+    assert(set(result['location']) == {'Germany', 'Slovakia', 'Japan', 'Europe', 'Asia', 'European Union'})
+
+    europe = result[result['location'] == 'Europe'].set_index('date')
+    assert(len(europe) == 10)
+    assert((europe['iso_code'] == 'OWID_EUR').all() and europe['continent'].isna().all())
+    assert((europe['population'] == 85e6).all())
+    assert(list(europe['new_cases']) == [100.0] * 2 + [200.0] * 8)
+
+    # The total of Slovakia is carried forward over the day it is missing
+    assert(europe.loc['2021-01-06', 'total_vaccinations'] == 5000.0 + 2000.0)
+
+    eu = result[result['location'] == 'European Union'].set_index('date')
+    pd.testing.assert_frame_equal(eu[regions.SUM_COLUMNS], europe[regions.SUM_COLUMNS])
+
+
+def test_add_regions_without_regions():
+    data = _owid_data()
+    assert(regions.add_regions(data, groups={}, continents=False) is data)
+
+
+def test_region_statistics_weighted_by_population():
+    dataset = getdata.OwidDataset(regions.add_regions(_owid_data(), groups={}))
+    germany, slovakia, europe = (graph.Country(dataset, c) for c in ['Germany', 'Slovakia', 'Europe'])
+
+    weighted = (germany.cases_by_population * 80 + slovakia.cases_by_population * 5) / 85
+    pd.testing.assert_series_equal(europe.cases_by_population['2021-01-09':], weighted['2021-01-09':],
+                                   check_names=False)
+
+
+def test_regions_updated_with_their_countries():
+    data = regions.add_regions(_owid_data(), groups={})
+    previous = getdata.OwidDataset(data)
+
+    new_data = _owid_data()
+    new_data.loc[(new_data['location'] == 'Slovakia') & (new_data['date'] == '2021-01-08'), 'new_cases'] = 500.0
+    dataset = getdata.OwidDataset(regions.add_regions(new_data, groups={}), previous)
+
+    assert(set(dataset.changes) == {'slovakia', 'europe'})
+    pd.testing.assert_frame_equal(dataset.metrics, getdata.OwidDataset(dataset.data).metrics)
+
+
+def test_regions_in_dataset():
+    dataset = getdata.load_owid_dataset()
+    assert('European Union' in dataset and 'Europe' in dataset)
+    assert(dataset.labels['continent']['Germany'] == 'Europe')
+    assert(graph.Country(dataset, 'European Union').population > graph.Country(dataset, 'Germany').population)
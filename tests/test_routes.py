@@ -0,0 +1,186 @@
+import time
+
+import pytest
+
+from app import app
+from app import routes
+
+CLIENT = app.test_client()
+
+
+def test_dashboard():
+    response = CLIENT.get('/')
+    assert(response.status_code == 200)
+
+
+def test_dashboard_country():
+    response = CLIENT.get('/country/germany')
+    assert(response.status_code == 200)
+
+
+def test_dashboard_country_iso_code():
+    assert(CLIENT.get('/country/DEU').status_code == 200)
+
+
+def test_dashboard_region():
+    assert(CLIENT.get('/country/European Union').status_code == 200)
+    assert(CLIENT.get('/compare?countries=Europe,Asia').status_code == 200)
+
+
+def test_dashboard_country_unknown():
+    assert(CLIENT.get('/country/Atlantis').status_code == 404)
+
+
+def test_dashboard_date_range():
+    assert(CLIENT.get('/country/germany?start=2020-03-01').status_code == 200)
+    assert(CLIENT.get('/country/germany?start=March').status_code == 400)
+
+
+def test_dashboard_fragments_cached():
+    CLIENT.get('/country/Slovakia')
+    hits = routes.FRAGMENT_CACHE.hits
+    CLIENT.get('/country/slovakia')
+    assert(routes.FRAGMENT_CACHE.hits == hits + 1)
+
+
+def test_api_series():
+    response = CLIENT.get('/api/series?countries=germany,Slovakia&series=cases_by_population,r_number'
+                          '&start=2021-01-01&end=2021-01-31')
+    assert(response.status_code == 200)
+
+    countries = response.get_json()['countries']
+    assert(set(countries) == {'Germany', 'Slovakia'})
+    assert(set(countries['Germany']) == {'date', 'cases_by_population', 'r_number'})
+    assert(countries['Germany']['date'][0] == '2021-01-01')
+    assert(len(countries['Germany']['date']) == len(countries['Germany']['r_number']) == 31)
+
+
+def test_api_series_not_modified():
+    response = CLIENT.get('/api/series?countries=germany')
+    etag = response.headers['ETag']
+
+    response = CLIENT.get('/api/series?countries=germany', headers={'If-None-Match': etag})
+    assert(response.status_code == 304)
+    assert(response.data == b'')
+
+
+@pytest.mark.parametrize('query, status', [('', 400), ('countries=Atlantis', 404), ('countries=Germany&series=x', 400),
+                                           ('countries=Germany&start=yesterday', 400),
+                                           ('countries=' + ','.join(['Germany'] * 51), 400)])
+def test_api_series_errors(query, status):
+    response = CLIENT.get('/api/series?' + query)
+    assert(response.status_code == status)
+
+
+def test_compare():
+    response = CLIENT.get('/compare?countries=Germany,slovakia,Netherlands')
+    assert(response.status_code == 200)
+
+
+@pytest.mark.parametrize('query, status', [('', 400), ('countries=Germany,Atlantis', 404),
+                                           ('countries=' + ','.join(f'Country{i}' for i in range(51)), 400)])
+def test_compare_errors(query, status):
+    response = CLIENT.get('/compare?' + query)
+    assert(response.status_code == status)
+
+
+def test_compare_time_budget(monkeypatch):
+    from app import graph
+
+    graph_cases = graph.graph_cases
+
+    def slow_graph_cases(*args, **kwargs):
+        time.sleep(0.3)
+        return graph_cases(*args, **kwargs)
+
+    # The budget runs out while the graphs are built, after the countries were prepared in time
+    monkeypatch.setattr(graph, 'graph_cases', slow_graph_cases)
+    monkeypatch.setattr(routes, 'COMPARE_TIME_BUDGET', 0.2)
+    routes.FRAGMENT_CACHE.clear()
+    assert(CLIENT.get('/compare?countries=Germany,Denmark').status_code == 503)
+
+
+def test_server_timing():
+    routes.FRAGMENT_CACHE.clear()
+    response = CLIENT.get('/country/Netherlands')
+
+    stages = [s.split(';')[0] for s in response.headers['Server-Timing'].split(', ')]
+    for stage in ['countries', 'graph_cases', 'components', 'render_template']:
+        assert(stage in stages)
+
+
+def test_metrics():
+    CLIENT.get('/')
+    response = CLIENT.get('/metrics')
+
+    assert(response.status_code == 200)
+    text = response.data.decode()
+    assert('app_stage_duration_seconds_count{stage="components"}' in text)
+    assert('app_dataset_bytes' in text)
+    assert('app_cache_hit_ratio{cache="fragments"}' in text)
+    assert('app_cache_bytes{cache="fragments"}' in text)
+    assert('app_cache_lookups{cache="fragments",result="miss"}' in text)
+    assert('app_cache_bytes{cache="layouts"}' in text)
+    assert('app_cache_bytes{cache="series"}' in text)
+    assert('app_cache_bytes{cache="compressed"}' in text)
+
+
+def test_live():
+    assert(CLIENT.get('/live?countries=germany,Denmark').status_code == 200)
+    assert(CLIENT.get('/live?countries=Atlantis').status_code == 404)
+
+
+def test_live_full_history(monkeypatch):
+    from app import graph
+
+    # With CHART_DAYS=0 the charts keep all points rather than rolling over to none
+    monkeypatch.setattr(graph, 'CHART_DAYS', 0)
+    response = CLIENT.get('/live?countries=germany')
+    assert(response.status_code == 200)
+    assert(b'const rollover = undefined;' in response.data)
+
+
+def test_api_layout():
+    response = CLIENT.get('/api/layout?countries=germany,Denmark')
+    assert(response.status_code == 200)
+    assert(sorted(response.get_json()) == ['cases', 'current_cases', 'deaths', 'r_number', 'vaccinated',
+                                           'vaccinations'])
+    assert('max-age' in response.headers['Cache-Control'])
+
+    response = CLIENT.get('/api/layout?countries=Germany,denmark', headers={'If-None-Match': response.headers['ETag']})
+    assert(response.status_code == 304)
+
+
+def test_api_delta():
+    response = CLIENT.get('/api/delta?countries=germany,Denmark')
+    assert(response.status_code == 200)
+    delta = response.get_json()
+    x = delta['series']['cases_by_population']['Germany']['x']
+    assert(0 < len(x) <= 60)
+    assert(delta['latest']['current_cases']['countries'] == ['Germany', 'Denmark'])
+
+    # Only the points after 'since' are returned
+    delta = CLIENT.get(f'/api/delta?countries=germany,Denmark&since={x[-3]}').get_json()
+    assert(delta['series']['cases_by_population']['Germany']['x'] == x[-2:])
+    delta = CLIENT.get(f'/api/delta?countries=germany&since={x[-1]}').get_json()
+    assert(delta['series']['cases_by_population']['Germany'] == {'x': [], 'y': []})
+
+    assert(CLIENT.get('/api/delta?countries=germany&since=yesterday').status_code == 400)
+
+
+def test_api_locations():
+    response = CLIENT.get('/api/locations?q=united')
+    assert(response.status_code == 200)
+    assert(response.get_json()['locations'] == [{'name': 'United Kingdom', 'iso_code': 'GBR'},
+                                                 {'name': 'United States', 'iso_code': 'USA'}])
+
+    assert(CLIENT.get('/api/locations?q=DEU').get_json()['locations'][0]['name'] == 'Germany')
+    assert(len(CLIENT.get('/api/locations?limit=3').get_json()['locations']) == 3)
+
+    etag = response.headers['ETag']
+    assert(CLIENT.get('/api/locations?q=united', headers={'If-None-Match': etag}).status_code == 304)
+
+
+@pytest.mark.parametrize('query', ['limit=x', 'limit=0', 'limit=100000'])
+def test_api_locations_errors(query):
+    assert(CLIENT.get('/api/locations?' + query).status_code == 400)
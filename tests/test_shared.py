@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import app.getdata as getdata
+import app.graph as graph
+import app.shared as shared
+
+DATASET = getdata.OwidDataset(getdata.import_owid_data(compact=True))
+
+COUNTRIES = ['Germany', 'Netherlands', 'Slovakia', 'United Kingdom']
+
+
+def test_publish_and_map(tmp_path):
+    path = shared.publish_dataset(DATASET, str(tmp_path))
+    dataset = shared.SharedDataset(path)
+
+    assert(dataset.version == DATASET.version)
+    assert(dataset.locations == DATASET.locations)
+    assert(len(dataset) == len(DATASET))
+    assert(isinstance(dataset._columns['new_cases'], np.memmap))
+    pd.testing.assert_frame_equal(dataset.latest, DATASET.latest)
+
+
+def test_country_from_shared_dataset(tmp_path):
+    dataset = shared.SharedDataset(shared.publish_dataset(DATASET, str(tmp_path)))
+
+    for c in COUNTRIES:
+        in_memory = graph.Country(DATASET, c)
+        mapped = graph.Country(dataset, c)
+        pd.testing.assert_series_equal(in_memory.cases, mapped.cases, check_names=False)
+        pd.testing.assert_series_equal(in_memory.vaccinations, mapped.vaccinations, check_names=False)
+        pd.testing.assert_series_equal(in_memory.cases_by_population, mapped.cases_by_population, check_names=False)
+        assert(in_memory.total_vaccinated_by_population == mapped.total_vaccinated_by_population)
+
+    graph.make_graphs(dataset, COUNTRIES)
+
+
+def test_load_shared_dataset(tmp_path, monkeypatch):
+    loads = []
+
+    def load_owid_dataset(previous=None):
+        loads.append(1)
+        return DATASET
+
+    monkeypatch.setattr(getdata, 'load_owid_dataset', load_owid_dataset)
+
+    dataset = shared.load_shared_dataset(directory=str(tmp_path), ttl=3600)
+    assert(shared.load_shared_dataset(dataset, directory=str(tmp_path), ttl=3600) is dataset)
+    assert(len(loads) == 1)
+
+    # Once the time-to-live has passed, the data is published again
+    dataset = shared.load_shared_dataset(dataset, directory=str(tmp_path), ttl=0)
+    assert(len(loads) == 2)
+    assert(os.readlink(str(tmp_path / 'current')) == DATASET.version)
@@ -0,0 +1,41 @@
+import app.timing as timing
+
+
+def test_stage():
+    with timing.stage('test_stage'):
+        pass
+
+    histogram = timing.HISTOGRAMS['test_stage']
+    assert(histogram.count >= 1)
+    assert(histogram.counts[-1] == histogram.count)  # every value is in the +Inf bucket
+
+
+def test_stage_disabled(monkeypatch):
+    monkeypatch.setattr(timing, 'TIMING_ENABLED', False)
+
+    with timing.stage('test_stage_disabled'):
+        pass
+
+    assert(timing.stage('test_stage_disabled') is timing.stage('other'))
+    assert('test_stage_disabled' not in timing.HISTOGRAMS)
+
+
+def test_histogram_buckets():
+    histogram = timing.Histogram(buckets=(0.1, 1, float('inf')))
+    for value in [0.05, 0.5, 5]:
+        histogram.observe(value)
+
+    assert(histogram.counts == [1, 2, 3])
+    assert(histogram.sum == 5.55)
+
+
+def test_render_metrics():
+    timing.observe('test_render', 0.002)
+    timing.register_gauge('test_gauge', "A test gauge", lambda: {'label="a"': 1, 'label="b"': None})
+
+    text = timing.render_metrics()
+
+    assert('app_stage_duration_seconds_bucket{stage="test_render",le="0.005"} 1' in text)
+    assert('app_stage_duration_seconds_count{stage="test_render"} 1' in text)
+    assert('test_gauge{label="a"} 1' in text)
+    assert('label="b"' not in text)
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import threading
+
+from app import app
+from app import routes
+from app import warmup
+
+CLIENT = app.test_client()
+
+
+def test_import_without_pandas_and_bokeh():
+    code = "import sys, app; print(sorted(m for m in ('pandas', 'bokeh') if m in sys.modules))"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True).stdout
+    assert(output.strip() == '[]')
+
+
+def test_run(monkeypatch):
+    monkeypatch.setattr(warmup, 'READY', threading.Event())
+    monkeypatch.setattr(warmup, '_thread', threading.current_thread())  # as if started
+    assert(CLIENT.get('/readyz').status_code == 503)
+    assert(CLIENT.get('/healthz').get_json() == {'status': 'ok', 'ready': False})
+
+    routes.FRAGMENT_CACHE.clear()
+    seconds = warmup.run(['Denmark', 'Atlantis'])
+
+    assert(seconds > 0)
+    assert(warmup.TIME_TO_READY == seconds)
+    assert(len(routes.FRAGMENT_CACHE) == 2)  # the start page and Denmark
+    response = CLIENT.get('/readyz')
+    assert(response.status_code == 200)
+    assert(response.get_json()['time_to_ready'] == seconds)
+
+    hits = routes.FRAGMENT_CACHE.hits
+    CLIENT.get('/')
+    assert(routes.FRAGMENT_CACHE.hits == hits + 1)
+
+
+def test_start_on_first_request(monkeypatch):
+    release = threading.Event()
+
+    def run(countries=None):
+        release.wait(10)
+        warmup.READY.set()
+
+    monkeypatch.setattr(warmup, 'READY', threading.Event())
+    monkeypatch.setattr(warmup, '_thread', None)
+    monkeypatch.setattr(warmup, 'WARMUP_ENABLED', True)
+    monkeypatch.setattr(warmup, 'run', run)
+
+    assert(CLIENT.get('/readyz').status_code == 503)
+    assert(warmup._thread is not None)
+
+    release.set()
+    warmup._thread.join(10)
+    assert(CLIENT.get('/readyz').status_code == 200)
+
+
+def test_readyz_without_warmup(monkeypatch):
+    monkeypatch.setattr(warmup, 'READY', threading.Event())
+    monkeypatch.setattr(warmup, '_thread', None)
+
+    response = CLIENT.get('/readyz')
+    assert(response.status_code == 200)
+    assert(response.get_json()['ready'])
+    assert(CLIENT.get('/healthz').get_json() == {'status': 'ok', 'ready': True})